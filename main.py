@@ -12,20 +12,30 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent / "src"))
 
 from aiogram import Bot, Dispatcher, types
-from aiogram.fsm.storage.memory import MemoryStorage
 
 from src.core.config import config
 from src.core.constants import PROJECT_NAME, VERSION, AUTHOR
+from src.core.state_backend import (
+    init_state_backend,
+    create_fsm_storage,
+    close_state_backend
+)
 from src.core.middleware import (
     HourlyLimitMiddleware, 
     LoggingMiddleware, 
-    AdminCheckMiddleware
+    AdminCheckMiddleware,
+    MetricsMiddleware
 )
+from src.core.metrics import start_metrics_server, stop_metrics_server
+from src.core.scheduler import scheduler
 from src.handlers.basic_commands import register_basic_commands
+from src.handlers.admin_commands import register_admin_commands
 from src.modules.load_media import register_load_message_handler
 from src.handlers.message_handlers import register_message_handlers
 from src.handlers.dev_commands import register_dev_commands
+from src.services.broadcast import broadcast_engine
 from src.services.context_service import initialize_rag_systems
+from src.services.reminders import reminder_planner
 
 logger = logging.getLogger(__name__)
 
@@ -63,13 +73,20 @@ class NDTPBot:
         try:
             logger.info(f"🚀 Инициализация {PROJECT_NAME} v{VERSION} by {AUTHOR}")
             
+            # Выбор хранилища состояния (Redis если доступен)
+            await init_state_backend()
+            
             # Создание экземпляров бота и диспетчера
             self.bot = Bot(token=config.bot_token)
-            storage = MemoryStorage()
+            storage = create_fsm_storage()
             self.dp = Dispatcher(storage=storage)
             
             logger.info("✅ Бот и диспетчер инициализированы")
             
+            # Бот для рассылки уведомлений о расписании
+            from src.handlers.notification_system import notification_system
+            notification_system.set_bot(self.bot)
+            
             # Настройка middleware
             await self._setup_middleware()
             
@@ -97,19 +114,29 @@ class NDTPBot:
         """Настройка middleware"""
         logger.info("🛡️ Настройка middleware...")
         
+        #Middleware для метрик задержек (весь апдейт целиком)
+        self.dp.update.outer_middleware(MetricsMiddleware())
+        
         #Middleware для логирования
         self.dp.message.middleware(LoggingMiddleware())
         self.dp.callback_query.middleware(LoggingMiddleware())
         
-        #Middleware для лимитов API
-        #limit_middleware = HourlyLimitMiddleware()
-        #self.dp.message.middleware(limit_middleware)
-        #self.dp.callback_query.middleware(limit_middleware)
+        #Middleware для лимитов API (консультанты не ограничиваются)
+        from src.handlers.operator_handler import operator_handler
+        limit_middleware = HourlyLimitMiddleware(
+            is_exempt=operator_handler.operator_manager.is_operator,
+            get_status=operator_handler.fetch_user_status,
+        )
+        self.dp.message.middleware(limit_middleware)
+        self.dp.callback_query.middleware(limit_middleware)
         
         #Middleware для проверки прав администратора
         self.dp.message.middleware(AdminCheckMiddleware())
         
-        logger.info(f"✅ Middleware настроен (лимит: {config.hourly_request_limit} запросов/час)")
+        logger.info(
+            f"✅ Middleware настроен (лимит: {config.hourly_request_limit} запросов к ИИ/час, "
+            f"{config.hourly_command_limit} команд/час)"
+        )
     
     async def _register_handlers(self) -> None:
         """Регистрация всех обработчиков"""
@@ -119,6 +146,7 @@ class NDTPBot:
         register_load_message_handler(self.dp)
 
         register_basic_commands(self.dp)
+        register_admin_commands(self.dp)
         # Регистрируем обработчики операторов ПЕРЕД основными
         self.register_operator_handlers()
         
@@ -174,6 +202,13 @@ class NDTPBot:
     
     async def _initialize_modules(self) -> None:
         """Инициализация дополнительных модулей"""
+        # Восстановление очереди консультантов из хранилища состояния
+        try:
+            from src.handlers.operator_handler import operator_handler
+            await operator_handler.restore_state(self.bot)
+        except Exception as e:
+            logger.error(f"⚠️ Ошибка восстановления состояния консультаций: {e}")
+        
         # Инициализация модуля брейншторма
         if config.enable_brainstorm:
             try:
@@ -226,29 +261,63 @@ class NDTPBot:
     
     async def _start_background_tasks(self) -> None:
         """Запуск фоновых задач"""
-        # Запуск цикла обновления расписания
-        if config.enable_documents:
-            try:
-                from src.services.parsers.schedule_parser import schedule_updater_loop
-                asyncio.create_task(schedule_updater_loop())
-                logger.info("✅ Фоновое обновление расписания запущено")
-            except Exception as e:
-                logger.error(f"⚠️ Ошибка запуска обновления расписания: {e}")
+        # HTTP эндпоинт метрик
+        if config.metrics_enabled:
+            await start_metrics_server(config.metrics_host, config.metrics_port)
+        
+        # Плановые задачи (обновление данных парсеров, напоминания)
+        self._register_jobs()
+        scheduler.start()
+        
+        # Рассылки, прерванные прошлой остановкой бота
+        broadcast_engine.resume_pending()
+        
+        # Напоминания о сроках приема заявок
+        if config.enable_calendar:
+            reminder_planner.start()
+    
+    def _register_jobs(self) -> None:
+        """Регистрация фоновых задач в планировщике"""
+        jitter = config.jobs_jitter_seconds
+        jobs = []
         
-        # Запуск цикла обновления документов
         if config.enable_documents:
+            from src.services.parsers.schedule_parser import scheduled_update_schedule
+            from src.services.parsers.documents_parser import scheduled_update_documents
+            from src.services.parsers.students_parser import scheduled_update_students
+            jobs += [
+                dict(name="schedule", func=scheduled_update_schedule, every=6 * 3600,
+                     run_on_start=True, timeout=300, description="Расписание смен"),
+                dict(name="documents", func=scheduled_update_documents, every=24 * 3600,
+                     timeout=300, description="Документы"),
+                dict(name="students", func=scheduled_update_students, every=24 * 3600,
+                     run_on_start=True, timeout=600, description="Список учащихся"),
+            ]
+        
+        if config.enable_lists:
+            from src.services.parsers.lists_parser import scheduled_update_lists
+            jobs.append(dict(
+                name="lists", func=scheduled_update_lists, every=config.lists_refresh_hours * 3600,
+                timeout=3600, description="PDF-списки участников",
+            ))
+        
+        for job in jobs:
             try:
-                from src.services.parsers.documents_parser import documents_updater_loop
-                asyncio.create_task(documents_updater_loop())
-                logger.info("✅ Фоновое обновление документов запущено")
+                scheduler.add_job(jitter=jitter, **job)
             except Exception as e:
-                logger.error(f"⚠️ Ошибка запуска обновления документов: {e}")
+                logger.error(f"⚠️ Ошибка регистрации задачи {job['name']}: {e}")
     
     async def shutdown(self) -> None:
         """Graceful shutdown бота"""
         logger.info("🛑 Начинаем graceful shutdown...")
         
         try:
+            # Плановые задачи и рассылки останавливаются до закрытия сессии
+            # бота (прогресс рассылок сохраняется и продолжится после запуска)
+            await scheduler.shutdown()
+            await reminder_planner.shutdown()
+            await broadcast_engine.shutdown()
+            
             if self.bot:
                 await self.bot.session.close()
                 logger.info("✅ Сессия бота закрыта")
@@ -267,7 +336,28 @@ class NDTPBot:
             # Очистка RAG систем
             logger.info("🧹 Очистка ресурсов RAG систем...")
             
-            # Дополнительная очистка может быть добавлена здесь
+            await stop_metrics_server()
+            
+            # Отмена фоновых обновлений данных парсеров
+            from src.services.refresh import background_refresher
+            await background_refresher.shutdown()
+            from src.services.crawler import crawler
+            await crawler.close()
+            
+            # Журнал подписок сворачивается в снимок
+            from src.services.subscriptions import subscription_store
+            subscription_store.close()
+            
+            # Остановка пула извлечения текста PDF
+            if config.enable_lists:
+                from src.services.parsers.lists_parser import shutdown_lists_parser
+                shutdown_lists_parser()
+            
+            # Закрытие хранилищ состояния
+            if self.dp:
+                await self.dp.storage.close()
+            await close_state_backend()
+            logger.info("✅ Хранилище состояния закрыто")
             
         except Exception as e:
             logger.error(f"⚠️ Ошибка очистки ресурсов: {e}")
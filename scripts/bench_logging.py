@@ -0,0 +1,154 @@
+"""
+Бенчмарк накладных расходов логирования на один запрос
+
+Сравнивает прежнюю схему (синхронный StreamHandler в файл, f-строки на INFO,
+каждая трассировка поиска) с конвейером src.core.log_pipeline (QueueHandler,
+ленивое форматирование, сэмплирование трассировок). Меряется время, которое
+запрос тратит в вызывающем потоке - т.е. в event loop бота.
+
+Запуск:
+    python scripts/bench_logging.py [--requests 2000] [--sample-rate 0.05]
+"""
+import argparse
+import logging
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.core.log_pipeline import configure_logging, start_request, stop_logging, trace_enabled  # noqa: E402
+
+QUERY = "Когда начинается смена по робототехнике и какие документы нужны для поступления?"
+KEYWORDS = ["смена", "робототехника", "документы", "поступление", "начинается", "расписание"]
+CONTEXT = "Информация о технопарке. " * 120
+MATCHES = [("Программа", f"Робототехника {i}", 0.42 + i / 100) for i in range(6)]
+
+
+def legacy_request(logger: logging.Logger, user_id: int) -> None:
+    """Логирование одного запроса в прежнем виде"""
+    state = None
+    print(f"Текущее состояние: {state}", file=sys.stderr)
+    logger.info(f"📨 Запрос от пользователя {user_id} (@user): '{QUERY[:100]}'")
+    logger.info(f"📝 Получено сообщение от пользователя {user_id}: '{QUERY}'")
+    logger.info(f"👤 Статус пользователя {user_id}: UserStatus:NORMAL")
+    logger.info(f"🤖 Пользователь {user_id} (@user) спрашивает: '{QUERY[:50]}...'")
+    logger.info(f"Получение контекста для запроса: '{QUERY}'")
+    logger.info(f"Поиск по запросу: '{QUERY}'")
+    for _ in range(len(MATCHES) + 1):
+        # _extract_keywords логировал три строки на каждый вызов
+        logger.info(f"Исходный текст: '{QUERY.lower()}'")
+        logger.info(f"Базовые ключевые слова: {KEYWORDS}")
+        logger.info(f"Расширенные ключевые слова: {list(set(KEYWORDS))}")
+    for kind, name, relevance in MATCHES:
+        logger.info(f"Найдена {kind.lower()} '{name}', релевантность: {relevance}")
+    logger.info(f"Найдено результатов: {len(MATCHES)}, возвращаем топ 3")
+    for i, (_, name, _) in enumerate(MATCHES[:3]):
+        logger.info(f"Обработка результата {i + 1}: {name}")
+    logger.info(f"Сформирован контекст длиной {len(CONTEXT)} символов")
+    logger.info(f"Получен контекст: {CONTEXT[:200]}...")
+    logger.info("🚀 Отправляем стриминговый запрос к DeepSeek API...")
+
+
+def pipeline_request(logger: logging.Logger, user_id: int, update_id: int) -> None:
+    """Логирование одного запроса через новый конвейер"""
+    start_request(f"{update_id:x}")
+    logger.info("📨 Запрос от пользователя %s (@%s): %r", user_id, "user", QUERY[:100])
+    logger.debug("📝 Получено сообщение от пользователя %s: %r", user_id, QUERY)
+    logger.info("🤖 Пользователь %s спрашивает: %.50r", user_id, QUERY)
+    if trace_enabled():
+        logger.info("Поиск по запросу: %r", QUERY)
+        for _ in range(len(MATCHES) + 1):
+            logger.info("Исходный текст: %r", QUERY.lower())
+            logger.info("Базовые ключевые слова: %s", KEYWORDS)
+            logger.info("Расширенные ключевые слова: %s", list(set(KEYWORDS)))
+        for kind, name, relevance in MATCHES:
+            logger.info("Найдена %s %r, релевантность: %.3f", kind.lower(), name, relevance)
+        logger.info("Получен контекст (%d символов): %.200s", len(CONTEXT), CONTEXT)
+    logger.debug("Сформирован контекст длиной %d символов", len(CONTEXT))
+
+
+def reset_root() -> None:
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+
+
+def bench_legacy(requests: int, log_dir: Path) -> float:
+    reset_root()
+    handler = logging.FileHandler(log_dir / "legacy.log", encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(name)s: %(message)s", "%H:%M:%S"))
+    logging.getLogger().addHandler(handler)
+    logging.getLogger().setLevel(logging.INFO)
+    logger = logging.getLogger("bench.legacy")
+
+    stderr, sys.stderr = sys.stderr, open(log_dir / "legacy.stderr", "w", encoding="utf-8")
+    try:
+        started = time.perf_counter()
+        for i in range(requests):
+            legacy_request(logger, 100000 + i)
+        elapsed = time.perf_counter() - started
+    finally:
+        sys.stderr.close()
+        sys.stderr = stderr
+    reset_root()
+    return elapsed
+
+
+def bench_pipeline(requests: int, log_dir: Path, sample_rate: float) -> tuple:
+    reset_root()
+    # Консольный вывод слушателя перенаправляем в файл, чтобы не мерить терминал
+    stdout, sys.stdout = sys.stdout, open(log_dir / "pipeline.stdout", "w", encoding="utf-8")
+    try:
+        configure_logging(level="INFO", log_file=log_dir / "bot.jsonl", trace_sample_rate=sample_rate)
+        logger = logging.getLogger("bench.pipeline")
+
+        started = time.perf_counter()
+        for i in range(requests):
+            pipeline_request(logger, 100000 + i, 500000 + i)
+        elapsed = time.perf_counter() - started
+
+        flush_started = time.perf_counter()
+        stop_logging()
+        flushed = time.perf_counter() - flush_started
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    reset_root()
+    return elapsed, flushed
+
+
+def count_lines(path: Path) -> int:
+    if not path.exists():
+        return 0
+    with open(path, encoding="utf-8") as f:
+        return sum(1 for _ in f)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Бенчмарк логирования на запрос")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--sample-rate", type=float, default=0.05)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        log_dir = Path(tmp)
+        legacy = bench_legacy(args.requests, log_dir)
+        pipeline, flushed = bench_pipeline(args.requests, log_dir, args.sample_rate)
+
+        legacy_lines = count_lines(log_dir / "legacy.log") + count_lines(log_dir / "legacy.stderr")
+        pipeline_lines = count_lines(log_dir / "bot.jsonl")
+
+    per_legacy = legacy / args.requests * 1e6
+    per_pipeline = pipeline / args.requests * 1e6
+    print(f"Запросов: {args.requests}, доля трассировок: {args.sample_rate}")
+    print(f"  было:  {per_legacy:8.1f} мкс/запрос в event loop, строк лога: {legacy_lines}")
+    print(f"  стало: {per_pipeline:8.1f} мкс/запрос в event loop, строк лога: {pipeline_lines}")
+    print(f"  дозапись очереди фоновым потоком при остановке: {flushed * 1000:.1f} мс")
+    print(f"  ускорение: x{per_legacy / per_pipeline:.1f}")
+
+
+if __name__ == "__main__":
+    main()
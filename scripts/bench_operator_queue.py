@@ -0,0 +1,160 @@
+"""
+Бенчмарк очереди ожидания консультанта в час пик приема заявок
+
+Моделирует поток событий при тысячах ожидающих пользователей: новые
+запросы, отмены, принятие запросов консультантами, запросы позиции (/status)
+и сообщения консультантов. Сравнивает прежнюю схему (словарь, пересортировка
+всей очереди при каждом принятии и отмене, поиск сессии консультанта
+перебором) с WaitQueue и SessionIndex из src.services.operator_routing.
+
+Запуск:
+    python scripts/bench_operator_queue.py [--waiting 5000] [--events 20000] [--operators 20]
+"""
+import argparse
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.services.operator_routing import SessionIndex, WaitQueue  # noqa: E402
+
+
+def generate_events(waiting: int, events: int, operators: int, seed: int):
+    """Сценарий: сначала наплыв запросов, затем смесь операций"""
+    rng = random.Random(seed)
+    script = [("arrive", user_id) for user_id in range(waiting)]
+    next_user = waiting
+    weights = [("arrive", 30), ("cancel", 10), ("accept", 15), ("end", 15), ("position", 20), ("operator_message", 10)]
+    kinds = [kind for kind, weight in weights for _ in range(weight)]
+    for _ in range(events):
+        kind = rng.choice(kinds)
+        if kind == "arrive":
+            script.append(("arrive", next_user))
+            next_user += 1
+        elif kind in ("accept", "end", "operator_message"):
+            script.append((kind, rng.randrange(operators)))
+        else:
+            script.append((kind, rng.randrange(next_user)))
+    return script
+
+
+class LegacyQueue:
+    """Прежняя схема OperatorHandler"""
+
+    def __init__(self):
+        self.waiting_queue = {}
+        self.active_sessions = {}
+        self.clock = datetime(2026, 6, 1, 9, 0)
+
+    def _reorder_queue(self):
+        sorted_queue = sorted(self.waiting_queue.items(), key=lambda x: x[1]["request_time"])
+        for i, (user_id, _) in enumerate(sorted_queue, 1):
+            self.waiting_queue[user_id]["queue_position"] = i
+
+    def arrive(self, user_id):
+        self.clock += timedelta(milliseconds=10)
+        self.waiting_queue[user_id] = {"request_time": self.clock, "queue_position": len(self.waiting_queue) + 1}
+
+    def cancel(self, user_id):
+        if self.waiting_queue.pop(user_id, None) is not None:
+            self._reorder_queue()
+
+    def accept(self, operator_id):
+        if not self.waiting_queue or any(s["operator_id"] == operator_id for s in self.active_sessions.values()):
+            return
+        user_id = min(self.waiting_queue, key=lambda u: self.waiting_queue[u]["request_time"])
+        self.waiting_queue.pop(user_id)
+        self.active_sessions[user_id] = {"operator_id": operator_id}
+        self._reorder_queue()
+
+    def end(self, operator_id):
+        for user_id, session in self.active_sessions.items():
+            if session["operator_id"] == operator_id:
+                del self.active_sessions[user_id]
+                return
+
+    def position(self, user_id):
+        request = self.waiting_queue.get(user_id)
+        return request["queue_position"] if request else None
+
+    def operator_message(self, operator_id):
+        for user_id, session in self.active_sessions.items():
+            if session["operator_id"] == operator_id:
+                return user_id
+        return None
+
+
+class IndexedQueue:
+    """WaitQueue + SessionIndex"""
+
+    def __init__(self):
+        self.waiting_queue = {}
+        self.queue_order = WaitQueue()
+        self.session_index = SessionIndex()
+
+    def arrive(self, user_id):
+        self.waiting_queue[user_id] = {"request_time": None}
+        self.queue_order.push(user_id)
+
+    def cancel(self, user_id):
+        if self.queue_order.remove(user_id):
+            self.waiting_queue.pop(user_id, None)
+
+    def accept(self, operator_id):
+        if self.session_index.load(operator_id):
+            return
+        user_id = self.queue_order.pop()
+        if user_id is not None:
+            self.waiting_queue.pop(user_id, None)
+            self.session_index.bind(operator_id, user_id)
+
+    def end(self, operator_id):
+        user_id = self.session_index.user_for(operator_id)
+        if user_id is not None:
+            self.session_index.unbind(user_id)
+
+    def position(self, user_id):
+        return self.queue_order.position(user_id)
+
+    def operator_message(self, operator_id):
+        return self.session_index.user_for(operator_id)
+
+
+def run(queue, script):
+    positions = []
+    started = time.perf_counter()
+    for kind, arg in script:
+        result = getattr(queue, kind)(arg)
+        if kind == "position":
+            positions.append(result)
+    return time.perf_counter() - started, positions
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--waiting", type=int, default=5000, help="пользователей в очереди на старте")
+    arg_parser.add_argument("--events", type=int, default=20000, help="событий после наплыва")
+    arg_parser.add_argument("--operators", type=int, default=20)
+    arg_parser.add_argument("--seed", type=int, default=1)
+    args = arg_parser.parse_args()
+
+    script = generate_events(args.waiting, args.events, args.operators, args.seed)
+    legacy_time, legacy_positions = run(LegacyQueue(), script)
+    indexed_time, indexed_positions = run(IndexedQueue(), script)
+
+    if legacy_positions != indexed_positions:
+        raise SystemExit("❌ Позиции в очереди расходятся с прежней схемой")
+
+    total = len(script)
+    print(f"Событий: {total} (очередь на старте: {args.waiting}, консультантов: {args.operators})")
+    print(f"{'схема':<28} {'всего, мс':>10} {'мкс/событие':>12}")
+    print(f"{'прежняя (dict + sort)':<28} {legacy_time * 1000:>10.1f} {legacy_time / total * 1e6:>12.1f}")
+    print(f"{'WaitQueue + SessionIndex':<28} {indexed_time * 1000:>10.1f} {indexed_time / total * 1e6:>12.1f}")
+    print(f"Ускорение: x{legacy_time / indexed_time:.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Бенчмарк разбора страниц со списками учащихся
+
+Сравнивает прежний разбор (html.parser, отдельные проходы по параграфам,
+div'ам и find_all_next от каждого заголовка направления) с текущим
+StudentsParser.parse_students_list (lxml, один проход по документу,
+дедупликация через множество).
+
+Страницы берутся из каталога сохранённых HTML (--fixtures). Сохранить
+живые страницы сайта: --save DIR. Без --fixtures страницы генерируются.
+
+Запуск:
+    python scripts/bench_students_parser.py [--fixtures DIR] [--save DIR] [--repeat 5]
+"""
+import argparse
+import asyncio
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bs4 import BeautifulSoup  # noqa: E402
+
+from src.services.crawler import HTML_PARSER  # noqa: E402
+from src.services.parsers.students_parser import StudentsParser  # noqa: E402
+
+LAST_NAMES = ["Иванов", "Коваленко", "Полупанова", "Хаджинов", "Самосюк", "Ермакович", "Кабась", "Русак"]
+FIRST_NAMES = ["Артём", "Ксения", "Денис", "Александр", "Анна", "Диана", "Максим", "Лилия"]
+
+
+def generate_page(directions: int = 15, students: int = 80) -> str:
+    """Синтетическая страница: меню, таблицы и направления с ФИО в параграфах"""
+    parts = ["<html><body><div class='menu'><ul>"]
+    parts += [f"<li><a href='/p{i}'>Пункт меню {i}</a></li>" for i in range(60)]
+    parts.append("</ul></div><div class='content'>")
+    for d, direction in enumerate(StudentsParser.EDUCATIONAL_DIRECTIONS[:directions]):
+        parts.append(f"<h3>Образовательное направление «{direction}»</h3>")
+        if d % 3 == 0:
+            parts.append("<table><tr><th>№</th><th>ФИО</th><th>Учреждение образования</th></tr>")
+            for i in range(students):
+                name = f"{LAST_NAMES[i % 8]} {FIRST_NAMES[(i + d) % 8]} {d}-{i}"
+                parts.append(f"<tr><td>{i + 1}</td><td>{name}</td><td>ГУО «Гимназия №{i}»</td></tr>")
+            parts.append("</table>")
+        else:
+            for i in range(students):
+                name = f"{LAST_NAMES[i % 8]} {FIRST_NAMES[(i + d) % 8]} {d}-{i}"
+                parts.append(f"<div class='student-list'><p>{i + 1}. {name}</p></div>")
+    parts.append("</div></body></html>")
+    return "".join(parts)
+
+
+def legacy_parse(parser: StudentsParser, html_content: str) -> int:
+    """Прежний разбор: html.parser и несколько проходов по документу"""
+    soup = BeautifulSoup(html_content, 'html.parser')
+    students = []
+    for table in soup.find_all('table'):
+        title = parser._get_table_title(table)
+        for row_idx, row in enumerate(table.find_all('tr')):
+            if row_idx == 0 and parser._is_header_row(row):
+                continue
+            student = parser._parse_student_row(row, title)
+            if student:
+                students.append(student)
+
+    for list_elem in soup.find_all(['ul', 'ol']):
+        title = parser._get_list_title(list_elem)
+        for li in list_elem.find_all('li', recursive=False):
+            student = parser._extract_student_from_text(li.get_text(strip=True), title)
+            if student:
+                students.append(student)
+
+    def extract_lines(element, source):
+        text = element.get_text(strip=True)
+        if len(text) >= 5:
+            for line in text.split('\n'):
+                student = parser._extract_student_from_text(line.strip(), source)
+                if student:
+                    students.append(student)
+
+    for p in soup.find_all('p'):
+        extract_lines(p, "Список учащихся")
+    for div in soup.find_all('div', class_=lambda x: x and any(k in x.lower() for k in ['student', 'учащийся', 'список', 'list'])):
+        extract_lines(div, "Список учащихся")
+    for header in soup.find_all(['h1', 'h2', 'h3', 'h4', 'h5', 'h6']):
+        title = header.get_text(strip=True)
+        if 'образовательное направление' in title.lower():
+            for element in header.find_all_next(['p', 'div', 'table'])[:10]:
+                if element.name == 'table':
+                    break
+                extract_lines(element, title)
+
+    return len(students)
+
+
+async def save_pages(parser: StudentsParser, directory: Path) -> None:
+    """Сохранить живые страницы сайта как фикстуры"""
+    from src.services.crawler import crawler
+
+    directory.mkdir(parents=True, exist_ok=True)
+    urls = [parser.url, *parser.additional_urls]
+    try:
+        pages = await asyncio.gather(*(parser.fetch_page(url) for url in urls))
+    finally:
+        await crawler.close()
+    for url, html_content in zip(urls, pages):
+        if html_content:
+            name = re.sub(r'\W+', '_', url.split('//', 1)[-1]).strip('_')
+            (directory / f"{name}.html").write_text(html_content, encoding='utf-8')
+            print(f"💾 {url} -> {name}.html")
+
+
+def measure(func, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--fixtures", type=Path, help="каталог с сохранёнными *.html")
+    arg_parser.add_argument("--save", type=Path, help="сохранить живые страницы в каталог и выйти")
+    arg_parser.add_argument("--repeat", type=int, default=5)
+    args = arg_parser.parse_args()
+
+    parser = StudentsParser()
+    if args.save:
+        asyncio.run(save_pages(parser, args.save))
+        return
+
+    if args.fixtures:
+        fixtures = {path.name: path.read_text(encoding='utf-8') for path in sorted(args.fixtures.glob("*.html"))}
+    else:
+        fixtures = {"generated_small.html": generate_page(15, 40), "generated_large.html": generate_page(15, 400)}
+    if not fixtures:
+        raise SystemExit("Нет HTML-фикстур")
+
+    print(f"Парсер HTML: {HTML_PARSER}")
+    print(f"{'страница':<32} {'KB':>7} {'прежний, мс':>12} {'текущий, мс':>12} {'записей':>15}")
+    for name, html_content in fixtures.items():
+        legacy_ms = measure(lambda: legacy_parse(parser, html_content), args.repeat)
+        current_ms = measure(lambda: parser.parse_students_list(html_content), args.repeat)
+        legacy_count = legacy_parse(parser, html_content)
+        current_count = parser.parse_students_list(html_content)['total_count']
+        print(
+            f"{name:<32} {len(html_content) / 1024:>7.0f} {legacy_ms:>12.1f} {current_ms:>12.1f} "
+            f"{legacy_count:>7} -> {current_count:<6}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,8 @@ from __future__ import annotations
 
 from src.database.connection import get_db_session
 from src.repositories import UserRepository, AuthCodeRepository
+from src.core.config import config
+from src.services.parsers.lists_store import ListsStore
 
 from PIL import Image, ImageDraw, ImageFont
 from bs4 import BeautifulSoup
@@ -135,6 +137,24 @@ def parse_pdf_fio_from_file(pdf_path: str) -> List[str]:
     return all_fio
 
 
+def fio_from_lists_store(url: str) -> List[str]:
+    """ФИО из строк, разобранных ботом при загрузке списков (без повторного разбора PDF)"""
+    store_path = config.cache_dir / "lists_store.sqlite3"
+    if not store_path.exists():
+        return []
+
+    store = ListsStore(store_path)
+    try:
+        # В хранилище ссылка записана так, как она указана на сайте
+        for variant in (url, url.replace("http://", "https://"), url.replace("https://", "http://")):
+            rows = store.get_rows(list_kind="enrolled", url=variant)
+            if rows:
+                return [row["full_name"] for row in rows]
+        return []
+    finally:
+        store.close()
+
+
 def download_pdf_from_url(url: str) -> str:
     response = requests.get(url)
     response.raise_for_status()
@@ -201,8 +221,12 @@ if __name__ == '__main__':
     url = result.replace("https", "http")
 
     try:
-        local_pdf_path = download_pdf_from_url(url)
-        fio_list = parse_pdf_fio_from_file(local_pdf_path)
+        fio_list = fio_from_lists_store(result)
+        if fio_list:
+            print(f"ФИО взяты из хранилища списков: {len(fio_list)}")
+        else:
+            local_pdf_path = download_pdf_from_url(url)
+            fio_list = parse_pdf_fio_from_file(local_pdf_path)
 
         # Ограничим первые 5 для теста
         for fio in fio_list[:5]:
@@ -51,7 +51,26 @@ class Config(BaseSettings):
         env="HOURLY_REQUEST_LIMIT",
         ge=1,
         le=10000,
-        description="Лимит запросов в час"
+        description="Лимит сообщений к ИИ в час"
+    )
+    hourly_command_limit: int = Field(
+        default=300,
+        env="HOURLY_COMMAND_LIMIT",
+        ge=1,
+        le=100000,
+        description="Лимит команд и нажатий кнопок в час"
+    )
+    rate_limit_window: int = Field(
+        default=3600,
+        env="RATE_LIMIT_WINDOW",
+        ge=1,
+        description="Длина скользящего окна лимитов (сек)"
+    )
+    rate_limit_local_max_users: int = Field(
+        default=10000,
+        env="RATE_LIMIT_LOCAL_MAX_USERS",
+        ge=1,
+        description="Максимум пользователей в локальном кэше лимитов (без Redis)"
     )
     llm_concurrency_limit: int = Field(
         default=10,
@@ -60,6 +79,11 @@ class Config(BaseSettings):
         le=100,
         description="Лимит одновременных запросов к LLM"
     )
+    generation_policy: Literal["cancel_previous", "queue", "reject"] = Field(
+        default="cancel_previous",
+        env="GENERATION_POLICY",
+        description="Что делать с новым вопросом, пока генерируется предыдущий ответ"
+    )
 
     max_file_size: int = Field(default = 1024 * 1024 * 1024)  # 1GB
     
@@ -70,6 +94,43 @@ class Config(BaseSettings):
         env="REDIS_URL",
         description="URL для подключения к Redis"
     )
+    redis_pool_size: int = Field(
+        default=20,
+        env="REDIS_POOL_SIZE",
+        ge=1,
+        le=500,
+        description="Максимум соединений в общем пуле Redis"
+    )
+    
+    # === ХРАНИЛИЩЕ СОСТОЯНИЯ ===
+    state_backend: Literal["auto", "memory", "redis"] = Field(
+        default="auto",
+        env="STATE_BACKEND",
+        description="Хранилище состояния: auto (Redis если доступен), memory или redis"
+    )
+    state_key_prefix: str = Field(
+        default="ndtp:",
+        env="STATE_KEY_PREFIX",
+        description="Префикс ключей состояния в Redis"
+    )
+    state_ttl: int = Field(
+        default=7 * 24 * 3600,
+        env="STATE_TTL",
+        ge=60,
+        description="Время жизни состояний пользователей и FSM (сек)"
+    )
+    status_cache_ttl: float = Field(
+        default=2.0,
+        env="STATUS_CACHE_TTL",
+        ge=0,
+        description="Время жизни локального кэша статусов пользователей (сек)"
+    )
+    status_cache_size: int = Field(
+        default=10000,
+        env="STATUS_CACHE_SIZE",
+        ge=1,
+        description="Максимум записей в локальном кэше статусов"
+    )
     
     # Database
     postgres_db: str
@@ -87,13 +148,120 @@ class Config(BaseSettings):
         description="Уровень логирования"
     )
     log_format: str = Field(
-        default="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+        default="%(asctime)s [%(levelname)s] [%(request_id)s] %(name)s: %(message)s",
         description="Формат логирования"
     )
     log_date_format: str = Field(
         default="%H:%M:%S",
         description="Формат времени в логах"
     )
+    log_json: bool = Field(
+        default=False,
+        env="LOG_JSON",
+        description="Писать в консоль JSON-строки вместо текста"
+    )
+    log_to_file: bool = Field(
+        default=True,
+        env="LOG_TO_FILE",
+        description="Дублировать логи JSON-строками в logs/bot.jsonl"
+    )
+    log_trace_sample_rate: float = Field(
+        default=0.05,
+        env="LOG_TRACE_SAMPLE_RATE",
+        ge=0.0,
+        le=1.0,
+        description="Доля запросов с подробной трассировкой поиска"
+    )
+    
+    # === МЕТРИКИ ===
+    metrics_enabled: bool = Field(
+        default=True,
+        env="METRICS_ENABLED",
+        description="Включить HTTP эндпоинт /metrics"
+    )
+    metrics_host: str = Field(
+        default="127.0.0.1",
+        env="METRICS_HOST",
+        description="Адрес HTTP сервера метрик"
+    )
+    metrics_port: int = Field(
+        default=9108,
+        env="METRICS_PORT",
+        ge=1,
+        le=65535,
+        description="Порт HTTP сервера метрик"
+    )
+    
+    # === ЗАГРУЗКА СПИСКОВ ===
+    lists_download_concurrency: int = Field(
+        default=4,
+        env="LISTS_DOWNLOAD_CONCURRENCY",
+        ge=1,
+        description="Максимум одновременных загрузок PDF-документов списков"
+    )
+    lists_extract_workers: int = Field(
+        default=0,
+        env="LISTS_EXTRACT_WORKERS",
+        ge=0,
+        description="Процессов для извлечения текста и OCR (0 - по числу ядер)"
+    )
+    ocr_dpi: int = Field(
+        default=300,
+        env="OCR_DPI",
+        ge=72,
+        le=600,
+        description="DPI растеризации страниц для OCR"
+    )
+    
+    # === ЗАГРУЗКА СТРАНИЦ САЙТА ===
+    crawler_fresh_seconds: int = Field(
+        default=300,
+        env="CRAWLER_FRESH_SECONDS",
+        ge=0,
+        description="Сколько секунд страница сайта считается свежей без повторной проверки"
+    )
+    crawler_max_connections: int = Field(
+        default=4,
+        env="CRAWLER_MAX_CONNECTIONS",
+        ge=1,
+        description="Максимум одновременных соединений с сайтом технопарка"
+    )
+    
+    # === ПЛАНИРОВЩИК ФОНОВЫХ ЗАДАЧ ===
+    jobs_jitter_seconds: int = Field(
+        default=120,
+        env="JOBS_JITTER_SECONDS",
+        ge=0,
+        description="Случайная задержка запуска плановых задач (сек)"
+    )
+    lists_refresh_hours: int = Field(
+        default=12,
+        env="LISTS_REFRESH_HOURS",
+        ge=1,
+        description="Период проверки обновлений PDF-списков участников (ч)"
+    )
+    reminder_hour: int = Field(
+        default=9,
+        env="REMINDER_HOUR",
+        ge=0,
+        le=23,
+        description="Час отправки напоминаний о сроках приема заявок"
+    )
+    
+    # === РАССЫЛКИ УВЕДОМЛЕНИЙ ===
+    broadcast_rate: float = Field(
+        default=25.0,
+        env="BROADCAST_RATE",
+        gt=0,
+        le=30,
+        description="Сообщений в секунду при рассылках (лимит Telegram ~30)"
+    )
+    broadcast_concurrency: int = Field(
+        default=8,
+        env="BROADCAST_CONCURRENCY",
+        ge=1,
+        description="Одновременных отправок при рассылках"
+    )
     
     # === ПРАВА ДОСТУПА ===
     admin_ids: Set[int] = Field(
@@ -102,6 +270,19 @@ class Config(BaseSettings):
         description="ID администраторов через запятую"
     )
     
+    # === КОНСУЛЬТАНТЫ ===
+    operators: str = Field(
+        default="",
+        env="OPERATORS",
+        description="Консультанты в JSON: [{\"id\": ..., \"name\": ..., \"capacity\": 2, \"skills\": [\"schedule\"]}]"
+    )
+    operator_offer_timeout: int = Field(
+        default=60,
+        env="OPERATOR_OFFER_TIMEOUT",
+        ge=5,
+        description="Секунд на ответ консультанта, после чего запрос предлагается другому"
+    )
+    
     # === НАСТРОЙКИ МОДУЛЕЙ ===
     enable_calendar: bool = Field(
         default=True,
@@ -198,11 +379,16 @@ class Config(BaseSettings):
         return v
     
     def setup_logging(self) -> None:
-        """Настройка логирования"""
-        logging.basicConfig(
-            level=getattr(logging, self.log_level),
-            format=self.log_format,
+        """Настройка логирования (запись через очередь в фоновом потоке)"""
+        from .log_pipeline import configure_logging
+        
+        configure_logging(
+            level=self.log_level,
+            fmt=self.log_format,
             datefmt=self.log_date_format,
+            json_console=self.log_json,
+            log_file=self.logs_dir / "bot.jsonl" if self.log_to_file else None,
+            trace_sample_rate=self.log_trace_sample_rate,
         )
         
         # Настройка уровней для внешних библиотек
@@ -0,0 +1,148 @@
+"""
+Неблокирующий конвейер логирования NDTP Bot
+
+Записи из event loop только кладутся в очередь (QueueHandler), форматирование
+и запись на диск выполняет фоновый поток QueueListener. В каждую запись
+добавляется request id текущего апдейта; подробные трассировки поиска
+пишутся только для сэмплированной доли запросов.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import uuid
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+# Контекст текущего запроса
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+trace_sampled_var: ContextVar[bool] = ContextVar("trace_sampled", default=False)
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_trace_sample_rate = 0.0
+
+
+class RequestIdFilter(logging.Filter):
+    """Добавляет request id в запись (выполняется в потоке, создавшем запись)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class LoopSafeQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler, который в event loop только подставляет аргументы в сообщение
+
+    Стандартный prepare() прогоняет запись через форматтер и traceback,
+    здесь это делает поток слушателя.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """Форматирует запись как одну JSON-строку"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "msg": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def configure_logging(
+    level: str = "INFO",
+    fmt: str = "%(asctime)s [%(levelname)s] [%(request_id)s] %(name)s: %(message)s",
+    datefmt: str = "%H:%M:%S",
+    json_console: bool = False,
+    log_file: Optional[Path] = None,
+    trace_sample_rate: float = 0.0,
+) -> None:
+    """
+    Настроить корневой логгер на работу через очередь
+
+    Args:
+        level: Уровень логирования
+        fmt: Формат текстового вывода в консоль
+        datefmt: Формат времени в консоли
+        json_console: Писать в консоль JSON-строки вместо текста
+        log_file: Файл для JSON-строк (с ротацией), None - не писать
+        trace_sample_rate: Доля запросов с подробной трассировкой поиска
+    """
+    global _listener, _trace_sample_rate
+
+    stop_logging()
+    _trace_sample_rate = trace_sample_rate
+
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setFormatter(
+        JsonFormatter() if json_console else logging.Formatter(fmt, datefmt=datefmt)
+    )
+    handlers = [console_handler]
+
+    if log_file is not None:
+        log_file.parent.mkdir(parents=True, exist_ok=True)
+        file_handler = logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=10 * 1024 * 1024, backupCount=5, encoding="utf-8"
+        )
+        file_handler.setFormatter(JsonFormatter())
+        handlers.append(file_handler)
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    queue_handler = LoopSafeQueueHandler(log_queue)
+    queue_handler.addFilter(RequestIdFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(getattr(logging, level))
+
+    _listener = logging.handlers.QueueListener(
+        log_queue, *handlers, respect_handler_level=True
+    )
+    _listener.start()
+
+
+def stop_logging() -> None:
+    """Остановить поток записи логов, дописав очередь"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def start_request(request_id: Optional[str] = None) -> str:
+    """
+    Начать контекст запроса: выставить request id и решение о трассировке
+
+    Контекстные переменные копируются в задачу каждого апдейта, поэтому
+    значения не пересекаются между параллельными запросами.
+    """
+    request_id = request_id or uuid.uuid4().hex[:12]
+    request_id_var.set(request_id)
+    trace_sampled_var.set(_trace_sample_rate > 0 and random.random() < _trace_sample_rate)
+    return request_id
+
+
+def trace_enabled() -> bool:
+    """Писать ли подробную трассировку для текущего запроса"""
+    return trace_sampled_var.get()
+
+
+atexit.register(stop_logging)
@@ -0,0 +1,197 @@
+"""
+Метрики задержек NDTP Bot
+
+Гистограммы с фиксированными корзинами по этапам обработки апдейта
+(маршрутизация, контекст RAG, очередь LLM, первый токен, стриминг, правки
+сообщения). Экспорт в текстовом формате Prometheus на локальном /metrics.
+"""
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Корзины задержек (сек) и счётных величин
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50)
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами (кумулятивная, как в Prometheus)"""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets: Tuple[float, ...] = tuple(sorted(buckets))
+        self.counts: List[int] = [0] * (len(self.buckets) + 1)  # последняя - +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        """Учесть наблюдение"""
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Оценка квантиля линейной интерполяцией внутри корзины"""
+        if self.count == 0:
+            return None
+
+        rank = q * self.count
+        cumulative = 0
+        for i, bucket_count in enumerate(self.counts):
+            if cumulative + bucket_count >= rank and bucket_count > 0:
+                if i == len(self.buckets):
+                    # Значение за последней границей - точнее не оценить
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i]
+                return lower + (upper - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.buckets[-1]
+
+    def render(self, name: str, labels: str) -> List[str]:
+        """Строки экспорта в формате Prometheus"""
+        sep = "," if labels else ""
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, self.counts):
+            cumulative += bucket_count
+            lines.append(f'{name}_bucket{{{labels}{sep}le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum:.6f}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Реестр метрик: семейства гистограмм с меткой stage и счётчики"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._families: Dict[str, Dict] = {}
+        self._counters: Dict[str, Dict] = {}
+        self.started_at = time.time()
+
+    def _family(self, name: str, help_text: str, buckets: Sequence[float]) -> Dict:
+        family = self._families.get(name)
+        if family is None:
+            family = {"help": help_text, "buckets": buckets, "series": {}}
+            self._families[name] = family
+        return family
+
+    def observe(
+        self,
+        name: str,
+        stage: str,
+        value: float,
+        help_text: str = "",
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> None:
+        """Учесть наблюдение в гистограмме name{stage=...}"""
+        with self._lock:
+            family = self._family(name, help_text, buckets)
+            histogram = family["series"].get(stage)
+            if histogram is None:
+                histogram = family["series"][stage] = Histogram(family["buckets"])
+            histogram.observe(value)
+
+    def observe_stage(self, stage: str, seconds: float) -> None:
+        """Учесть длительность этапа обработки"""
+        self.observe("ndtp_stage_seconds", stage, seconds, "Длительность этапов обработки апдейта")
+
+    def inc(self, name: str, help_text: str = "", value: float = 1) -> None:
+        """Увеличить счётчик"""
+        with self._lock:
+            counter = self._counters.setdefault(name, {"help": help_text, "value": 0})
+            counter["value"] += value
+
+    def get_histogram(self, name: str, stage: str) -> Optional[Histogram]:
+        family = self._families.get(name)
+        return family["series"].get(stage) if family else None
+
+    def render_prometheus(self) -> str:
+        """Все метрики в текстовом формате Prometheus"""
+        lines = []
+        with self._lock:
+            for name, family in sorted(self._families.items()):
+                lines.append(f"# HELP {name} {family['help']}")
+                lines.append(f"# TYPE {name} histogram")
+                for stage, histogram in sorted(family["series"].items()):
+                    lines.extend(histogram.render(name, f'stage="{stage}"'))
+            for name, counter in sorted(self._counters.items()):
+                lines.append(f"# HELP {name} {counter['help']}")
+                lines.append(f"# TYPE {name} counter")
+                lines.append(f"{name} {counter['value']}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> Dict[str, Dict[str, Dict[str, float]]]:
+        """Сводка count/p50/p95 по всем гистограммам"""
+        result = {}
+        with self._lock:
+            for name, family in self._families.items():
+                result[name] = {
+                    stage: {
+                        "count": histogram.count,
+                        "p50": histogram.quantile(0.5),
+                        "p95": histogram.quantile(0.95),
+                    }
+                    for stage, histogram in family["series"].items()
+                }
+        return result
+
+
+# Глобальный реестр метрик
+metrics = MetricsRegistry()
+
+
+@contextmanager
+def stage_timer(stage: str) -> Iterator[None]:
+    """Замерить длительность блока как этап обработки (работает и вокруг await)"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.observe_stage(stage, time.perf_counter() - started)
+
+
+# === HTTP ЭНДПОИНТ /metrics ===
+
+_metrics_runner = None
+
+
+async def start_metrics_server(host: str, port: int) -> bool:
+    """Запустить локальный HTTP сервер с /metrics"""
+    global _metrics_runner
+    try:
+        from aiohttp import web
+
+        async def handle_metrics(request: "web.Request") -> "web.Response":
+            return web.Response(
+                text=metrics.render_prometheus(),
+                content_type="text/plain",
+                charset="utf-8",
+            )
+
+        app = web.Application()
+        app.router.add_get("/metrics", handle_metrics)
+
+        _metrics_runner = web.AppRunner(app, access_log=None)
+        await _metrics_runner.setup()
+        await web.TCPSite(_metrics_runner, host, port).start()
+        logger.info(f"📈 Метрики доступны на http://{host}:{port}/metrics")
+        return True
+    except Exception as e:
+        logger.error(f"❌ Не удалось запустить сервер метрик: {e}")
+        _metrics_runner = None
+        return False
+
+
+async def stop_metrics_server() -> None:
+    """Остановить HTTP сервер метрик"""
+    global _metrics_runner
+    if _metrics_runner is not None:
+        await _metrics_runner.cleanup()
+        _metrics_runner = None
@@ -3,143 +3,214 @@ Middleware для NDTP Bot
 """
 import logging
 import time
-from typing import Any, Awaitable, Callable, Dict
+import uuid
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
 
 from aiogram import BaseMiddleware
-from aiogram.types import Message
+from aiogram.types import CallbackQuery, Message, TelegramObject
 
 from .config import config
+from .constants import UserStatus
+from .log_pipeline import start_request
+from .metrics import metrics
+from .state_backend import get_redis_client
+from ..utils.cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
-# Импорты для Redis с безопасной обработкой
-try:
-    import redis.asyncio as redis
-    REDIS_AVAILABLE = True
-    logger.info("✅ redis.asyncio успешно импортирован")
-except ImportError:
-    REDIS_AVAILABLE = False
-    logger.warning("⚠️ redis недоступен - используется локальный кэш лимитов")
-    redis = None
-except Exception as e:
-    REDIS_AVAILABLE = False
-    logger.warning(f"⚠️ Ошибка импорта redis: {e}")
-    logger.info("💡 Используется локальный кэш лимитов")
-    redis = None
+# Lua-скрипт скользящего окна: очистка, подсчёт и запись выполняются атомарно
+# за один EVALSHA. Возвращает {разрешено, использовано, мс до освобождения слота}.
+SLIDING_WINDOW_LUA = """
+local key = KEYS[1]
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local limit = tonumber(ARGV[3])
+
+redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+local used = redis.call('ZCARD', key)
+
+if used < limit then
+    redis.call('ZADD', key, now, ARGV[4])
+    redis.call('PEXPIRE', key, window)
+    return {1, used + 1, 0}
+end
+
+local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+local retry_after = window
+if oldest[2] then
+    retry_after = tonumber(oldest[2]) + window - now
+end
+return {0, used, retry_after}
+"""
 
 
 class HourlyLimitMiddleware(BaseMiddleware):
     """
-    Middleware для ограничения количества запросов в час
+    Middleware для ограничения количества запросов в скользящем окне
     
-    Использует Redis если доступен, иначе fallback на локальный кэш
+    Отдельные квоты для сообщений, которые уходят в LLM, и для дешёвых
+    команд/кнопок. Сообщения пользователей в очереди к консультанту и в
+    диалоге с ним в LLM не уходят и считаются по квоте команд.
+
+    Redis (общий пул из state_backend) - один EVALSHA на событие; для
+    обычного текста перед ним читается статус пользователя (get_status через
+    локальный кэш статусов, при промахе - ещё один запрос к Redis). Без
+    Redis - локальное окно с LRU-ограничением числа пользователей.
     """
     
-    def __init__(self, limit_per_hour: int = None):
-        self.limit = limit_per_hour or config.hourly_request_limit
-        self.fallback_cache: Dict[int, Dict[str, Any]] = {}  # Fallback для случая без Redis
-        self._redis_client = None
+    LLM_BUCKET = "llm"
+    COMMAND_BUCKET = "cmd"
+    
+    # Статусы, в которых текст пользователя уходит консультанту, а не в LLM
+    OPERATOR_STATUSES = (UserStatus.WAITING_OPERATOR, UserStatus.WITH_OPERATOR)
+    
+    def __init__(
+        self,
+        limit_per_hour: int = None,
+        command_limit_per_hour: int = None,
+        is_exempt: Optional[Callable[[int], bool]] = None,
+        get_status: Optional[Callable[[int], Awaitable[UserStatus]]] = None,
+    ):
+        self.limits = {
+            self.LLM_BUCKET: limit_per_hour or config.hourly_request_limit,
+            self.COMMAND_BUCKET: command_limit_per_hour or config.hourly_command_limit,
+        }
+        self.window_ms = config.rate_limit_window * 1000
+        self.is_exempt = is_exempt
+        self.get_status = get_status
+        
+        # Fallback без Redis: ключ -> deque меток времени, вытеснение по LRU
+        self.fallback_cache = TTLCache(
+            maxsize=config.rate_limit_local_max_users,
+            ttl=config.rate_limit_window,
+        )
+        self._script = None
+        self._script_client = None
+        self._redis_failed = False
+
+    async def _get_bucket(self, event: TelegramObject, user_id: int) -> str:
+        """Определить квоту: обычный текст уходит в LLM, остальное - команды и кнопки"""
+        if not (isinstance(event, Message) and event.text and not event.text.startswith("/")):
+            return self.COMMAND_BUCKET
+        
+        # Текст в очереди и в диалоге с консультантом пересылается человеку
+        if self.get_status is not None:
+            try:
+                if await self.get_status(user_id) in self.OPERATOR_STATUSES:
+                    return self.COMMAND_BUCKET
+            except Exception as e:
+                logger.debug(f"Не удалось получить статус пользователя {user_id}: {e}")
+        return self.LLM_BUCKET
 
     async def __call__(
         self,
-        handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]],
-        event: Message,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
         data: Dict[str, Any],
     ) -> Any:
         """Обработка middleware"""
-        
-        if hasattr(event, "text") and event.text:
-            if len(event.text) < 10 and event.text.startswith("/"):
-                return await handler(event, data)
-        if not hasattr(event, "from_user") or not event.from_user:
-            
+        user = getattr(event, "from_user", None)
+        if user is None:
             return await handler(event, data)
 
-        user_id = event.from_user.id
-
-        # Используем Redis если доступен
-        if REDIS_AVAILABLE and redis is not None:
-            try:
-                return await self._handle_with_redis(handler, event, data, user_id)
-            except Exception as e:
-                logger.warning(f"⚠️ Redis недоступен: {e}")
-                # Fallback на локальный кэш при ошибке Redis
-                self._redis_client = None
-
-        # Fallback: простой локальный кэш
-        return await self._handle_with_local_cache(handler, event, data, user_id)
-
-    async def _handle_with_redis(
-        self, 
-        handler: Callable, 
-        event: Message, 
-        data: Dict[str, Any], 
-        user_id: int
-    ) -> Any:
-        """Обработка с использованием Redis"""
-        # Создаем соединение Redis только при необходимости
-        if self._redis_client is None:
-            self._redis_client = redis.from_url(
-                config.redis_url, decode_responses=True
-            )
+        user_id = user.id
+        if config.is_admin(user_id) or (self.is_exempt and self.is_exempt(user_id)):
+            return await handler(event, data)
 
-        key = f"user:{user_id}:quota"
-        used = await self._redis_client.incr(key)
+        bucket = await self._get_bucket(event, user_id)
+        limit = self.limits[bucket]
         
-        if used == 1:
-            await self._redis_client.expire(key, 3600)  # TTL 1 час
-
-        if used > self.limit:
-            ttl = await self._redis_client.ttl(key)
-            await event.answer(
-                "⌛ Вы исчерпали лимит запросов в час.\n"
-                f"Попробуйте через {ttl if ttl > 0 else 3600} секунд."
-            )
+        allowed, used, retry_after_ms = await self._hit(f"rl:{bucket}:{user_id}", limit)
+
+        if not allowed:
+            await self._reject(event, retry_after_ms)
             return
 
         # Логируем близкие к лимиту запросы
-        if used > self.limit * 0.8:
+        if used > limit * 0.8:
             logger.warning(
-                f"⚠️ Пользователь {user_id} близок к лимиту: {used}/{self.limit}"
+                f"⚠️ Пользователь {user_id} близок к лимиту ({bucket}): {used}/{limit}"
             )
         
-        
         return await handler(event, data)
 
-    async def _handle_with_local_cache(
-        self, 
-        handler: Callable, 
-        event: Message, 
-        data: Dict[str, Any], 
-        user_id: int
-    ) -> Any:
-        """Обработка с локальным кэшем"""
-        current_time = time.time()
-        current_hour = int(current_time // 3600)
+    async def _hit(self, key: str, limit: int) -> Tuple[bool, int, int]:
+        """Засчитать событие; возвращает (разрешено, использовано, мс до освобождения)"""
+        client = get_redis_client()
+        if client is not None:
+            try:
+                result = await self._hit_redis(client, key, limit)
+                if self._redis_failed:
+                    logger.info("✅ Redis снова доступен для лимитов")
+                    self._redis_failed = False
+                return result
+            except Exception as e:
+                if not self._redis_failed:
+                    logger.warning(f"⚠️ Redis недоступен для лимитов: {e} - используем локальный кэш")
+                    self._redis_failed = True
 
-        if user_id not in self.fallback_cache:
-            self.fallback_cache[user_id] = {"hour": current_hour, "count": 0}
+        return self._hit_local(key, limit)
 
-        user_data = self.fallback_cache[user_id]
+    async def _hit_redis(self, client, key: str, limit: int) -> Tuple[bool, int, int]:
+        """Скользящее окно в Redis за один round-trip"""
+        if self._script is None or self._script_client is not client:
+            self._script = client.register_script(SLIDING_WINDOW_LUA)
+            self._script_client = client
 
-        # Сброс счётчика при смене часа
-        if user_data["hour"] != current_hour:
-            user_data["hour"] = current_hour
-            user_data["count"] = 0
+        now_ms = int(time.time() * 1000)
+        allowed, used, retry_after_ms = await self._script(
+            keys=[f"{config.state_key_prefix}{key}"],
+            args=[now_ms, self.window_ms, limit, f"{now_ms}:{uuid.uuid4().hex[:8]}"],
+        )
+        return bool(int(allowed)), int(used), int(retry_after_ms)
 
-        user_data["count"] += 1
+    def _hit_local(self, key: str, limit: int) -> Tuple[bool, int, int]:
+        """Скользящее окно в памяти процесса"""
+        now_ms = int(time.time() * 1000)
+        hits = self.fallback_cache.get(key)
+        if hits is None:
+            hits = deque()
 
-        if user_data["count"] > self.limit:
-            await event.answer(
-                "⌛ Вы исчерпали лимит запросов в час.\nПопробуйте через час."
-            )
-            return
+        while hits and hits[0] <= now_ms - self.window_ms:
+            hits.popleft()
+
+        if len(hits) >= limit:
+            self.fallback_cache.set(key, hits)
+            return False, len(hits), hits[0] + self.window_ms - now_ms
+
+        hits.append(now_ms)
+        self.fallback_cache.set(key, hits)
+        return True, len(hits), 0
+
+    def _window_text(self) -> str:
+        """Окно лимита словами: «в час», «за 30 мин»"""
+        window = max(1, self.window_ms // 1000)
+        if window == 3600:
+            return "в час"
+        if window % 3600 == 0:
+            return f"за {window // 3600} ч"
+        if window >= 60:
+            return f"за {window // 60} мин"
+        return f"за {window} сек"
+    
+    async def _reject(self, event: TelegramObject, retry_after_ms: int) -> None:
+        """Сообщить пользователю об исчерпании лимита"""
+        retry_after = max(1, retry_after_ms // 1000)
+        wait_text = f"{retry_after // 60} мин" if retry_after >= 60 else f"{retry_after} сек"
+        text = f"⌛ Вы исчерпали лимит запросов {self._window_text()}.\nПопробуйте через {wait_text}."
         
-        return await handler(event, data)
+        try:
+            if isinstance(event, CallbackQuery):
+                await event.answer(text, show_alert=True)
+            elif isinstance(event, Message):
+                await event.answer(text)
+        except Exception as e:
+            logger.debug(f"Не удалось отправить сообщение о лимите: {e}")
 
 
 class LoggingMiddleware(BaseMiddleware):
-    """Middleware для логирования всех запросов"""
+    """Middleware для логирования всех запросов и выдачи request id"""
     
     async def __call__(
         self,
@@ -148,34 +219,57 @@ class LoggingMiddleware(BaseMiddleware):
         data: Dict[str, Any],
     ) -> Any:
         """Логирование запросов"""
+        update = data.get("event_update")
+        start_request(f"{update.update_id:x}" if update is not None else None)
+        
         if hasattr(event, "from_user") and event.from_user:
-            user_id = event.from_user.id
-            username = event.from_user.username or "без username"
-            fsm = data.get("state")
-
-            if fsm is not None:
-                # пример: получить текущее состояние
-                state = await fsm.get_state()
-                print(f"Текущее состояние: {state}")
             # Обрезаем длинные сообщения для логов
-            message_text = ""
-            if hasattr(event, "text") and event.text:
-                message_text = event.text[:100] + ("..." if len(event.text) > 100 else "")
+            message_text = getattr(event, "text", None) or getattr(event, "data", None) or ""
             
             logger.info(
-                f"📨 Запрос от пользователя {user_id} (@{username}): '{message_text}'"
+                "📨 Запрос от пользователя %s (@%s): %r",
+                event.from_user.id,
+                event.from_user.username or "без username",
+                message_text[:100],
             )
         
         return await handler(event, data)
 
 
+class MetricsMiddleware(BaseMiddleware):
+    """Outer middleware: задержка доставки апдейта и полное время его обработки"""
+    
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        """Замер времени обработки апдейта"""
+        message = getattr(event, "message", None)
+        if message is not None and getattr(message, "date", None) is not None:
+            # Дата сообщения Telegram с точностью до секунды
+            metrics.observe_stage("update_received", max(0.0, time.time() - message.date.timestamp()))
+        
+        try:
+            event_type = event.event_type
+        except Exception:
+            event_type = "unknown"
+        
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            metrics.observe_stage(f"update_{event_type}", time.perf_counter() - started)
+
+
 class AdminCheckMiddleware(BaseMiddleware):
     """Middleware для проверки административных прав"""
     
     def __init__(self, admin_only_commands: set = None):
         self.admin_only_commands = admin_only_commands or {
             "operators", "consultants_stats", "queue", 
-            "update_schedule", "update_documents",
+            "update_schedule", "update_documents", "perf", "jobs",
             # DEV ONLY команды
             "test_rag", "test_location", "reload_kb", "rag_stats"
         }
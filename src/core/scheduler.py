@@ -0,0 +1,343 @@
+"""
+Планировщик фоновых задач NDTP Bot
+
+Все периодические работы (обновление расписания, документов, учащихся,
+списков, проверка дедлайнов) регистрируются в одном JobScheduler:
+
+- расписание задаётся интервалом (every, сек) или cron-выражением из
+  5 полей (минута час день месяц день_недели, локальное время);
+- случайная задержка (jitter), чтобы задачи не стартовали одновременно;
+- задача не запускается повторно, пока не завершился прошлый запуск;
+- ограничение времени выполнения (timeout);
+- длительность и результат последнего запуска видны в /jobs;
+- при остановке бота идущие запуски получают время на завершение,
+  затем отменяются.
+"""
+import asyncio
+import logging
+import random
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, FrozenSet, List, Optional
+
+from src.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+JobFunc = Callable[[], Awaitable[object]]
+
+# Сколько ждать идущие задачи при остановке (сек)
+SHUTDOWN_GRACE = 10.0
+
+# Границы полей cron: минута, час, день месяца, месяц, день недели (0 - воскресенье)
+CRON_FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+
+def _parse_cron_field(spec: str, low: int, high: int) -> FrozenSet[int]:
+    """Поле cron: *, число, диапазон a-b, список через запятую, шаг /n"""
+    values = set()
+    for part in spec.split(','):
+        if '/' in part:
+            part, step_text = part.split('/', 1)
+            step = int(step_text)
+            if step < 1:
+                raise ValueError(f"шаг должен быть положительным: {spec}")
+        else:
+            step = 1
+
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start_text, end_text = part.split('-', 1)
+            start, end = int(start_text), int(end_text)
+        else:
+            start = int(part)
+            end = high if step > 1 else start
+
+        if not low <= start <= end <= high:
+            raise ValueError(f"значение вне диапазона {low}-{high}: {spec}")
+        values.update(range(start, end + 1, step))
+    return frozenset(values)
+
+
+class CronSchedule:
+    """Cron-выражение из 5 полей"""
+
+    def __init__(self, expression: str):
+        parts = expression.split()
+        if len(parts) != 5:
+            raise ValueError(f"cron-выражение должно содержать 5 полей: {expression!r}")
+        self.expression = expression
+        fields = [_parse_cron_field(part, low, high) for part, (low, high) in zip(parts, CRON_FIELDS)]
+        self.minutes, self.hours, self.days, self.months, weekdays = fields
+        # 7 - тоже воскресенье
+        self.weekdays = frozenset(day % 7 for day in weekdays)
+        # Как в cron: если ограничены и день месяца, и день недели - подходит любой
+        self._days_restricted = parts[2] != '*'
+        self._weekdays_restricted = parts[4] != '*'
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day_ok = moment.day in self.days
+        weekday_ok = (moment.weekday() + 1) % 7 in self.weekdays
+        if self._days_restricted and self._weekdays_restricted:
+            return day_ok or weekday_ok
+        return day_ok and weekday_ok
+
+    def next_after(self, moment: datetime) -> datetime:
+        """Ближайшее время запуска строго после moment"""
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        # Не больше 5 лет поиска (для выражений вроде 30 февраля)
+        limit = candidate + timedelta(days=366 * 5)
+        while candidate < limit:
+            if candidate.month not in self.months:
+                year, month = divmod(candidate.month, 12)
+                candidate = candidate.replace(year=candidate.year + year, month=month + 1, day=1, hour=0, minute=0)
+                continue
+            if not self._day_matches(candidate):
+                candidate = (candidate + timedelta(days=1)).replace(hour=0, minute=0)
+                continue
+            if candidate.hour not in self.hours:
+                candidate = (candidate + timedelta(hours=1)).replace(minute=0)
+                continue
+            if candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+                continue
+            return candidate
+        raise ValueError(f"cron-выражение никогда не срабатывает: {self.expression!r}")
+
+    def __str__(self) -> str:
+        return f"cron {self.expression}"
+
+
+@dataclass
+class Job:
+    """Зарегистрированная задача и статистика её запусков"""
+
+    name: str
+    func: JobFunc
+    every: Optional[float] = None
+    cron: Optional[CronSchedule] = None
+    jitter: float = 0.0
+    timeout: Optional[float] = None
+    run_on_start: bool = False
+    description: str = ""
+
+    runs: int = 0
+    failures: int = 0
+    skipped: int = 0
+    last_status: Optional[str] = None
+    last_error: Optional[str] = None
+    last_started: Optional[datetime] = None
+    last_duration: Optional[float] = None
+    next_run: Optional[datetime] = None
+    _task: Optional[asyncio.Task] = field(default=None, repr=False)
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def trigger_text(self) -> str:
+        if self.cron is not None:
+            return str(self.cron)
+        return f"каждые {_format_period(self.every)}"
+
+    def next_delay(self, first: bool) -> float:
+        """Секунды до следующего запуска (с учётом jitter)"""
+        if first and self.run_on_start:
+            delay = 0.0
+        elif self.cron is not None:
+            now = datetime.now()
+            delay = (self.cron.next_after(now) - now).total_seconds()
+        else:
+            delay = self.every
+        return delay + (random.uniform(0, self.jitter) if self.jitter else 0.0)
+
+
+def _format_period(seconds: float) -> str:
+    if seconds % 3600 == 0:
+        return f"{seconds / 3600:g} ч"
+    if seconds % 60 == 0:
+        return f"{seconds / 60:g} мин"
+    return f"{seconds:g} с"
+
+
+class JobScheduler:
+    """Запуск зарегистрированных задач по интервалу или cron"""
+
+    def __init__(self, shutdown_grace: float = SHUTDOWN_GRACE):
+        self.shutdown_grace = shutdown_grace
+        self._jobs: Dict[str, Job] = {}
+        self._loops: Dict[str, asyncio.Task] = {}
+        self._started = False
+
+    def add_job(
+        self,
+        name: str,
+        func: JobFunc,
+        *,
+        every: Optional[float] = None,
+        cron: Optional[str] = None,
+        jitter: float = 0.0,
+        timeout: Optional[float] = None,
+        run_on_start: bool = False,
+        description: str = "",
+    ) -> Job:
+        """
+        Зарегистрировать задачу
+
+        Args:
+            every: интервал между запусками (сек)
+            cron: cron-выражение из 5 полей (вместо every)
+            jitter: случайная задержка запуска до jitter секунд
+            timeout: ограничение времени выполнения (сек)
+            run_on_start: первый запуск сразу после старта планировщика
+        """
+        if name in self._jobs:
+            raise ValueError(f"Задача {name} уже зарегистрирована")
+        if (every is None) == (cron is None):
+            raise ValueError(f"Для задачи {name} нужно указать ровно одно из every/cron")
+        if every is not None and every <= 0:
+            raise ValueError(f"Интервал задачи {name} должен быть положительным")
+
+        job = Job(
+            name=name,
+            func=func,
+            every=every,
+            cron=CronSchedule(cron) if cron is not None else None,
+            jitter=jitter,
+            timeout=timeout,
+            run_on_start=run_on_start,
+            description=description,
+        )
+        self._jobs[name] = job
+        if self._started:
+            self._loops[name] = asyncio.create_task(self._job_loop(job), name=f"job:{name}")
+        logger.info(f"🗓️ Задача {name} зарегистрирована ({job.trigger_text})")
+        return job
+
+    def start(self) -> None:
+        """Запустить циклы всех зарегистрированных задач"""
+        if self._started:
+            return
+        self._started = True
+        for name, job in self._jobs.items():
+            self._loops[name] = asyncio.create_task(self._job_loop(job), name=f"job:{name}")
+        logger.info(f"✅ Планировщик запущен: {len(self._jobs)} задач")
+
+    async def _job_loop(self, job: Job) -> None:
+        first = True
+        while True:
+            try:
+                delay = job.next_delay(first)
+            except Exception as e:
+                logger.error(f"❌ Не удалось рассчитать запуск задачи {job.name}: {e}")
+                job.next_run = None
+                return
+            first = False
+            job.next_run = datetime.now() + timedelta(seconds=delay)
+            await asyncio.sleep(delay)
+
+            task = self._start(job)
+            if task is None:
+                job.skipped += 1
+                logger.warning(f"⏭️ Задача {job.name} ещё выполняется, плановый запуск пропущен")
+                continue
+            # shield: остановка цикла не прерывает идущий запуск (его ждёт shutdown)
+            await asyncio.shield(task)
+
+    def _start(self, job: Job) -> Optional[asyncio.Task]:
+        if job.running:
+            return None
+        job._task = asyncio.create_task(self._execute(job), name=f"job-run:{job.name}")
+        return job._task
+
+    async def _execute(self, job: Job) -> bool:
+        job.runs += 1
+        job.last_started = datetime.now()
+        started = time.perf_counter()
+        status, error = "ok", None
+        try:
+            result = await asyncio.wait_for(job.func(), timeout=job.timeout)
+            if result is False:
+                status = "failed"
+        except asyncio.TimeoutError:
+            status, error = "timeout", f"превышено {job.timeout:g} с"
+        except asyncio.CancelledError:
+            status, error = "cancelled", None
+            raise
+        except Exception as e:
+            status, error = "failed", str(e)
+        finally:
+            elapsed = time.perf_counter() - started
+            job.last_duration = elapsed
+            job.last_status = status
+            job.last_error = error
+            metrics.observe("ndtp_job_seconds", job.name, elapsed, "Длительность фоновых задач")
+            if status != "ok":
+                job.failures += 1
+                metrics.inc("ndtp_job_failures_total", "Неудачные запуски фоновых задач")
+
+        if status == "ok":
+            logger.info(f"✅ Задача {job.name} выполнена за {elapsed:.1f} с")
+        else:
+            logger.error(f"❌ Задача {job.name}: {status}{f' ({error})' if error else ''}, {elapsed:.1f} с")
+        return status == "ok"
+
+    def run_now(self, name: str) -> bool:
+        """
+        Запустить задачу вне расписания
+
+        Returns:
+            False, если задача уже выполняется
+        """
+        job = self._jobs.get(name)
+        if job is None:
+            raise KeyError(name)
+        return self._start(job) is not None
+
+    def get_jobs(self) -> List[Job]:
+        return list(self._jobs.values())
+
+    def get_stats(self) -> Dict[str, Dict]:
+        return {
+            job.name: {
+                'trigger': job.trigger_text,
+                'running': job.running,
+                'runs': job.runs,
+                'failures': job.failures,
+                'skipped': job.skipped,
+                'last_status': job.last_status,
+                'last_error': job.last_error,
+                'last_duration': round(job.last_duration, 3) if job.last_duration is not None else None,
+                'last_started': job.last_started.isoformat() if job.last_started else None,
+                'next_run': job.next_run.isoformat() if job.next_run else None,
+            }
+            for job in self._jobs.values()
+        }
+
+    async def shutdown(self) -> None:
+        """Остановить циклы и дождаться (или отменить) идущие запуски"""
+        loops = list(self._loops.values())
+        for task in loops:
+            task.cancel()
+        if loops:
+            await asyncio.gather(*loops, return_exceptions=True)
+        self._loops.clear()
+        self._started = False
+
+        running = [job._task for job in self._jobs.values() if job.running]
+        if not running:
+            return
+        logger.info(f"⏳ Ожидание завершения фоновых задач: {len(running)}")
+        _, pending = await asyncio.wait(running, timeout=self.shutdown_grace)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+            logger.warning(f"⚠️ Отменено незавершённых задач: {len(pending)}")
+
+
+# Глобальный экземпляр
+scheduler = JobScheduler()
@@ -0,0 +1,338 @@
+"""
+Подключаемое хранилище состояния NDTP Bot
+
+По умолчанию состояние живёт в памяти процесса. Если config.redis_url доступен,
+используется Redis - тогда статусы пользователей, очередь консультантов, FSM
+и квоты переживают рестарт и разделяются между несколькими воркерами.
+Предложения запросов консультантам (OperatorRouter) остаются в памяти
+процесса - их распределение рассчитано на один воркер.
+"""
+import asyncio
+import fnmatch
+import json
+import logging
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from .config import config
+
+logger = logging.getLogger(__name__)
+
+# Импорты для Redis с безопасной обработкой
+try:
+    import redis.asyncio as redis
+    from aiogram.fsm.storage.redis import RedisStorage
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+    redis = None
+    RedisStorage = None
+    logger.warning("⚠️ redis недоступен - состояние хранится в памяти процесса")
+
+
+# === КОДИРОВАНИЕ ЗНАЧЕНИЙ ХЭШЕЙ ===
+# Каждое поле хранится строкой с однобуквенным тегом типа: короткие значения
+# укладываются в компактное listpack-представление хэшей Redis.
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"$t": value.timestamp()}
+    raise TypeError(f"Тип {type(value).__name__} не сериализуется")
+
+
+def _json_object_hook(value: Dict) -> Any:
+    if len(value) == 1 and "$t" in value:
+        return datetime.fromtimestamp(value["$t"])
+    return value
+
+
+def encode_value(value: Any) -> str:
+    """Закодировать значение поля хэша в строку с тегом типа"""
+    if isinstance(value, bool):
+        return "b1" if value else "b0"
+    if isinstance(value, int):
+        return f"i{value}"
+    if isinstance(value, float):
+        return f"f{value!r}"
+    if isinstance(value, datetime):
+        return f"t{value.timestamp()!r}"
+    if isinstance(value, str):
+        return f"s{value}"
+    return "j" + json.dumps(
+        value, ensure_ascii=False, separators=(",", ":"), default=_json_default
+    )
+
+
+def decode_value(raw: str) -> Any:
+    """Раскодировать значение, закодированное encode_value"""
+    tag, body = raw[:1], raw[1:]
+    if tag == "s":
+        return body
+    if tag == "i":
+        return int(body)
+    if tag == "f":
+        return float(body)
+    if tag == "b":
+        return body == "1"
+    if tag == "t":
+        return datetime.fromtimestamp(float(body))
+    if tag == "j":
+        return json.loads(body, object_hook=_json_object_hook)
+    return raw
+
+
+def encode_mapping(mapping: Dict[str, Any]) -> Dict[str, str]:
+    """Закодировать словарь для записи в хэш (поля со значением None пропускаются)"""
+    return {key: encode_value(value) for key, value in mapping.items() if value is not None}
+
+
+def decode_mapping(mapping: Dict[str, str]) -> Dict[str, Any]:
+    """Раскодировать словарь, прочитанный из хэша"""
+    return {key: decode_value(value) for key, value in mapping.items()}
+
+
+class StateBackend(ABC):
+    """Базовый интерфейс хранилища состояния"""
+
+    name = "base"
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[str]:
+        """Получить строковое значение"""
+
+    @abstractmethod
+    async def set(self, key: str, value: str, ttl: Optional[int] = None) -> None:
+        """Сохранить строковое значение"""
+
+    @abstractmethod
+    async def delete(self, *keys: str) -> int:
+        """Удалить ключи, вернуть количество удалённых"""
+
+    @abstractmethod
+    async def hgetall(self, key: str) -> Dict[str, str]:
+        """Получить все поля хэша"""
+
+    @abstractmethod
+    async def hset(self, key: str, mapping: Dict[str, str], ttl: Optional[int] = None) -> None:
+        """Записать поля хэша (TTL обновляется при каждой записи)"""
+
+    @abstractmethod
+    async def incr(self, key: str, ttl: Optional[int] = None) -> int:
+        """Атомарно увеличить счётчик"""
+
+    @abstractmethod
+    async def scan_keys(self, pattern: str) -> List[str]:
+        """Найти ключи по glob-шаблону (без префикса)"""
+
+    async def close(self) -> None:
+        """Закрыть соединения"""
+
+
+class MemoryStateBackend(StateBackend):
+    """Хранилище в памяти процесса (состояние теряется при рестарте)"""
+
+    name = "memory"
+    PURGE_EVERY = 1000  # Чистка просроченных ключей каждые N записей
+
+    def __init__(self):
+        self._data: Dict[str, Any] = {}
+        self._expires: Dict[str, float] = {}
+        self._writes = 0
+
+    def _alive(self, key: str) -> bool:
+        expires_at = self._expires.get(key)
+        if expires_at is not None and expires_at <= time.monotonic():
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+            return False
+        return key in self._data
+
+    def _touch(self, key: str, ttl: Optional[int]) -> None:
+        if ttl:
+            self._expires[key] = time.monotonic() + ttl
+        else:
+            self._expires.pop(key, None)
+
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            now = time.monotonic()
+            for expired in [k for k, exp in self._expires.items() if exp <= now]:
+                self._data.pop(expired, None)
+                self._expires.pop(expired, None)
+
+    async def get(self, key: str) -> Optional[str]:
+        if not self._alive(key):
+            return None
+        value = self._data[key]
+        return value if isinstance(value, str) else None
+
+    async def set(self, key: str, value: str, ttl: Optional[int] = None) -> None:
+        self._data[key] = value
+        self._touch(key, ttl)
+
+    async def delete(self, *keys: str) -> int:
+        deleted = 0
+        for key in keys:
+            if self._alive(key):
+                deleted += 1
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+        return deleted
+
+    async def hgetall(self, key: str) -> Dict[str, str]:
+        if not self._alive(key) or not isinstance(self._data[key], dict):
+            return {}
+        return dict(self._data[key])
+
+    async def hset(self, key: str, mapping: Dict[str, str], ttl: Optional[int] = None) -> None:
+        current = self._data.get(key) if self._alive(key) else None
+        if not isinstance(current, dict):
+            current = {}
+            self._data[key] = current
+        current.update(mapping)
+        self._touch(key, ttl)
+
+    async def incr(self, key: str, ttl: Optional[int] = None) -> int:
+        value = int(await self.get(key) or 0) + 1
+        await self.set(key, str(value), ttl)
+        return value
+
+    async def scan_keys(self, pattern: str) -> List[str]:
+        return [key for key in list(self._data) if fnmatch.fnmatchcase(key, pattern) and self._alive(key)]
+
+
+class RedisStateBackend(StateBackend):
+    """Хранилище в Redis с общим пулом соединений"""
+
+    name = "redis"
+
+    def __init__(self, client, prefix: str = ""):
+        self.client = client
+        self.prefix = prefix
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self.client.get(self._key(key))
+
+    async def set(self, key: str, value: str, ttl: Optional[int] = None) -> None:
+        await self.client.set(self._key(key), value, ex=ttl or None)
+
+    async def delete(self, *keys: str) -> int:
+        if not keys:
+            return 0
+        return await self.client.delete(*(self._key(key) for key in keys))
+
+    async def hgetall(self, key: str) -> Dict[str, str]:
+        return await self.client.hgetall(self._key(key))
+
+    async def hset(self, key: str, mapping: Dict[str, str], ttl: Optional[int] = None) -> None:
+        if not mapping:
+            return
+        full_key = self._key(key)
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.hset(full_key, mapping=mapping)
+            if ttl:
+                pipe.expire(full_key, ttl)
+            await pipe.execute()
+
+    async def incr(self, key: str, ttl: Optional[int] = None) -> int:
+        full_key = self._key(key)
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.incr(full_key)
+            if ttl:
+                pipe.expire(full_key, ttl)
+            results = await pipe.execute()
+        return int(results[0])
+
+    async def scan_keys(self, pattern: str) -> List[str]:
+        prefix_len = len(self.prefix)
+        return [
+            key[prefix_len:]
+            async for key in self.client.scan_iter(match=self._key(pattern), count=500)
+        ]
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+# Глобальное хранилище: до вызова init_state_backend() работает в памяти
+_state_backend: StateBackend = MemoryStateBackend()
+_redis_client = None
+
+
+def get_state_backend() -> StateBackend:
+    """Получить текущее хранилище состояния"""
+    return _state_backend
+
+
+def get_redis_client():
+    """Получить общий клиент Redis (None, если Redis не используется)"""
+    return _redis_client
+
+
+async def init_state_backend() -> StateBackend:
+    """
+    Выбрать хранилище состояния согласно config.state_backend
+
+    В режиме auto Redis используется, только если он отвечает на PING;
+    иначе остаёмся в памяти процесса.
+    """
+    global _state_backend, _redis_client
+
+    if config.state_backend == "memory":
+        logger.info("💾 Хранилище состояния: память процесса")
+        return _state_backend
+
+    if not REDIS_AVAILABLE:
+        logger.warning("⚠️ Пакет redis не установлен - состояние хранится в памяти процесса")
+        return _state_backend
+
+    client = None
+    try:
+        pool = redis.ConnectionPool.from_url(
+            config.redis_url,
+            max_connections=config.redis_pool_size,
+            decode_responses=True,
+        )
+        client = redis.Redis(connection_pool=pool)
+        await asyncio.wait_for(client.ping(), timeout=3)
+    except Exception as e:
+        if client is not None:
+            await client.aclose()
+        log = logger.error if config.state_backend == "redis" else logger.warning
+        log(f"⚠️ Redis недоступен ({e}) - состояние хранится в памяти процесса")
+        return _state_backend
+
+    _redis_client = client
+    _state_backend = RedisStateBackend(client, prefix=config.state_key_prefix)
+    logger.info(f"✅ Хранилище состояния: Redis ({config.redis_url})")
+    return _state_backend
+
+
+def create_fsm_storage() -> BaseStorage:
+    """Создать хранилище FSM поверх выбранного backend"""
+    if _redis_client is not None:
+        return RedisStorage(
+            redis=_redis_client,
+            key_builder=DefaultKeyBuilder(prefix=f"{config.state_key_prefix}fsm"),
+            state_ttl=config.state_ttl,
+            data_ttl=config.state_ttl,
+        )
+    return MemoryStorage()
+
+
+async def close_state_backend() -> None:
+    """Закрыть соединения хранилища"""
+    global _redis_client
+    try:
+        await _state_backend.close()
+    except Exception as e:
+        logger.error(f"❌ Ошибка закрытия хранилища состояния: {e}")
+    _redis_client = None
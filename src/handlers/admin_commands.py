@@ -0,0 +1,139 @@
+"""
+Административные команды NDTP Bot
+"""
+import logging
+from datetime import datetime
+
+from aiogram.filters import Command, CommandObject
+from aiogram.types import Message
+
+from ..core.config import config
+from ..core.metrics import metrics
+from ..core.scheduler import scheduler
+from ..services.reminders import reminder_planner
+
+logger = logging.getLogger(__name__)
+
+# Статусы последнего запуска в /jobs
+JOB_STATUS_ICONS = {
+    None: "⚪", "ok": "✅", "failed": "❌", "timeout": "⏱️", "cancelled": "⏹️",
+}
+
+# Порядок этапов в сводке /perf
+PERF_STAGES = [
+    ("update_received", "Доставка апдейта"),
+    ("update_message", "Обработка сообщения"),
+    ("update_callback_query", "Обработка кнопки"),
+    ("status_routing", "Маршрутизация по статусу"),
+    ("context_total", "Контекст (всего)"),
+    ("context_rag", "  ├ база знаний"),
+    ("context_schedule", "  ├ расписание"),
+    ("context_documents", "  └ документы"),
+    ("llm_queue_wait", "Очередь LLM"),
+    ("llm_first_token", "Первый токен"),
+    ("llm_stream_total", "Стриминг ответа"),
+    ("final_edit", "Финальная правка"),
+]
+
+
+def _format_ms(seconds) -> str:
+    """Секунды -> строка в мс"""
+    if seconds is None:
+        return "—"
+    return f"{seconds * 1000:.0f}"
+
+
+async def cmd_perf(message: Message) -> None:
+    """Сводка p50/p95 по этапам обработки"""
+    if not config.is_admin(message.from_user.id):
+        await message.answer("❌ Команда доступна только администраторам")
+        return
+
+    summary = metrics.summary()
+    stages = summary.get("ndtp_stage_seconds", {})
+
+    if not stages:
+        await message.answer("📈 Метрик пока нет - бот ещё не обработал ни одного запроса.")
+        return
+
+    lines = ["📈 Задержки по этапам (мс): p50 / p95 · n\n"]
+    known = {stage for stage, _ in PERF_STAGES}
+    ordered = PERF_STAGES + [(stage, stage) for stage in sorted(stages) if stage not in known]
+
+    for stage, title in ordered:
+        data = stages.get(stage)
+        if not data:
+            continue
+        lines.append(
+            f"{title}: {_format_ms(data['p50'])} / {_format_ms(data['p95'])} · {data['count']}"
+        )
+
+    edits = summary.get("ndtp_stream_edits", {}).get("answer")
+    if edits:
+        lines.append(
+            f"\n✏️ Правок на ответ: p50 {edits['p50']:.1f} / p95 {edits['p95']:.1f}"
+        )
+
+    await message.answer("\n".join(lines))
+
+
+def _format_job(job) -> str:
+    """Строки задачи для /jobs"""
+    icon = "🔄" if job.running else JOB_STATUS_ICONS.get(job.last_status, "❓")
+    title = f"{job.name} — {job.description}" if job.description else job.name
+    lines = [f"{icon} {title} ({job.trigger_text})"]
+
+    if job.last_started:
+        duration = f"{job.last_duration:.1f} с" if job.last_duration is not None else "идёт"
+        lines.append(f"   последний: {job.last_started:%d.%m %H:%M} · {duration} · {job.last_status or 'идёт'}")
+    if job.last_error:
+        lines.append(f"   ошибка: {job.last_error[:200]}")
+    lines.append(
+        f"   запусков: {job.runs} · ошибок: {job.failures} · пропущено: {job.skipped}"
+        + (f" · следующий: {job.next_run:%d.%m %H:%M}" if job.next_run else "")
+    )
+    return "\n".join(lines)
+
+
+async def cmd_jobs(message: Message, command: CommandObject) -> None:
+    """Фоновые задачи планировщика; /jobs run <имя> - запустить вне расписания"""
+    if not config.is_admin(message.from_user.id):
+        await message.answer("❌ Команда доступна только администраторам")
+        return
+
+    args = (command.args or "").split()
+    if args:
+        if len(args) != 2 or args[0] != "run":
+            await message.answer("ℹ️ Использование: /jobs или /jobs run <имя задачи>")
+            return
+        try:
+            started = scheduler.run_now(args[1])
+        except KeyError:
+            await message.answer(f"❌ Задача {args[1]} не найдена")
+            return
+        await message.answer(
+            f"▶️ Задача {args[1]} запущена" if started else f"⏳ Задача {args[1]} уже выполняется"
+        )
+        return
+
+    jobs = scheduler.get_jobs()
+    parts = [_format_job(job) for job in jobs] or ["Фоновых задач нет"]
+
+    reminders = reminder_planner.get_stats()
+    if reminders['running']:
+        next_at = reminders['next_at']
+        parts.append(
+            f"⏰ reminders — Напоминания о сроках приема заявок\n"
+            f"   в очереди: {reminders['pending']} · отправлено: {reminders['sent']}"
+            + (f" · следующее: {datetime.fromisoformat(next_at):%d.%m %H:%M}" if next_at else "")
+        )
+
+    await message.answer("🗓️ Фоновые задачи\n\n" + "\n\n".join(parts))
+
+
+def register_admin_commands(dp) -> None:
+    """Регистрация административных команд"""
+    dp.message.register(cmd_perf, Command("perf"))
+    dp.message.register(cmd_jobs, Command("jobs"))
+
+    logger.info("✅ Административные команды зарегистрированы")
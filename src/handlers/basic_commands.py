@@ -37,7 +37,8 @@ async def cmd_start(message: Message, command: CommandObject) -> None:
             "• /consultants_stats — сводная статистика по консультантам\n"
             "• /operators — список операторов\n"
             "• /notifications — статус системы уведомлений\n"
-            "• /update_schedule, /update_documents — обновление данных\n\n"
+            "• /update_schedule, /update_documents — обновление данных\n"
+            "• /perf — задержки по этапам обработки (p50/p95)\n\n"
             "Подсказка: используйте /help для теста эскалации в систему консультантов."
         )
         await message.answer(admin_text)
@@ -174,10 +175,7 @@ async def cmd_help(message: Message, state: FSMContext, bot: Bot) -> None:
 
     if success:
         await state.set_state(OperatorState.WAITING_OPERATOR)
-        queue_info = operator_handler.get_queue_info()
-        position = len(
-            [u for u in queue_info["queue_details"] if u["user_id"] == user_id]
-        )
+        position = operator_handler.get_queue_position(user_id)
 
         await message.answer(
             "📞 Ваш запрос передан консультанту.\n"
@@ -195,7 +193,7 @@ async def cmd_help(message: Message, state: FSMContext, bot: Bot) -> None:
 async def cmd_status(message: Message) -> None:
     """Показать статус пользователя"""
     user_id = message.from_user.id
-    user_status = operator_handler.get_user_status(user_id)
+    user_status = await operator_handler.fetch_user_status(user_id)
 
     logger.info(
         f"ℹ️ Запрос статуса от пользователя {user_id}, статус: {user_status.value}"
@@ -222,7 +220,7 @@ async def cmd_status(message: Message) -> None:
         status_text += (
             f"📋 Информация о запросе:\n"
             f"⏰ Время запроса: {request_info['request_time'].strftime('%H:%M:%S')}\n"
-            f"📍 Позиция в очереди: {request_info['queue_position']}\n\n"
+            f"📍 Позиция в очереди: {operator_handler.get_queue_position(user_id)}\n\n"
         )
     elif (
         user_status == UserStatus.WITH_OPERATOR
@@ -255,7 +253,7 @@ async def cmd_cancel(message: Message, state: FSMContext, bot: Bot) -> None:
     """Отмена текущей операции"""
     user_id = message.from_user.id
     current_state = await state.get_state()
-    user_status = operator_handler.get_user_status(user_id)
+    user_status = await operator_handler.fetch_user_status(user_id)
 
     logger.info(
         f"🚫 Команда /cancel от пользователя {user_id}, статус: {user_status}"
@@ -284,7 +282,7 @@ async def cmd_cancel(message: Message, state: FSMContext, bot: Bot) -> None:
             await message.answer("❌ Ошибка завершения сессии")
     elif user_status == UserStatus.RATING_OPERATOR:
         # Пропускаем оценку и завершаем
-        operator_handler.set_user_status(user_id, UserStatus.NORMAL)
+        await operator_handler.set_user_status(user_id, UserStatus.NORMAL)
         await state.clear()
         await message.answer("❌ Оценка пропущена. Чем еще могу помочь?")
     elif current_state is not None:
@@ -310,10 +308,7 @@ async def handle_request_consultant(callback: CallbackQuery, state: FSMContext,
         
         if success:
             await state.set_state(OperatorState.WAITING_OPERATOR)
-            queue_info = operator_handler.get_queue_info()
-            position = len(
-                [u for u in queue_info["queue_details"] if u["user_id"] == user.id]
-            )
+            position = operator_handler.get_queue_position(user.id)
             await callback.message.answer(
                 "📞 Ваш запрос передан консультанту.\n"
                 "Пожалуйста, ожидайте подключения.\n\n"
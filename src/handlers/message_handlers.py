@@ -4,6 +4,7 @@
 import asyncio
 import logging
 import time
+from contextlib import aclosing
 
 from aiogram import Bot, F
 from aiogram.fsm.context import FSMContext
@@ -13,10 +14,13 @@ from src.services.parsers.lists_parser import search_name_in_lists
 from src.utils.helpers import shorten_document_name
 from ..core.config import config
 from ..core.constants import get_system_prompt
+from ..core.log_pipeline import trace_enabled
+from ..core.metrics import COUNT_BUCKETS, metrics, stage_timer
 from ..handlers.operator_handler import operator_handler
 from src.core.constants import UserStatus
 from ..services.deepseek_client import deepseek_client
 from ..services.context_service import get_enhanced_context
+from ..services.generation_tracker import generation_tracker
 
 logger = logging.getLogger(__name__)
 
@@ -30,6 +34,7 @@ async def handle_text_message(message: Message, state: FSMContext, bot: Bot) ->
     Маршрутизирует сообщения в зависимости от статуса пользователя
     """
     user_id = message.from_user.id
+    routing_started = time.perf_counter()
     current_state = await state.get_state()
 
     # Исключаем операторов из этого обработчика
@@ -43,11 +48,12 @@ async def handle_text_message(message: Message, state: FSMContext, bot: Bot) ->
     if _is_special_module_state(message, current_state):
         return
 
-    logger.info(f"📝 Получено сообщение от пользователя {user_id}: '{message.text}'")
+    logger.debug("📝 Получено сообщение от пользователя %s: %r", user_id, message.text)
 
     # Проверяем статус пользователя
-    user_status = operator_handler.get_user_status(user_id)
-    logger.info(f"👤 Статус пользователя {user_id}: {user_status}")
+    user_status = await operator_handler.fetch_user_status(user_id)
+    metrics.observe_stage("status_routing", time.perf_counter() - routing_started)
+    logger.debug("👤 Статус пользователя %s: %s", user_id, user_status)
 
     # Маршрутизация по статусу
     if user_status == UserStatus.WAITING_OPERATOR:
@@ -88,7 +94,7 @@ async def _handle_waiting_operator(message: Message, user_id: int) -> None:
         f"⏳ Пользователь {user_id} ожидает консультанта - добавляем сообщение в историю"
     )
     # Добавляем сообщение в историю для консультанта
-    operator_handler.add_user_message_to_history(user_id, message.text)
+    await operator_handler.add_user_message_to_history(user_id, message.text)
     await message.answer(
         "⏳ Ваш запрос уже передан консультанту. Пожалуйста, ожидайте подключения."
     )
@@ -154,6 +160,12 @@ async def _handle_lists_search(message: Message, state: FSMContext) -> None:
             response_text = f"✅ Найдено: {len(results)} совпадений\n\n"
             response_text += f"👤 Поиск: {query}\n\n"
             
+            if results[0].get('approximate'):
+                response_text += (
+                    "⚠️ Точного совпадения нет - найдены похожие написания. "
+                    "Проверьте ФИО в документе.\n\n"
+                )
+            
             # Группируем результаты по сменам
             shifts_data = {}
             for result in results:
@@ -202,6 +214,10 @@ async def _handle_lists_search(message: Message, state: FSMContext) -> None:
                     doc_name = result['document']
                     # Применяем умное сокращение названий
                     short_name = shorten_document_name(doc_name)
+                    row = result.get('row')
+                    if row and row.get('direction'):
+                        # Строка таблицы: точное ФИО и направление
+                        short_name += f"\n      👤 {row['full_name']} - {row['direction']}"
                     unique_docs.add(short_name)
                 
                 for doc in sorted(unique_docs):
@@ -239,15 +255,26 @@ async def _handle_lists_search(message: Message, state: FSMContext) -> None:
 
 
 async def _handle_ai_response(message: Message, bot: Bot) -> None:
-    """Обработка обычного сообщения с помощью ИИ"""
+    """Обработка обычного сообщения с помощью ИИ с учётом уже идущей генерации"""
     user_id = message.from_user.id
-    logger.info(
-        f"🤖 Пользователь {user_id} (@{message.from_user.username}) спрашивает: "
-        f"'{message.text[:50]}{'...' if len(message.text) > 50 else ''}'"
+    
+    started = await generation_tracker.run(
+        user_id, lambda: _generate_ai_answer(message, bot)
     )
+    if not started:
+        await message.answer(
+            "⏳ Я ещё отвечаю на ваш предыдущий вопрос.\n"
+            "Пожалуйста, дождитесь ответа и задайте следующий."
+        )
+
+
+async def _generate_ai_answer(message: Message, bot: Bot) -> None:
+    """Генерация ответа ИИ: поиск контекста и стриминг ответа"""
+    user_id = message.from_user.id
+    logger.info("🤖 Пользователь %s спрашивает: %.50r", user_id, message.text)
     
     try:
-        logger.info("🔍 Начинаем поиск в базе знаний...")
+        logger.debug("🔍 Начинаем поиск в базе знаний...")
         
         # Запомним последнее пользовательское сообщение для возможной эскалации
         try:
@@ -257,11 +284,8 @@ async def _handle_ai_response(message: Message, bot: Bot) -> None:
 
         # Получаем контекст из RAG системы
         context = await get_enhanced_context(message.text)
-        logger.info(
-            f"Получен контекст: {context[:200]}..."
-            if len(context) > 200
-            else f"Получен контекст: {context}"
-        )
+        if trace_enabled():
+            logger.info("Получен контекст (%d символов): %.200s", len(context), context)
 
         # Подготовка сообщений для ИИ
         system_message = get_system_prompt()
@@ -279,7 +303,7 @@ async def _handle_ai_response(message: Message, bot: Bot) -> None:
             {"role": "user", "content": user_message},
         ]
 
-        logger.info("🚀 Отправляем стриминговый запрос к DeepSeek API...")
+        logger.debug("🚀 Отправляем стриминговый запрос к DeepSeek API...")
 
         # Отправляем начальное сообщение для редактирования
         sent_message = await message.answer("🤔 Думаю...")
@@ -306,31 +330,40 @@ async def _process_streaming_response(
     last_update = 0
     last_typing_time = 0
     update_interval = 100  # Обновляем каждые 100 символов
+    edits = 0
     user_id = original_message.from_user.id
 
     try:
-        async for chunk in deepseek_client.get_streaming_completion(
-            messages, temperature=0.3
-        ):
-            if chunk:
-                response_text += chunk
-                current_time = time.time()
-
-                # Обновляем сообщение каждые N символов И если прошло минимум 2 секунды
-                if (
-                    len(response_text) - last_update >= update_interval
-                    and current_time - last_typing_time >= 2.0
-                ):
-                    await _update_message_safely(
-                        bot, sent_message, response_text + " ▌"
-                    )
-                    last_update = len(response_text)
-                    last_typing_time = current_time
-                    await asyncio.sleep(1.0)
+        # aclosing гарантирует закрытие стрима (и освобождение слота LLM) при отмене
+        async with aclosing(
+            deepseek_client.get_streaming_completion(messages, temperature=0.3)
+        ) as stream:
+            async for chunk in stream:
+                if chunk:
+                    response_text += chunk
+                    current_time = time.time()
+
+                    # Обновляем сообщение каждые N символов И если прошло минимум 2 секунды
+                    if (
+                        len(response_text) - last_update >= update_interval
+                        and current_time - last_typing_time >= 2.0
+                    ):
+                        await _update_message_safely(
+                            bot, sent_message, response_text + " ▌"
+                        )
+                        edits += 1
+                        last_update = len(response_text)
+                        last_typing_time = current_time
+                        await asyncio.sleep(1.0)
 
         # Финальное обновление без индикатора печатания
         if response_text:
-            await _update_message_safely(bot, sent_message, response_text)
+            with stage_timer("final_edit"):
+                await _update_message_safely(bot, sent_message, response_text)
+            metrics.observe(
+                "ndtp_stream_edits", "answer", edits + 1,
+                "Количество правок сообщения на один ответ", COUNT_BUCKETS
+            )
             logger.info(
                 f"✅ Стриминговый ответ завершен: {len(response_text)} символов "
                 f"для пользователя {user_id}"
@@ -345,6 +378,17 @@ async def _process_streaming_response(
                 "Попробуйте переформулировать вопрос или обратитесь к оператору: /help"
             )
 
+    except asyncio.CancelledError:
+        logger.info(
+            f"⏹ Генерация для пользователя {user_id} прервана после {len(response_text)} символов"
+        )
+        await _update_message_safely(
+            bot, sent_message,
+            (response_text + "\n\n" if response_text else "")
+            + "⏹ Ответ прерван - отвечаю на ваш новый вопрос."
+        )
+        raise
+
     except Exception as streaming_error:
         logger.error(f"Ошибка стриминга: {streaming_error}")
         await _update_message_safely(
@@ -421,7 +465,7 @@ async def handle_media_message(message: Message, bot: Bot) -> None:
             await message.answer("❌ Ошибка пересылки медиа")
         return
 
-    user_status = operator_handler.get_user_status(user_id)
+    user_status = await operator_handler.fetch_user_status(user_id)
     logger.info(
         f"📎 Получено медиа от пользователя {user_id}, статус: {user_status}"
     )
@@ -1,3 +1,5 @@
+import asyncio
+import json
 import logging
 from typing import Optional, Dict, List, Tuple
 from datetime import datetime
@@ -6,10 +8,50 @@ from aiogram import types, Bot
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.filters import and_f, or_f
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from src.core.config import config
 from src.core.constants import UserStatus
+from src.core.metrics import metrics
+from src.core.state_backend import get_state_backend, encode_mapping, decode_mapping
+from src.services.operator_routing import (
+    SKILLS,
+    Offer,
+    OperatorProfile,
+    OperatorRouter,
+    SessionIndex,
+    WaitQueue,
+    classify_request,
+)
+from src.utils.cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
+# Компактные коды статусов для хранилища (NORMAL не хранится - это отсутствие ключа)
+_STATUS_CODES = {
+    UserStatus.WAITING_OPERATOR.state: "w",
+    UserStatus.WITH_OPERATOR.state: "o",
+    UserStatus.RATING_OPERATOR.state: "r",
+}
+_STATUS_BY_CODE = {
+    "w": UserStatus.WAITING_OPERATOR,
+    "o": UserStatus.WITH_OPERATOR,
+    "r": UserStatus.RATING_OPERATOR,
+}
+
+# Поля, которые хранятся только в памяти процесса
+_LOCAL_ONLY_FIELDS = {"session_messages"}
+
+# Консультант по умолчанию, если OPERATORS не задан. Как и до появления
+# capacity, он принимает запросы без ограничения числа одновременных диалогов
+DEFAULT_OPERATORS = [{"id": 7148748755, "name": "Консультант Технопарка", "capacity": None}]
+
+# Сколько первых запросов очереди просматривать при распределении
+DISPATCH_SCAN_LIMIT = 200
+
+# Границы гистограммы ожидания консультанта, с
+WAIT_BUCKETS = (5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0)
+
+SKILL_TITLES = {"schedule": "расписание", "documents": "документы", "lists": "списки"}
+
 
 class OperatorState(StatesGroup):
     WAITING_OPERATOR = State()
@@ -34,18 +76,56 @@ class EscalationEngine:
         return False
 
 class OperatorManager:
-    """Простой менеджер операторов"""
+    """Консультанты из настроек: вместимость, темы и рейтинг"""
     
     def __init__(self):
-        # Упрощенная конфигурация операторов
-        self.operators_config = {
-            7148748755: {  # Реальный оператор
-                "name": "Консультант Технопарка",
-                "is_active": True,
+        self.operators_config: Dict[int, Dict] = {}
+        self.profiles: Dict[int, OperatorProfile] = {}
+        
+        for entry in self._load_entries():
+            try:
+                operator_id = int(entry["id"])
+                # null - без ограничения числа одновременных диалогов
+                capacity = entry.get("capacity", 1)
+                if capacity is not None:
+                    capacity = max(1, int(capacity))
+                skills = frozenset(entry.get("skills") or ())
+            except (KeyError, TypeError, ValueError) as e:
+                logger.warning(f"⚠️ Некорректная запись консультанта {entry}: {e}")
+                continue
+            
+            unknown = skills - set(SKILLS)
+            if unknown:
+                logger.warning(f"⚠️ Неизвестные темы консультанта {operator_id}: {', '.join(sorted(unknown))}")
+            
+            name = entry.get("name") or "Консультант Технопарка"
+            is_active = bool(entry.get("is_active", True))
+            self.operators_config[operator_id] = {
+                "name": name,
+                "is_active": is_active,
                 "rating": 5.0,
-                "total_sessions": 0
+                "total_sessions": 0,
+                "capacity": capacity,
+                "skills": sorted(skills),
             }
-        }
+            self.profiles[operator_id] = OperatorProfile(operator_id, name, capacity, skills, is_active)
+        
+        logger.info(f"👨‍💼 Консультантов: {len(self.profiles)}")
+    
+    @staticmethod
+    def _load_entries() -> List[Dict]:
+        """Записи консультантов из OPERATORS (JSON)"""
+        if not config.operators.strip():
+            return DEFAULT_OPERATORS
+        try:
+            entries = json.loads(config.operators)
+        except ValueError as e:
+            logger.error(f"❌ Некорректный JSON в OPERATORS: {e}")
+            return DEFAULT_OPERATORS
+        return [entries] if isinstance(entries, dict) else entries
+    
+    def get_profiles(self) -> List[OperatorProfile]:
+        return list(self.profiles.values())
         
     def get_active_operators(self) -> List[int]:
         """Получить список активных операторов"""
@@ -70,21 +150,218 @@ class OperatorHandler:
     """Упрощенный класс для обработки эскалации к операторам"""
     
     def __init__(self):
-        self.waiting_queue: Dict[int, Dict] = {}  # Очередь ожидания
+        self.waiting_queue: Dict[int, Dict] = {}  # Запросы в очереди ожидания
+        self.queue_order = WaitQueue()  # Порядок очереди и позиции
         self.active_sessions: Dict[int, Dict] = {}  # Активные сессии
+        self.session_index = SessionIndex()  # Консультант -> пользователи в сессиях
+        self.router = OperatorRouter(self.session_index)  # Предложения запросов консультантам
         self.user_states: Dict[int, UserStatus] = {}  # Статусы пользователей
         self.session_history: Dict[int, List] = {}  # История сессий
         
+        # Read-through кэш статусов для горячего пути handle_text_message
+        self._status_cache = (
+            TTLCache(maxsize=config.status_cache_size, ttl=config.status_cache_ttl)
+            if config.status_cache_ttl > 0 else None
+        )
+        
         self.operator_manager = OperatorManager()
         self.escalation_engine = EscalationEngine()
+    
+    # === ХРАНИЛИЩЕ СОСТОЯНИЯ ===
+    
+    @staticmethod
+    def _queue_key(user_id: int) -> str:
+        return f"oq:{user_id}"
+    
+    @staticmethod
+    def _session_key(user_id: int) -> str:
+        return f"os:{user_id}"
+    
+    @staticmethod
+    def _operator_key(operator_id: int) -> str:
+        return f"oo:{operator_id}"
+    
+    @staticmethod
+    def _last_session_key(user_id: int) -> str:
+        return f"oh:{user_id}"
+    
+    @staticmethod
+    def _is_shared_state() -> bool:
+        """Состояние разделяется с другими воркерами (не в памяти процесса)"""
+        return get_state_backend().name != "memory"
+    
+    async def _save_record(self, key: str, record: Dict) -> None:
+        """Записать запись очереди/сессии в хранилище"""
+        try:
+            fields = {k: v for k, v in record.items() if k not in _LOCAL_ONLY_FIELDS}
+            await get_state_backend().hset(key, encode_mapping(fields), ttl=config.state_ttl)
+        except Exception as e:
+            logger.error(f"❌ Ошибка записи состояния {key}: {e}")
+    
+    async def _load_record(self, key: str) -> Optional[Dict]:
+        """Прочитать запись очереди/сессии из хранилища"""
+        try:
+            raw = await get_state_backend().hgetall(key)
+        except Exception as e:
+            logger.error(f"❌ Ошибка чтения состояния {key}: {e}")
+            return None
+        return decode_mapping(raw) if raw else None
+    
+    async def _delete_keys(self, *keys: str) -> int:
+        """Удалить ключи из хранилища"""
+        try:
+            return await get_state_backend().delete(*keys)
+        except Exception as e:
+            logger.error(f"❌ Ошибка удаления состояния {keys}: {e}")
+            return 0
+    
+    def _enqueue(self, user_id: int, record: Dict) -> int:
+        """Добавить запрос в очередь ожидания; позиция в очереди"""
+        self.waiting_queue[user_id] = record
+        return self.queue_order.push(user_id)
+    
+    def _dequeue(self, user_id: int) -> Optional[Dict]:
+        """Убрать запрос из очереди ожидания"""
+        self.queue_order.remove(user_id)
+        return self.waiting_queue.pop(user_id, None)
+    
+    def _remember_session(self, user_id: int, session: Dict) -> None:
+        self.active_sessions[user_id] = session
+        self.session_index.bind(session["operator_id"], user_id, session.get("connection_time"))
+    
+    def _forget_session(self, user_id: int) -> Optional[Dict]:
+        self.session_index.unbind(user_id)
+        return self.active_sessions.pop(user_id, None)
+    
+    def get_queue_position(self, user_id: int) -> Optional[int]:
+        """Текущая позиция пользователя в очереди (None, если его там нет)"""
+        return self.queue_order.position(user_id)
+    
+    async def restore_state(self, bot: Bot = None) -> None:
+        """Восстановить очередь и активные сессии из хранилища после рестарта"""
+        if not self._is_shared_state():
+            return
+        
+        backend = get_state_backend()
+        try:
+            waiting = []
+            for key in await backend.scan_keys("oq:*"):
+                record = await self._load_record(key)
+                if record:
+                    waiting.append((int(key[3:]), record))
+            
+            # Ключи приходят в произвольном порядке - очередь восстанавливается по времени запроса
+            waiting.sort(key=lambda item: item[1].get("request_time") or datetime.min)
+            for user_id, record in waiting:
+                self._enqueue(user_id, record)
+            
+            for key in await backend.scan_keys("os:*"):
+                record = await self._load_record(key)
+                if record:
+                    record["session_messages"] = []
+                    self._remember_session(int(key[3:]), record)
+            
+            logger.info(
+                f"♻️ Восстановлено состояние консультаций: {len(self.waiting_queue)} в очереди, "
+                f"{len(self.active_sessions)} активных сессий"
+            )
+        except Exception as e:
+            logger.error(f"❌ Ошибка восстановления состояния консультаций: {e}")
+            return
+        
+        # Восстановленные запросы сразу предлагаются свободным консультантам
+        if bot is not None and self.waiting_queue:
+            await self.dispatch(bot)
+    
+    async def _get_waiting_request(self, user_id: int) -> Optional[Dict]:
+        """Получить запрос из очереди (при общем хранилище - актуальную версию)"""
+        if not self._is_shared_state():
+            return self.waiting_queue.get(user_id)
+        
+        record = await self._load_record(self._queue_key(user_id))
+        if record is None:
+            self._dequeue(user_id)
+            return None
+        
+        self._enqueue(user_id, record)
+        return record
+    
+    async def _claim_waiting_request(self, user_id: int) -> Optional[Dict]:
+        """Атомарно забрать запрос из очереди (его не сможет забрать другой воркер)"""
+        local_record = self._dequeue(user_id)
+        stored_record = None
+        if self._is_shared_state():
+            stored_record = await self._load_record(self._queue_key(user_id))
+        
+        # Удаление ключа - точка синхронизации: забрал тот, кто реально удалил
+        if not await self._delete_keys(self._queue_key(user_id)) and self._is_shared_state():
+            return None
+        
+        return stored_record or local_record
+    
+    async def _get_active_session(self, user_id: int) -> Optional[Dict]:
+        """Получить активную сессию (при общем хранилище - актуальную версию)"""
+        session = self.active_sessions.get(user_id)
+        if not self._is_shared_state():
+            return session
+        
+        stored = await self._load_record(self._session_key(user_id))
+        if stored is None:
+            self._forget_session(user_id)
+            return None
+        
+        if session is None or session.get("session_id") != stored.get("session_id"):
+            stored["session_messages"] = []
+            self._remember_session(user_id, stored)
+            session = stored
+        return session
+    
+    # === СТАТУСЫ ПОЛЬЗОВАТЕЛЕЙ ===
         
     def get_user_status(self, user_id: int) -> UserStatus:
-        """Получить статус пользователя"""
+        """Получить статус пользователя из памяти процесса"""
         return self.user_states.get(user_id, UserStatus.NORMAL)
     
-    def set_user_status(self, user_id: int, status: UserStatus):
+    async def fetch_user_status(self, user_id: int) -> UserStatus:
+        """Получить статус пользователя из хранилища через локальный кэш"""
+        if self._status_cache is not None:
+            cached = self._status_cache.get(user_id)
+            if cached is not None:
+                return cached
+        
+        try:
+            code = await get_state_backend().get(f"st:{user_id}")
+        except Exception as e:
+            logger.error(f"❌ Ошибка чтения статуса пользователя {user_id}: {e}")
+            return self.get_user_status(user_id)
+        
+        status = _STATUS_BY_CODE.get(code, UserStatus.NORMAL)
+        self._remember_status(user_id, status)
+        return status
+    
+    def _remember_status(self, user_id: int, status: UserStatus) -> None:
+        """Обновить локальные копии статуса"""
+        if status == UserStatus.NORMAL:
+            self.user_states.pop(user_id, None)
+        else:
+            self.user_states[user_id] = status
+        
+        if self._status_cache is not None:
+            self._status_cache.set(user_id, status)
+    
+    async def set_user_status(self, user_id: int, status: UserStatus):
         """Установить статус пользователя"""
-        self.user_states[user_id] = status
+        self._remember_status(user_id, status)
+        
+        code = _STATUS_CODES.get(status.state)
+        try:
+            if code is None:
+                await get_state_backend().delete(f"st:{user_id}")
+            else:
+                await get_state_backend().set(f"st:{user_id}", code, ttl=config.state_ttl)
+        except Exception as e:
+            logger.error(f"❌ Ошибка записи статуса пользователя {user_id}: {e}")
+        
         logger.info(f"Пользователь {user_id} изменил статус на {status}")
     
     async def analyze_message_for_escalation(self, message: str, ai_confidence: float = 0.8) -> Dict:
@@ -101,32 +378,158 @@ class OperatorHandler:
                                 auto_escalation: bool = False, bot=None) -> bool:
         """Эскалировать запрос к оператору"""
         
-        if self.get_user_status(user_id) != UserStatus.NORMAL:
+        if await self.fetch_user_status(user_id) != UserStatus.NORMAL:
             return False
             
         # Добавляем в очередь
-        queue_position = len(self.waiting_queue) + 1
-        self.waiting_queue[user_id] = {
+        record = {
             "user_id": user_id,
             "username": message.from_user.username or "Пользователь",
             "first_name": message.from_user.first_name or "",
             "chat_id": message.chat.id,
             "request_time": datetime.now(),
             "original_message": message.text,
-            "queue_position": queue_position,
+            "skill": classify_request(message.text),
             "auto_escalation": auto_escalation,
             "message_history": []
         }
+        # Позиция на момент постановки (для уведомления консультантов)
+        record["queue_position"] = self._enqueue(user_id, record)
+        await self._save_record(self._queue_key(user_id), record)
         
-        self.set_user_status(user_id, UserStatus.WAITING_OPERATOR)
+        await self.set_user_status(user_id, UserStatus.WAITING_OPERATOR)
         
-        # Уведомляем операторов
-        await self._notify_available_operators(user_id, bot)
+        # Предлагаем запрос наименее загруженному консультанту
+        await self.dispatch(bot)
         
         return True
     
+    # === РАСПРЕДЕЛЕНИЕ ЗАПРОСОВ ===
+    
+    def _request_text(self, request_info: Dict) -> str:
+        """Описание запроса для консультанта"""
+        skill = request_info.get("skill")
+        position = self.get_queue_position(request_info["user_id"]) or request_info.get("queue_position")
+        return (
+            f"📝 **Новый запрос**\n\n"
+            f"👤 **Пользователь:** {request_info['first_name']}\n"
+            f"📱 Username: @{request_info['username']}\n"
+            f"⏰ **Время:** {request_info['request_time'].strftime('%H:%M:%S')}\n"
+            f"📋 **Позиция в очереди:** {position}\n"
+            + (f"🏷 **Тема:** {SKILL_TITLES.get(skill, skill)}\n" if skill else "")
+            + f"\n💬 **Запрос:**\n_{request_info['original_message']}_"
+        )
+    
+    async def dispatch(self, bot: Bot) -> int:
+        """Предложить ожидающие запросы свободным консультантам; сколько предложено"""
+        if bot is None:
+            logger.error("❌ Объект bot не передан!")
+            return 0
+        
+        profiles = self.operator_manager.get_profiles()
+        if not any(profile.is_active for profile in profiles):
+            logger.warning("❌ Нет активных операторов")
+            return 0
+        
+        offered = 0
+        for user_id in self.queue_order.head(DISPATCH_SCAN_LIMIT):
+            if not any(self.router.has_room(profile) for profile in profiles):
+                break
+            if user_id in self.router.offers or user_id in self.router.broadcasted:
+                continue
+            if await self._route_request(user_id, profiles, bot):
+                offered += 1
+        return offered
+    
+    async def _route_request(self, user_id: int, profiles: List[OperatorProfile], bot: Bot) -> bool:
+        """Предложить запрос следующему подходящему консультанту"""
+        while True:
+            request_info = self.waiting_queue.get(user_id)
+            if request_info is None or user_id in self.router.offers:
+                return False
+            
+            operator_id, exhausted = self.router.pick(
+                profiles, request_info.get("skill"), exclude=self.router.tried.get(user_id, ())
+            )
+            if exhausted:
+                # Запрос не взял ни один консультант - рассылаем всем, кто в сети
+                self.router.broadcasted.add(user_id)
+                await self._notify_available_operators(user_id, bot)
+                return True
+            if operator_id is None:
+                return False
+            if await self._offer_request(user_id, operator_id, bot):
+                return True
+    
+    async def _offer_request(self, user_id: int, operator_id: int, bot: Bot) -> bool:
+        """Отправить запрос одному консультанту с таймером на принятие"""
+        request_info = self.waiting_queue[user_id]
+        offer = Offer(user_id=user_id, operator_id=operator_id, skill=request_info.get("skill"))
+        # Место консультанта занимается до отправки: параллельное распределение его не выберет
+        self.router.add_offer(offer)
+        
+        timeout = config.operator_offer_timeout
+        keyboard = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="✅ Принять запрос", callback_data=f"accept_request_{user_id}")],
+            [InlineKeyboardButton(text="↪️ Передать другому", callback_data=f"decline_request_{user_id}")]
+        ])
+        try:
+            sent = await bot.send_message(
+                operator_id,
+                self._request_text(request_info) + f"\n\n⏳ Если не принять запрос за {timeout} с, он перейдёт другому консультанту",
+                reply_markup=keyboard,
+                parse_mode="Markdown"
+            )
+        except Exception as e:
+            logger.error(f"❌ Ошибка отправки запроса консультанту {operator_id}: {e}")
+            self.router.drop_offer(user_id, declined=True)
+            return False
+        
+        # Пока шла отправка, запрос могли принять или отменить
+        if self.router.offers.get(user_id) is not offer:
+            return True
+        offer.message_id = sent.message_id
+        offer.task = asyncio.create_task(self._expire_offer(offer, bot))
+        
+        profile = self.operator_manager.profiles[operator_id]
+        logger.info(
+            f"📨 Запрос {user_id} предложен консультанту {operator_id} "
+            f"(загрузка {self.router.load(operator_id)}/{profile.capacity or '∞'}, тема: {offer.skill or 'любая'})"
+        )
+        return True
+    
+    async def _expire_offer(self, offer: Offer, bot: Bot) -> None:
+        """Консультант не ответил вовремя - предложить запрос следующему"""
+        await asyncio.sleep(config.operator_offer_timeout)
+        if self.router.offers.get(offer.user_id) is not offer:
+            return
+        
+        self.router.drop_offer(offer.user_id, declined=True)
+        logger.info(f"⌛ Консультант {offer.operator_id} не принял запрос {offer.user_id} вовремя")
+        await self._close_offer(bot, offer, "⌛ Время на принятие истекло - запрос передан другому консультанту")
+        await self.dispatch(bot)
+    
+    async def _close_offer(self, bot: Bot, offer: Optional[Offer], text: str) -> None:
+        """Убрать кнопки из сообщения с предложением"""
+        if offer is None or offer.message_id is None:
+            return
+        try:
+            await bot.edit_message_text(text, chat_id=offer.operator_id, message_id=offer.message_id)
+        except Exception as e:
+            logger.debug(f"Не удалось обновить предложение консультанту {offer.operator_id}: {e}")
+    
+    async def decline_request(self, operator_id: int, user_id: int, bot: Bot) -> Tuple[bool, str]:
+        """Консультант передаёт предложенный запрос другому"""
+        offer = self.router.offers.get(user_id)
+        if offer is None or offer.operator_id != operator_id:
+            return False, "Предложение уже неактуально"
+        
+        self.router.drop_offer(user_id, declined=True)
+        await self.dispatch(bot)
+        return True, "Запрос передан другому консультанту"
+    
     async def _notify_available_operators(self, user_id: int, bot=None):
-        """Уведомить доступных операторов о новом запросе"""
+        """Разослать запрос всем активным консультантам (кто первым примет)"""
         if user_id not in self.waiting_queue:
             logger.warning(f"Пользователь {user_id} не найден в очереди ожидания")
             return
@@ -134,21 +537,13 @@ class OperatorHandler:
         request_info = self.waiting_queue[user_id]
         active_operators = self.operator_manager.get_active_operators()
         
-        logger.info(f"🔍 Поиск активных операторов для пользователя {user_id}")
-        logger.info(f"📋 Найдено активных операторов: {len(active_operators)} - {active_operators}")
+        logger.info(f"📋 Запрос {user_id} рассылается всем активным консультантам: {len(active_operators)}")
         
         if not active_operators:
             logger.warning("❌ Нет активных операторов")
             return
         
-        notification_text = (
-            f"📝 **Новый запрос**\n\n"
-            f"👤 **Пользователь:** {request_info['first_name']}\n"
-            f"📱 Username: @{request_info['username']}\n"
-            f"⏰ **Время:** {request_info['request_time'].strftime('%H:%M:%S')}\n"
-            f"📋 **Позиция в очереди:** {request_info['queue_position']}\n\n"
-            f"💬 **Запрос:**\n_{request_info['original_message']}_"
-        )
+        notification_text = self._request_text(request_info)
         
         # Создаем инлайн-кнопки
         keyboard = InlineKeyboardMarkup(inline_keyboard=[
@@ -162,23 +557,20 @@ class OperatorHandler:
         
         # Отправляем уведомления операторам
         if bot:
-            logger.info(f"📤 Отправка уведомлений {len(active_operators)} операторам")
             for operator_id in active_operators:
                 try:
-                    logger.info(f"📨 Отправка уведомления оператору {operator_id}...")
                     await bot.send_message(
                         operator_id, 
                         notification_text,
                         reply_markup=keyboard,
                         parse_mode="Markdown"
                     )
-                    logger.info(f"✅ Уведомление успешно отправлено оператору {operator_id}")
                 except Exception as e:
                     logger.error(f"❌ Ошибка отправки уведомления оператору {operator_id}: {e}")
         else:
             logger.error("❌ Объект bot не передан!")
     
-    def add_user_message_to_history(self, user_id: int, message: str, timestamp: datetime = None):
+    async def add_user_message_to_history(self, user_id: int, message: str, timestamp: datetime = None):
         """Добавить сообщение пользователя в историю"""
         if timestamp is None:
             timestamp = datetime.now()
@@ -190,16 +582,17 @@ class OperatorHandler:
         }
         
         # Добавляем в очередь ожидания если пользователь там
-        if user_id in self.waiting_queue:
-            if 'message_history' not in self.waiting_queue[user_id]:
-                self.waiting_queue[user_id]['message_history'] = []
-            
-            self.waiting_queue[user_id]['message_history'].append(message_entry)
-            
+        request_info = await self._get_waiting_request(user_id)
+        if request_info is not None:
             # Ограничиваем историю последними 5 сообщениями
-            if len(self.waiting_queue[user_id]['message_history']) > 5:
-                self.waiting_queue[user_id]['message_history'] = \
-                    self.waiting_queue[user_id]['message_history'][-5:]
+            history = request_info.get('message_history', [])
+            history.append(message_entry)
+            request_info['message_history'] = history[-5:]
+            
+            await self._save_record(
+                self._queue_key(user_id),
+                {'message_history': request_info['message_history']}
+            )
     
     async def accept_request(self, operator_id: int, user_id: int, bot: Bot) -> Tuple[bool, str]:
         """Принять запрос оператором"""
@@ -207,15 +600,31 @@ class OperatorHandler:
         if not self.operator_manager.is_operator(operator_id):
             return False, "Вы не являетесь оператором системы"
         
-        if user_id not in self.waiting_queue:
-            return False, "Запрос не найден в очереди"
+        # Предложенный этому консультанту запрос уже занимает его место
+        profile = self.operator_manager.profiles[operator_id]
+        offer = self.router.offers.get(user_id)
+        own_offer = offer is not None and offer.operator_id == operator_id
+        if profile.capacity is not None and self.router.load(operator_id) - own_offer >= profile.capacity:
+            return False, f"У вас уже {profile.capacity} активных консультаций - завершите одну из них"
         
         # Создаем активную сессию
-        request_info = self.waiting_queue.pop(user_id)
+        request_info = await self._claim_waiting_request(user_id)
+        offer = self.router.forget(user_id)
+        if request_info is None:
+            return False, "Запрос не найден в очереди"
+        if offer is not None and offer.operator_id != operator_id:
+            await self._close_offer(bot, offer, "✅ Запрос принят другим консультантом")
+        
+        request_time = request_info.get("request_time")
+        if isinstance(request_time, datetime):
+            metrics.observe(
+                "ndtp_operator_wait_seconds", "accepted", (datetime.now() - request_time).total_seconds(),
+                "Ожидание консультанта до принятия запроса", buckets=WAIT_BUCKETS
+            )
         
         operator_config = self.operator_manager.get_operator_info(operator_id)
         
-        self.active_sessions[user_id] = {
+        self._remember_session(user_id, {
             **request_info,
             "operator_id": operator_id,
             "operator_name": operator_config["name"],
@@ -223,13 +632,12 @@ class OperatorHandler:
             "last_activity": datetime.now(),
             "session_messages": [],
             "session_id": f"session_{user_id}_{int(datetime.now().timestamp())}"
-        }
+        })
+        await self._save_record(self._session_key(user_id), self.active_sessions[user_id])
+        await self._set_operator_target(operator_id, user_id)
         
         # Меняем статус пользователя
-        self.set_user_status(user_id, UserStatus.WITH_OPERATOR)
-        
-        # Перенумеровываем очередь
-        await self._reorder_queue()
+        await self.set_user_status(user_id, UserStatus.WITH_OPERATOR)
         
         # Уведомляем пользователя
         try:
@@ -259,7 +667,12 @@ class OperatorHandler:
                 f"✅ Вы подключились к пользователю!\n\n"
                 f"👤 Пользователь: {request_info['first_name']}\n"
                 f"💬 Исходный запрос: {request_info['original_message']}\n\n"
-                f"📞 Сессия активна. Все ваши сообщения будут переданы пользователю.",
+                f"📞 Сессия активна. Все ваши сообщения будут переданы пользователю."
+                + (
+                    "\n\n👥 У вас несколько диалогов: сообщения уходят тому, кто писал последним. "
+                    "Чтобы ответить другому, нажмите «↩️ Ответить» под его сообщением."
+                    if self.session_index.load(operator_id) > 1 else ""
+                ),
                 reply_markup=operator_keyboard
             )
         except Exception as e:
@@ -267,22 +680,34 @@ class OperatorHandler:
         
         return True, f"Подключен к пользователю {request_info['first_name']}"
     
-    async def _reorder_queue(self):
-        """Перенумеровать очередь после изменений"""
-        sorted_queue = sorted(
-            self.waiting_queue.items(), 
-            key=lambda x: x[1]["request_time"]
-        )
-        
-        for i, (user_id, request_info) in enumerate(sorted_queue, 1):
-            self.waiting_queue[user_id]["queue_position"] = i
+    async def _set_operator_target(self, operator_id: int, user_id: Optional[int]) -> None:
+        """Кому уходят сообщения консультанта (для других воркеров - через хранилище)"""
+        try:
+            if user_id is None:
+                await get_state_backend().delete(self._operator_key(operator_id))
+            else:
+                await get_state_backend().set(
+                    self._operator_key(operator_id), str(user_id), ttl=config.state_ttl
+                )
+        except Exception as e:
+            logger.error(f"❌ Ошибка записи сессии консультанта {operator_id}: {e}")
+    
+    async def focus_session(self, operator_id: int, user_id: int) -> Tuple[bool, str]:
+        """Направить следующие сообщения консультанта этому пользователю"""
+        session = await self._get_active_session(user_id)
+        if session is None or session["operator_id"] != operator_id:
+            return False, "Сессия с пользователем не найдена"
+        
+        self.session_index.touch(user_id)
+        await self._set_operator_target(operator_id, user_id)
+        return True, f"Сообщения будут отправляться: {session['first_name'] or user_id}"
     
     async def forward_user_message(self, user_id: int, message: types.Message, bot: Bot) -> bool:
         """Переслать сообщение пользователя оператору"""
-        if user_id not in self.active_sessions:
+        session = await self._get_active_session(user_id)
+        if session is None:
             return False
         
-        session = self.active_sessions[user_id]
         operator_id = session["operator_id"]
         
         # Сохраняем сообщение в истории сессии
@@ -295,21 +720,30 @@ class OperatorHandler:
         
         session["last_activity"] = datetime.now()
         
+        # Ответ консультанта уйдёт тому, кто писал последним
+        reply_markup = None
+        self.session_index.touch(user_id)
+        if self.session_index.load(operator_id) > 1:
+            await self._set_operator_target(operator_id, user_id)
+            reply_markup = InlineKeyboardMarkup(inline_keyboard=[
+                [InlineKeyboardButton(text="↩️ Ответить", callback_data=f"focus_session_{user_id}")]
+            ])
+        
         try:
             # Пересылаем оператору
             prefix = f"💬 {session['first_name']}:"
             
             if message.text:
-                await bot.send_message(operator_id, f"{prefix} {message.text}")
+                await bot.send_message(operator_id, f"{prefix} {message.text}", reply_markup=reply_markup)
             elif message.photo:
                 await bot.send_photo(operator_id, message.photo[-1].file_id, 
-                                   caption=f"{prefix} [фото]")
+                                   caption=f"{prefix} [фото]", reply_markup=reply_markup)
             elif message.document:
                 await bot.send_document(operator_id, message.document.file_id,
-                                      caption=f"{prefix} [документ]")
+                                      caption=f"{prefix} [документ]", reply_markup=reply_markup)
             elif message.voice:
                 await bot.send_voice(operator_id, message.voice.file_id,
-                                   caption=f"{prefix} [голосовое сообщение]")
+                                   caption=f"{prefix} [голосовое сообщение]", reply_markup=reply_markup)
             
             return True
             
@@ -322,11 +756,19 @@ class OperatorHandler:
         
         # Найти активную сессию для оператора
         user_session = None
+        session_user_id = None
+        
+        if self._is_shared_state():
+            try:
+                raw_user_id = await get_state_backend().get(self._operator_key(operator_id))
+                session_user_id = int(raw_user_id) if raw_user_id else None
+            except Exception as e:
+                logger.error(f"❌ Ошибка чтения сессии консультанта {operator_id}: {e}")
+        else:
+            session_user_id = self.session_index.user_for(operator_id)
         
-        for user_id, session in self.active_sessions.items():
-            if session["operator_id"] == operator_id:
-                user_session = session
-                break
+        if session_user_id is not None:
+            user_session = await self._get_active_session(session_user_id)
         
         if not user_session:
             return False, "Активная сессия не найдена"
@@ -354,11 +796,18 @@ class OperatorHandler:
     
     async def end_session(self, user_id: int, bot: Bot, reason: str = "завершена") -> bool:
         """Завершить сессию с оператором"""
-        if user_id not in self.active_sessions:
+        session = await self._get_active_session(user_id)
+        if session is None:
+            return False
+        
+        # Сессию завершает тот воркер, который удалил её из хранилища
+        deleted = await self._delete_keys(self._session_key(user_id))
+        self._forget_session(user_id)
+        if not deleted and self._is_shared_state():
             return False
         
-        session = self.active_sessions.pop(user_id)
         operator_id = session["operator_id"]
+        await self._set_operator_target(operator_id, self.session_index.user_for(operator_id))
         
         # Сохраняем в историю
         session_duration = datetime.now() - session["connection_time"]
@@ -368,9 +817,17 @@ class OperatorHandler:
         
         self.session_history[user_id] = self.session_history.get(user_id, [])
         self.session_history[user_id].append(session)
+        await self._save_record(self._last_session_key(user_id), {
+            "session_id": session["session_id"],
+            "operator_id": operator_id,
+            "chat_id": session["chat_id"],
+            "end_time": session["end_time"],
+            "duration": session["duration"],
+            "end_reason": reason,
+        })
         
         # Переводим в режим оценки
-        self.set_user_status(user_id, UserStatus.RATING_OPERATOR)
+        await self.set_user_status(user_id, UserStatus.RATING_OPERATOR)
         
         # Отправляем форму оценки
         try:
@@ -400,13 +857,16 @@ class OperatorHandler:
             
         except Exception as e:
             logger.error(f"Ошибка отправки формы оценки: {e}")
-            self.set_user_status(user_id, UserStatus.NORMAL)
+            await self.set_user_status(user_id, UserStatus.NORMAL)
+        
+        # У консультанта освободилось место
+        await self.dispatch(bot)
         
         return True
     
     async def rate_operator(self, user_id: int, operator_id: int, rating: int, bot: Bot) -> bool:
         """Оценить работу оператора"""
-        if self.get_user_status(user_id) != UserStatus.RATING_OPERATOR:
+        if await self.fetch_user_status(user_id) != UserStatus.RATING_OPERATOR:
             return False
         
         # Сохраняем оценку
@@ -414,6 +874,10 @@ class OperatorHandler:
             last_session = self.session_history[user_id][-1]
             last_session["user_rating"] = rating
             last_session["rating_time"] = datetime.now()
+        await self._save_record(self._last_session_key(user_id), {
+            "user_rating": rating,
+            "rating_time": datetime.now(),
+        })
         
         # Обновляем рейтинг оператора
         operator_config = self.operator_manager.operators_config.get(operator_id)
@@ -427,7 +891,7 @@ class OperatorHandler:
             operator_config["total_sessions"] += 1
         
         # Возвращаем в нормальный статус
-        self.set_user_status(user_id, UserStatus.NORMAL)
+        await self.set_user_status(user_id, UserStatus.NORMAL)
         
         # Благодарим за оценку
         try:
@@ -445,14 +909,15 @@ class OperatorHandler:
     
     async def cancel_waiting(self, user_id: int, bot: Bot) -> Tuple[bool, str]:
         """Отменить ожидание оператора"""
-        if user_id not in self.waiting_queue:
+        if await self._claim_waiting_request(user_id) is None:
             return False, "Вы не находитесь в очереди ожидания"
         
-        self.waiting_queue.pop(user_id)
-        self.set_user_status(user_id, UserStatus.NORMAL)
+        await self.set_user_status(user_id, UserStatus.NORMAL)
         
-        # Перенумеровываем очередь
-        await self._reorder_queue()
+        offer = self.router.forget(user_id)
+        if offer is not None:
+            await self._close_offer(bot, offer, "🚫 Пользователь отменил запрос")
+            await self.dispatch(bot)
         
         return True, "Ожидание отменено"
     
@@ -466,7 +931,18 @@ class OperatorHandler:
             "waiting_count": total_waiting,
             "active_sessions": total_active,
             "active_operators": active_operators,
-            "queue_details": list(self.waiting_queue.values())
+            "pending_offers": len(self.router.offers),
+            "operators": [
+                {
+                    "operator_id": profile.operator_id,
+                    "name": profile.name,
+                    "load": self.router.load(profile.operator_id),
+                    "capacity": profile.capacity,
+                    "skills": sorted(profile.skills),
+                }
+                for profile in self.operator_manager.get_profiles()
+            ],
+            "queue_details": [self.waiting_queue[user_id] for user_id in self.queue_order]
         }
 
 # Создаем глобальный экземпляр
@@ -490,7 +966,7 @@ def register_operator_handlers(dp, bot):
         user_id = message.from_user.id
         
         # Проверяем текущий статус пользователя
-        status = operator_handler.get_user_status(user_id)
+        status = await operator_handler.fetch_user_status(user_id)
         
         if status == UserStatus.WAITING_OPERATOR:
             keyboard = InlineKeyboardMarkup(inline_keyboard=[
@@ -541,13 +1017,14 @@ def register_operator_handlers(dp, bot):
         
         if success:
             queue_info = operator_handler.get_queue_info()
+            queue_position = operator_handler.get_queue_position(user_id) or queue_info['waiting_count']
             keyboard = InlineKeyboardMarkup(inline_keyboard=[
                 [InlineKeyboardButton(text="❌ Отменить ожидание", callback_data="cancel_waiting")]
             ])
             
             await callback.message.edit_text(
                 f"✅ **Запрос отправлен консультантам!**\n\n"
-                f"📋 Ваше место в очереди: **{queue_info['waiting_count']}**\n"
+                f"📋 Ваше место в очереди: **{queue_position}**\n"
                 f"👥 Активных сессий: {queue_info['active_sessions']}\n"
                 f"🟢 Доступных консультантов: {queue_info['active_operators']}\n\n"
                 f"⏰ Ожидаемое время ответа: **2-5 минут**\n"
@@ -587,6 +1064,36 @@ def register_operator_handlers(dp, bot):
             logger.error(f"Ошибка принятия запроса: {e}")
             await callback.message.edit_text("❌ Ошибка при подключении к пользователю")
     
+    # Консультант передаёт предложенный запрос другому
+    @dp.callback_query(F.data.startswith("decline_request_"))
+    async def decline_request_callback(callback: types.CallbackQuery):
+        """Отказ консультанта от предложенного запроса"""
+        await callback.answer()
+        
+        try:
+            user_id = int(callback.data.split("_")[-1])
+            success, message_text = await operator_handler.decline_request(
+                callback.from_user.id, user_id, bot
+            )
+            await callback.message.edit_text(f"{'↪️' if success else '❌'} {message_text}")
+        except Exception as e:
+            logger.error(f"Ошибка передачи запроса: {e}")
+            await callback.message.edit_text("❌ Ошибка при передаче запроса")
+    
+    # Выбор диалога, в который уходят сообщения консультанта
+    @dp.callback_query(F.data.startswith("focus_session_"))
+    async def focus_session_callback(callback: types.CallbackQuery):
+        """Ответить конкретному пользователю"""
+        try:
+            user_id = int(callback.data.split("_")[-1])
+            success, message_text = await operator_handler.focus_session(
+                callback.from_user.id, user_id
+            )
+            await callback.answer(f"{'↩️' if success else '❌'} {message_text}")
+        except Exception as e:
+            logger.error(f"Ошибка выбора диалога: {e}")
+            await callback.answer("❌ Ошибка выбора диалога")
+    
     # Обработчик отмены ожидания
     @dp.callback_query(F.data == "cancel_waiting")
     async def cancel_waiting_callback(callback: types.CallbackQuery):
@@ -659,7 +1166,7 @@ def register_operator_handlers(dp, bot):
         user_id = callback.from_user.id
         
         if callback.data == "rate_skip":
-            operator_handler.set_user_status(user_id, UserStatus.NORMAL)
+            await operator_handler.set_user_status(user_id, UserStatus.NORMAL)
             await callback.message.edit_text(
                 "✅ Спасибо за обратную связь!\n\n"
                 "Если у вас есть другие вопросы, обращайтесь в любое время."
@@ -703,11 +1210,11 @@ def register_operator_handlers(dp, bot):
         """Обработка сообщений пользователей"""
         logger.info("Проверка handle_user_messages")
         user_id = message.from_user.id
-        status = operator_handler.get_user_status(user_id)
+        status = await operator_handler.fetch_user_status(user_id)
         
         # Если пользователь ожидает оператора, добавляем сообщение в историю
         if status == UserStatus.WAITING_OPERATOR:
-            operator_handler.add_user_message_to_history(
+            await operator_handler.add_user_message_to_history(
                 user_id, message.text, message.date
             )
         
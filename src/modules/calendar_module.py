@@ -1,40 +1,48 @@
-import json
+import asyncio
 import logging
-from datetime import datetime
+from datetime import date
 from typing import List, Dict, Optional
-import aiohttp
-from bs4 import BeautifulSoup
-import re
 
 from src.core.config import config
+from src.services.crawler import crawler
+from src.services.parsers.shift_documents import (
+    classify_document,
+    extract_shift_documents,
+    shorten_document_title,
+)
+from src.services.parsers.shift_repository import ShiftRecord, shift_repository
+from src.services.refresh import background_refresher
+from src.services.subscriptions import shift_updates_type, subscription_store
 
 from aiogram import F
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
 
 logger = logging.getLogger(__name__)
 
+# Источник фонового сбора документов смен (см. background_refresher)
+DOCUMENTS_SOURCE = "shift_documents"
+
 class CalendarModule:
     """Модуль календаря смен с документами"""
     
     def __init__(self):
-        self.shifts_file = config.data_dir/"parsers"/"current_shifts.json"
         self.base_url = "https://ndtp.by"
         self.schedule_url = "https://ndtp.by/educational-shifts/schedule/"
         
     def load_shifts_data(self) -> Optional[Dict]:
-        """Загружает данные о сменах"""
-        try:
-            with open(self.shifts_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception as e:
-            logger.error(f"❌ Ошибка загрузки данных о сменах: {e}")
-            return None
+        """Загружает данные о сменах (из общей модели в памяти)"""
+        return shift_repository.get_data()
     
     def create_shifts_calendar(self, user_id: int = None) -> tuple[str, InlineKeyboardMarkup]:
         """Создает календарь смен с кнопками"""
-        shifts_data = self.load_shifts_data()
+        # Документы понадобятся при нажатии на смену - собираем заранее
+        self.prefetch_documents()
+        return shift_repository.memoize('calendar', self._render_shifts_calendar)
+    
+    def _render_shifts_calendar(self) -> tuple[str, InlineKeyboardMarkup]:
+        shifts = shift_repository.get_records()
         
-        if not shifts_data or not shifts_data.get('shifts'):
+        if not shifts:
             return (
                 "❌ Информация о сменах временно недоступна.",
                 InlineKeyboardMarkup(inline_keyboard=[])
@@ -47,10 +55,9 @@ class CalendarModule:
         
         # Создаем кнопки для смен
         keyboard_rows = []
-        shifts = shifts_data['shifts']
         
         # Сортируем по номеру месяца
-        shifts_sorted = sorted(shifts, key=lambda x: x.get('month_number', 0))
+        shifts_sorted = sorted(shifts, key=lambda shift: shift.month_number)
         
         # Группируем по 2 кнопки в ряд
         for i in range(0, len(shifts_sorted), 2):
@@ -59,16 +66,16 @@ class CalendarModule:
             # Первая кнопка в ряду
             shift1 = shifts_sorted[i]
             row.append(InlineKeyboardButton(
-                text=f"🎓 {shift1['name']}",
-                callback_data=f"calendar_shift_{shift1['month_number']}"
+                text=f"🎓 {shift1.name}",
+                callback_data=f"calendar_shift_{shift1.month_number}"
             ))
             
             # Вторая кнопка в ряду (если есть)
             if i + 1 < len(shifts_sorted):
                 shift2 = shifts_sorted[i + 1]
                 row.append(InlineKeyboardButton(
-                    text=f"🎓 {shift2['name']}",
-                    callback_data=f"calendar_shift_{shift2['month_number']}"
+                    text=f"🎓 {shift2.name}",
+                    callback_data=f"calendar_shift_{shift2.month_number}"
                 ))
             
             keyboard_rows.append(row)
@@ -84,11 +91,9 @@ class CalendarModule:
         keyboard = InlineKeyboardMarkup(inline_keyboard=keyboard_rows)
         return text, keyboard
     
-    async def get_shift_details(self, month_number: int) -> tuple[str, InlineKeyboardMarkup]:
+    async def get_shift_details(self, month_number: int, user_id: int = None) -> tuple[str, InlineKeyboardMarkup]:
         """Получает детальную информацию о смене"""
-        shifts_data = self.load_shifts_data()
-        
-        if not shifts_data:
+        if shift_repository.get_data() is None:
             return (
                 "❌ Ошибка загрузки данных о смене.",
                 InlineKeyboardMarkup(inline_keyboard=[
@@ -97,11 +102,7 @@ class CalendarModule:
             )
         
         # Находим смену по номеру месяца
-        shift = None
-        for s in shifts_data['shifts']:
-            if s.get('month_number') == month_number:
-                shift = s
-                break
+        shift = shift_repository.get_by_month(month_number)
         
         if not shift:
             return (
@@ -111,41 +112,7 @@ class CalendarModule:
                 ])
             )
         
-        # Формируем информацию о смене
-        text_parts = [
-            f"📚 {shift['name']}",
-            f"📅 Период смены: {shift['start_date']} - {shift['end_date']}"
-        ]
-        
-        # Информация о приеме заявок
-        if shift.get('application_start_date') and shift.get('application_end_date'):
-            app_start = shift['application_start_date']
-            app_end = shift['application_end_date']
-            text_parts.append(f"📝 Прием заявок: с {app_start} по {app_end}")
-            
-            # Определяем статус приема заявок
-            try:
-                app_start_date = datetime.strptime(app_start, '%d.%m.%Y').date()
-                app_end_date = datetime.strptime(app_end, '%d.%m.%Y').date()
-                current_date = datetime.now().date()
-                
-                if current_date < app_start_date:
-                    status = f"⏳ Прием откроется {app_start}"
-                elif app_start_date <= current_date <= app_end_date:
-                    status = "🟢 Прием заявок открыт!"
-                else:
-                    status = "🔴 Прием заявок закрыт"
-                
-                text_parts.append(f"📊 Статус: {status}")
-            except Exception:
-                text_parts.append(f"📊 Статус: {shift.get('raw_status', 'Уточняется')}")
-        else:
-            text_parts.append(f"📊 Статус: {shift.get('raw_status', 'Подача заявок закрыта')}")
-        
-        text_parts.append("")
-        text_parts.append("📄 Доступные файлы:")
-        
-        text = "\n".join(text_parts)
+        text = shift_repository.memoize(('calendar_shift', month_number), lambda: self._render_shift_text(shift))
         
         # Получаем реальные документы с сайта
         documents = await self.get_shift_documents_real(month_number)
@@ -171,6 +138,16 @@ class CalendarModule:
                 )
             ])
         
+        # Подписка на изменения только этой смены
+        if user_id is not None:
+            watching = subscription_store.contains(shift_updates_type(month_number), user_id)
+            keyboard_rows.append([
+                InlineKeyboardButton(
+                    text="🔕 Не следить за сменой" if watching else "🔔 Следить за изменениями смены",
+                    callback_data=f"watch_shift_{month_number}"
+                )
+            ])
+        
         # Кнопка "Назад"
         keyboard_rows.append([
             InlineKeyboardButton(
@@ -183,177 +160,91 @@ class CalendarModule:
         
         return text, keyboard
     
-    async def get_shift_documents_real(self, month_number: int) -> List[Dict]:
-        """Получает список документов для конкретной смены с сайта"""
-        try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-            }
-            
-            async with aiohttp.ClientSession() as session:
-                async with session.get(self.schedule_url, headers=headers) as response:
-                    if response.status != 200:
-                        logger.error(f"❌ Ошибка запроса: {response.status}")
-                        return []
-                    
-                    html = await response.text()
-            
-            soup = BeautifulSoup(html, 'html.parser')
-            
-            # Ищем панель с нужной сменой
-            panels = soup.find_all('div', class_='fusion-panel')
-            
-            shift_names = {
-                1: "Январская", 2: "Февральская", 3: "Мартовская", 4: "Апрельская",
-                5: "Майская", 6: "Июньская", 7: "Июльская", 8: "Августовская",
-                9: "Сентябрьская", 10: "Октябрьская", 11: "Ноябрьская", 12: "Декабрьская"
-            }
-            
-            target_shift_name = shift_names.get(month_number, "")
-            documents = []
+    def _render_shift_text(self, shift: ShiftRecord) -> str:
+        """Текст карточки смены (статус приема заявок - на сегодня)"""
+        text_parts = [
+            f"📚 {shift.name}",
+            f"📅 Период смены: {shift.start_date} - {shift.end_date}"
+        ]
+        
+        # Информация о приеме заявок
+        if shift.has_application_period:
+            text_parts.append(f"📝 Прием заявок: с {shift.application_start_date} по {shift.application_end_date}")
             
-            for panel in panels:
-                title_elem = panel.find('span', class_='fusion-toggle-heading')
-                if not title_elem:
-                    continue
-                
-                title_text = title_elem.get_text()
-                if target_shift_name not in title_text:
-                    continue
-                
-                # Ищем контент панели
-                content = panel.find('div', class_='panel-body')
-                if not content:
-                    # Попробуем найти контент по другому селектору
-                    content = panel.find('div', class_='fusion-toggle-content')
-                
-                if not content:
-                    continue
-                
-                logger.info(f"🔍 Ищем документы для {target_shift_name} смены...")
-                
-                # Ищем все ссылки в контенте
-                links = content.find_all('a', href=True)
-                logger.info(f"📋 Найдено ссылок в панели: {len(links)}")
+            # Определяем статус приема заявок
+            if shift.application_start is not None and shift.application_end is not None:
+                current_date = date.today()
                 
-                for link in links:
-                    href = link.get('href', '')
-                    text = link.get_text(strip=True)
-                    
-                    # Пропускаем пустые ссылки
-                    if not text or not href:
-                        continue
-                    
-                    # Фильтруем ссылки на документы PDF и DOC
-                    is_document = (
-                        href.endswith('.pdf') or 
-                        href.endswith('.doc') or 
-                        href.endswith('.docx') or
-                        any(keyword in text.lower() for keyword in [
-                            'положение', 'список', 'состав', 'участник', 
-                            'место', 'проведение', 'зачисл', 'смен', 'группа'
-                        ])
-                    )
-                    
-                    if is_document:
-                        # Формируем полную ссылку
-                        if href.startswith('/'):
-                            full_url = self.base_url + href
-                        elif href.startswith('http'):
-                            full_url = href
-                        else:
-                            full_url = self.base_url + '/' + href
-                        
-                        # Очищаем название документа
-                        clean_title = text.replace('\n', ' ').replace('\t', ' ')
-                        clean_title = re.sub(r'\s+', ' ', clean_title).strip()
-                        
-                        # Сокращаем название документа
-                        short_title = self._shorten_document_title(clean_title)
-                        
-                        documents.append({
-                            'title': short_title,
-                            'url': full_url,
-                            'type': self._classify_document(text)
-                        })
-                        
-                        logger.info(f"📄 Найден документ: {short_title}")
+                if current_date < shift.application_start:
+                    status = f"⏳ Прием откроется {shift.application_start_date}"
+                elif current_date <= shift.application_end:
+                    status = "🟢 Прием заявок открыт!"
+                else:
+                    status = "🔴 Прием заявок закрыт"
                 
-                # Если нашли панель с нужной сменой, выходим
-                if documents:
-                    break
-            
-            logger.info(f"📄 Найдено документов для {target_shift_name} смены: {len(documents)}")
-            return documents
-            
-        except Exception as e:
-            logger.error(f"❌ Ошибка получения документов: {e}")
-            return []
+                text_parts.append(f"📊 Статус: {status}")
+            else:
+                text_parts.append(f"📊 Статус: {shift.raw_status or 'Уточняется'}")
+        else:
+            text_parts.append(f"📊 Статус: {shift.raw_status or 'Подача заявок закрыта'}")
+        
+        text_parts.append("")
+        text_parts.append("📄 Доступные файлы:")
+        
+        return "\n".join(text_parts)
+    
+    async def get_shift_documents_real(self, month_number: int) -> List[Dict]:
+        """
+        Документы смены (собираются при обновлении расписания)
+        
+        Если документы ещё не собирались, они извлекаются со страницы
+        расписания один раз для всех смен.
+        """
+        documents = shift_repository.get_documents(month_number)
+        if documents is None:
+            self.prefetch_documents()
+            await background_refresher.wait(DOCUMENTS_SOURCE)
+            documents = shift_repository.get_documents(month_number)
+        return list(documents or ())
+    
+    def prefetch_documents(self) -> bool:
+        """Запустить фоновый сбор документов смен, если их ещё нет в памяти"""
+        if shift_repository.has_documents():
+            return False
+        return background_refresher.trigger(DOCUMENTS_SOURCE, self._collect_documents)
+    
+    async def _collect_documents(self) -> bool:
+        """Собрать документы всех смен со страницы расписания"""
+        # Страница расписания общая с парсером смен: загружается и
+        # разбирается один раз на версию
+        soup = await crawler.soup(self.schedule_url)
+        if soup is None:
+            return False
+        documents = await asyncio.to_thread(extract_shift_documents, soup)
+        shift_repository.set_documents(documents)
+        return True
     
     def _classify_document(self, title: str) -> str:
         """Классифицирует тип документа"""
-        title_lower = title.lower()
-        
-        if 'положение' in title_lower:
-            return 'regulation'
-        elif 'список' in title_lower and 'участник' in title_lower:
-            return 'participants_list'
-        elif 'место' in title_lower and 'проведение' in title_lower:
-            return 'venues'
-        elif 'зачисл' in title_lower:
-            return 'enrolled_list'
-        else:
-            return 'other'
+        return classify_document(title)
     
     def _shorten_document_title(self, title: str) -> str:
         """Сокращает название документа для красивого отображения"""
-        title_lower = title.lower()
-        
-        # Положение об образовательной смене - оставляем как есть
-        if 'положение' in title_lower and 'образовательн' in title_lower:
-            return "Положение об образовательной смене"
-        
-        # Список участников, допущенных ко второму этапу
-        if ('список' in title_lower or 'состав' in title_lower) and \
-           ('участник' in title_lower) and \
-           ('допущ' in title_lower or 'втор' in title_lower or '2' in title):
-            return "Список участников 2 этапа"
-        
-        # Места проведения - оставляем как есть
-        if 'место' in title_lower and 'проведен' in title_lower:
-            return "Места проведения"
-        
-        # Список зачисленных в НДТП
-        if ('список' in title_lower or 'состав' in title_lower) and \
-           ('зачислен' in title_lower or 'групп' in title_lower) and \
-           ('технопарк' in title_lower or 'ндтп' in title_lower):
-            return "Список зачисленных в НДТП"
-        
-        # Если ничего не подошло, оставляем оригинальное название, но укорачиваем
-        if len(title) > 45:
-            return title[:42] + "..."
-        
-        return title
+        return shorten_document_title(title)
     
     def get_shift_status_emoji(self, shift: Dict) -> str:
         """Возвращает эмодзи статуса смены"""
-        try:
-            if not shift.get('application_start_date'):
-                return "📅"
-            
-            app_start = datetime.strptime(shift['application_start_date'], '%d.%m.%Y').date()
-            app_end = datetime.strptime(shift['application_end_date'], '%d.%m.%Y').date()
-            current_date = datetime.now().date()
-            
-            if current_date < app_start:
-                return "⏳"
-            elif app_start <= current_date <= app_end:
-                return "🟢"
-            else:
-                return "🔴"
-        except Exception:
+        record = ShiftRecord.from_dict(shift)
+        if record.application_start is None or record.application_end is None:
             return "📅"
+        
+        current_date = date.today()
+        if current_date < record.application_start:
+            return "⏳"
+        elif current_date <= record.application_end:
+            return "🟢"
+        else:
+            return "🔴"
 
 # Глобальный экземпляр модуля
 calendar_module = CalendarModule()
@@ -384,7 +275,7 @@ def register_calendar_hadler(dp):
         
         try:
             month_number = int(callback.data.split("_")[2])
-            text, keyboard = await get_shift_info(month_number)
+            text, keyboard = await get_shift_info(month_number, callback.from_user.id)
             await callback.message.edit_text(text, reply_markup=keyboard)
             await callback.answer()
         except (ValueError, IndexError) as e:
@@ -394,6 +285,35 @@ def register_calendar_hadler(dp):
             logger.error(f"❌ Ошибка получения информации о смене: {e}")
             await callback.answer("❌ Ошибка загрузки информации", show_alert=True)
     
+    @dp.callback_query(F.data.startswith("watch_shift_"))
+    async def handle_watch_shift(callback: CallbackQuery):
+        """Подписать/отписать от изменений одной смены"""
+        from src.handlers.notification_system import notification_system
+        
+        if not config.enable_calendar:
+            await callback.answer("❌ Система уведомлений временно недоступна", show_alert=True)
+            return
+        
+        try:
+            month_number = int(callback.data[len("watch_shift_"):])
+            user_id = callback.from_user.id
+            notification_type = shift_updates_type(month_number)
+            if notification_system.is_subscribed(user_id, notification_type):
+                await notification_system.unsubscribe_user(user_id, notification_type)
+                answer = "🔕 Вы больше не следите за сменой"
+            else:
+                await notification_system.subscribe_user(user_id, notification_type)
+                answer = "🔔 Пришлем уведомление, если смена изменится"
+            text, keyboard = await get_shift_info(month_number, user_id)
+            await callback.message.edit_text(text, reply_markup=keyboard)
+            await callback.answer(answer)
+        except ValueError as e:
+            logger.error(f"❌ Ошибка парсинга данных смены: {e}")
+            await callback.answer("❌ Ошибка обработки запроса", show_alert=True)
+        except Exception as e:
+            logger.error(f"❌ Ошибка изменения подписки на смену: {e}")
+            await callback.answer("❌ Ошибка изменения настроек", show_alert=True)
+    
     @dp.callback_query(F.data == "notification_settings")
     async def handle_notification_settings(callback: CallbackQuery):
         """Показать настройки уведомлений"""
@@ -409,14 +329,44 @@ def register_calendar_hadler(dp):
         except Exception as e:
             logger.error(f"❌ Ошибка показа настроек уведомлений: {e}")
             await callback.answer("❌ Ошибка загрузки настроек", show_alert=True)
+    
+    @dp.callback_query(F.data.startswith("toggle_notification_"))
+    async def handle_toggle_notification(callback: CallbackQuery):
+        """Подписать/отписать от уведомлений выбранного типа"""
+        from src.handlers.notification_system import notification_system
+        from src.services.subscriptions import NOTIFICATION_TYPES
+        
+        if not config.enable_calendar:
+            await callback.answer("❌ Система уведомлений временно недоступна", show_alert=True)
+            return
+        
+        notification_type = callback.data[len("toggle_notification_"):]
+        if notification_type not in NOTIFICATION_TYPES:
+            await callback.answer("❌ Неизвестный тип уведомлений", show_alert=True)
+            return
+        
+        try:
+            user_id = callback.from_user.id
+            if notification_system.is_subscribed(user_id, notification_type):
+                await notification_system.unsubscribe_user(user_id, notification_type)
+                answer = "🔕 Уведомления отключены"
+            else:
+                await notification_system.subscribe_user(user_id, notification_type)
+                answer = "🔔 Уведомления включены"
+            text, keyboard = get_notification_settings_interface(user_id)
+            await callback.message.edit_text(text, reply_markup=keyboard)
+            await callback.answer(answer)
+        except Exception as e:
+            logger.error(f"❌ Ошибка изменения подписки: {e}")
+            await callback.answer("❌ Ошибка изменения настроек", show_alert=True)
 # Функции для интеграции с ботом
 def get_calendar_interface(user_id: int = None):
     """Возвращает интерфейс календаря"""
     return calendar_module.create_shifts_calendar(user_id)
 
-async def get_shift_info(month_number: int):
+async def get_shift_info(month_number: int, user_id: int = None):
     """Возвращает информацию о конкретной смене"""
-    return await calendar_module.get_shift_details(month_number)
+    return await calendar_module.get_shift_details(month_number, user_id)
 
 async def get_shift_documents_async(month_number: int):
     """Асинхронно получает документы смены"""
@@ -436,7 +386,9 @@ def get_notification_settings_interface(user_id: int) -> tuple[str, InlineKeyboa
         "",
         "📅 Обновления расписания - уведомления об изменениях в расписании смен (новые даты, документы, статусы)",
         "",
-        "⏰ Напоминания о дедлайнах - уведомления о начале и окончании приема заявок на смены"
+        "⏰ Напоминания о дедлайнах - уведомления о начале и окончании приема заявок на смены",
+        "",
+        "🔍 Чтобы получать изменения только нужных смен, откройте смену в календаре и нажмите «Следить за изменениями смены»"
     ]
     
     text = "\n".join(text_parts)
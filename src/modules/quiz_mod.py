@@ -20,6 +20,7 @@ from aiogram.utils.keyboard import InlineKeyboardBuilder
 from tenacity import retry, stop_after_attempt, wait_exponential
 
 from src.core.config import config
+from src.core.state_backend import get_state_backend
 
 logger = logging.getLogger(__name__)
 
@@ -102,8 +103,9 @@ class QuizState(StatesGroup):
 # Семафор для ограничения параллельных квизов
 QUIZ_SEMAPHORE = asyncio.Semaphore(3)
 
-# Хранилище квот пользователей (в реальном проекте использовать Redis)
-user_quiz_quota = {}
+# Квоты живут двое суток, чтобы пережить смену дня в любом часовом поясе
+QUIZ_QUOTA_TTL = 2 * 24 * 3600
+QUIZ_DAILY_LIMIT = 2
 
 # Загрузка системного промпта
 def load_system_prompt() -> str:
@@ -120,32 +122,26 @@ def load_system_prompt() -> str:
 
 SYSTEM_PROMPT = load_system_prompt()
 
+def _quota_key(user_id: int) -> str:
+    """Ключ дневной квоты квизов пользователя"""
+    return f"quiz:{user_id}:{datetime.now():%Y%m%d}"
+
 async def check_user_quota(user_id: int) -> bool:
     """Проверяет квоту пользователя (2 квиза в день)"""
-    today = datetime.now().date()
-    user_key = f"quiz_runs:{user_id}"
-    
-    if user_key not in user_quiz_quota:
-        user_quiz_quota[user_key] = {"date": today, "count": 0}
-    
-    user_data = user_quiz_quota[user_key]
-    
-    # Сбрасываем счетчик если новый день
-    if user_data["date"] != today:
-        user_data["date"] = today
-        user_data["count"] = 0
+    try:
+        used = int(await get_state_backend().get(_quota_key(user_id)) or 0)
+    except Exception as e:
+        logger.error(f"❌ Ошибка чтения квоты квиза пользователя {user_id}: {e}")
+        return True
     
-    return user_data["count"] < 2
+    return used < QUIZ_DAILY_LIMIT
 
 async def increment_user_quota(user_id: int):
     """Увеличивает счетчик квизов пользователя"""
-    today = datetime.now().date()
-    user_key = f"quiz_runs:{user_id}"
-    
-    if user_key not in user_quiz_quota:
-        user_quiz_quota[user_key] = {"date": today, "count": 0}
-    
-    user_quiz_quota[user_key]["count"] += 1
+    try:
+        await get_state_backend().incr(_quota_key(user_id), ttl=QUIZ_QUOTA_TTL)
+    except Exception as e:
+        logger.error(f"❌ Ошибка записи квоты квиза пользователя {user_id}: {e}")
 
 async def ask_llm(history: list) -> Optional[str]:
     """Отправляет запрос к DeepSeek API и возвращает ответ"""
@@ -412,11 +408,17 @@ async def handle_quiz_off_topic(message: Message, state: FSMContext, bot: Bot):
         "Пожалуйста, ответь на текущий вопрос или используй /cancel для отмены квиза."
     )
 
-def get_quiz_stats() -> Dict[str, Any]:
-    """Возвращает статистику квиза"""
-    total_users = len(user_quiz_quota)
-    today_users = sum(1 for data in user_quiz_quota.values() 
-                     if data["date"] == datetime.now().date())
+async def get_quiz_stats() -> Dict[str, Any]:
+    """Возвращает статистику квиза (по ключам квот в хранилище - общая для всех воркеров)"""
+    total_users = today_users = 0
+    try:
+        # Ключи квот живут QUIZ_QUOTA_TTL: всего - пользователи за этот срок
+        keys = await get_state_backend().scan_keys("quiz:*")
+        today = f"{datetime.now():%Y%m%d}"
+        total_users = len({key.split(":")[1] for key in keys})
+        today_users = sum(1 for key in keys if key.endswith(f":{today}"))
+    except Exception as e:
+        logger.error(f"❌ Ошибка чтения статистики квиза: {e}")
     
     return {
         "total_users": total_users,
@@ -472,10 +474,10 @@ def register_quiz_handlers(dp, bot: Bot):
     # Команда статистики квиза
     @dp.message(F.text == "/quiz_stats")
     async def quiz_stats_command(message: Message):
-        stats = get_quiz_stats()
+        stats = await get_quiz_stats()
         await message.answer(
             f"📊 **Статистика квиза:**\n\n"
-            f"👥 Всего пользователей: {stats['total_users']}\n"
+            f"👥 Пользователей за двое суток: {stats['total_users']}\n"
             f"📅 Сегодня прошли: {stats['today_users']}\n"
             f"🔄 Активных квизов: {3 - stats['active_quizzes']}/3\n"
             f"🧠 DeepSeek доступен: {'✅' if stats['deepseek_available'] else '❌'}"
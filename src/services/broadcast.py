@@ -0,0 +1,371 @@
+"""
+Рассылки уведомлений подписчикам
+
+BroadcastEngine отправляет одно сообщение списку пользователей:
+
+- несколько параллельных отправок, общий темп ограничен token bucket
+  (по умолчанию 25 сообщений/с - ниже лимита Telegram ~30/с);
+- TelegramRetryAfter приостанавливает всю рассылку на указанное время,
+  сообщение повторяется;
+- пользователи, заблокировавшие бота, передаются обработчику on_blocked
+  (отписка) и больше не получают сообщений;
+- прогресс сохраняется в notifications_dir/broadcasts (файл на ключ
+  рассылки): после перезапуска незавершённая рассылка продолжается с того же места, а
+  завершённая с тем же ключом повторно не отправляется;
+- в лог пишется скорость и оценка оставшегося времени.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramAPIError,
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+
+from src.core.config import config
+from src.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Попыток на одного получателя при сетевых ошибках и RetryAfter
+MAX_ATTEMPTS = 3
+# Как часто сохранять прогресс и писать его в лог (сек)
+CHECKPOINT_INTERVAL = 2.0
+PROGRESS_LOG_INTERVAL = 10.0
+# Сколько дней хранить файлы завершённых рассылок (ключи идемпотентности)
+KEEP_FINISHED_DAYS = 60
+
+BlockedHandler = Callable[[int], None]
+
+
+@dataclass
+class BroadcastReport:
+    """Итог рассылки"""
+
+    key: str
+    total: int
+    sent: int = 0
+    failed: int = 0
+    blocked: int = 0
+    status: str = "running"
+    elapsed: float = 0.0
+    # Рассылка с этим ключом уже была завершена раньше
+    duplicate: bool = False
+
+    @property
+    def done(self) -> int:
+        return self.sent + self.failed + self.blocked
+
+
+class TokenBucket:
+    """
+    Ограничение темпа: rate токенов в секунду, запас не больше capacity
+
+    По умолчанию запас - один токен: отправки идут равномерно, без всплеска
+    в начале рассылки.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float) -> None:
+        """Не выдавать токены seconds секунд (после RetryAfter)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class _Checkpoint:
+    """Состояние рассылки на диске"""
+
+    def __init__(self, path: Path, key: str, text: str, recipients: List[int]):
+        self.path = path
+        self.key = key
+        self.text = text
+        self.recipients = recipients
+        self.processed: Set[int] = set()
+        self.report = BroadcastReport(key=key, total=len(recipients))
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+
+    @classmethod
+    def load(cls, path: Path) -> "_Checkpoint":
+        data = json.loads(path.read_text(encoding='utf-8'))
+        checkpoint = cls(path, data['key'], data['text'], data['recipients'])
+        checkpoint.processed = set(data.get('processed', []))
+        checkpoint.report = BroadcastReport(**data['report'])
+        checkpoint.created_at = data.get('created_at', checkpoint.created_at)
+        checkpoint.finished_at = data.get('finished_at')
+        return checkpoint
+
+    def save(self) -> None:
+        data = {
+            'key': self.key,
+            'text': self.text,
+            'recipients': self.recipients,
+            'processed': sorted(self.processed),
+            'report': asdict(self.report),
+            'created_at': self.created_at,
+            'finished_at': self.finished_at,
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps(data, ensure_ascii=False), encoding='utf-8')
+        os.replace(tmp_path, self.path)
+
+    @property
+    def finished(self) -> bool:
+        return self.report.status != "running"
+
+
+class BroadcastEngine:
+    """Параллельные рассылки с ограничением темпа и продолжением после сбоя"""
+
+    def __init__(self, directory: Path, rate: float, concurrency: int):
+        self.directory = Path(directory)
+        self.concurrency = concurrency
+        self.bucket = TokenBucket(rate)
+        self.bot: Optional[Bot] = None
+        self.on_blocked: Optional[BlockedHandler] = None
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._active: Dict[str, BroadcastReport] = {}
+
+    def set_bot(self, bot: Bot, on_blocked: Optional[BlockedHandler] = None) -> None:
+        """Бот для отправки и обработчик пользователей, заблокировавших бота"""
+        self.bot = bot
+        self.on_blocked = on_blocked
+
+    def _path(self, key: str) -> Path:
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:20]
+        return self.directory / f"{digest}.json"
+
+    def _load_checkpoint(self, key: str) -> Optional[_Checkpoint]:
+        path = self._path(key)
+        if not path.exists():
+            return None
+        try:
+            return _Checkpoint.load(path)
+        except Exception as e:
+            logger.error(f"❌ Повреждён файл рассылки {key}: {e}")
+            return None
+
+    def is_finished(self, key: str) -> bool:
+        """Была ли рассылка с этим ключом завершена"""
+        checkpoint = self._load_checkpoint(key)
+        return checkpoint is not None and checkpoint.finished
+
+    # === ОТПРАВКА ===
+
+    async def _send_one(self, user_id: int, text: str, report: BroadcastReport) -> None:
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            await self.bucket.acquire()
+            try:
+                await self.bot.send_message(user_id, text)
+                report.sent += 1
+                return
+            except TelegramRetryAfter as e:
+                logger.warning(f"⏳ Telegram просит подождать {e.retry_after} с (рассылка {report.key})")
+                metrics.inc("ndtp_broadcast_retry_after_total", "Ответы RetryAfter при рассылках")
+                self.bucket.pause(e.retry_after)
+            except TelegramForbiddenError:
+                report.blocked += 1
+                await self._forget(user_id)
+                return
+            except TelegramBadRequest as e:
+                # Чат удалён или недоступен - повторять бессмысленно
+                if "chat not found" in str(e).lower():
+                    report.blocked += 1
+                    await self._forget(user_id)
+                else:
+                    report.failed += 1
+                    logger.warning(f"⚠️ Не удалось отправить уведомление пользователю {user_id}: {e}")
+                return
+            except (TelegramNetworkError, TelegramServerError) as e:
+                if attempt == MAX_ATTEMPTS:
+                    break
+                logger.debug(f"🔁 Повтор отправки пользователю {user_id}: {e}")
+                await asyncio.sleep(attempt)
+            except TelegramAPIError as e:
+                report.failed += 1
+                logger.warning(f"⚠️ Не удалось отправить уведомление пользователю {user_id}: {e}")
+                return
+
+        report.failed += 1
+        logger.warning(f"⚠️ Не удалось отправить уведомление пользователю {user_id} за {MAX_ATTEMPTS} попытки")
+
+    async def _forget(self, user_id: int) -> None:
+        """Пользователь заблокировал бота - больше ему не пишем"""
+        logger.info(f"🚫 Пользователь {user_id} заблокировал бота, подписки удалены")
+        if self.on_blocked is not None:
+            try:
+                # Обработчик пишет на диск - вне event loop
+                await asyncio.to_thread(self.on_blocked, user_id)
+            except Exception as e:
+                logger.error(f"❌ Ошибка удаления подписок пользователя {user_id}: {e}")
+
+    async def _run(self, checkpoint: _Checkpoint) -> BroadcastReport:
+        report = checkpoint.report
+        pending = [user_id for user_id in checkpoint.recipients if user_id not in checkpoint.processed]
+        self._active[checkpoint.key] = report
+        started = time.monotonic()
+        done_at_start = report.done
+        last_saved = last_logged = started
+        queue = iter(pending)
+
+        if checkpoint.processed:
+            logger.info(f"▶️ Продолжение рассылки {checkpoint.key}: осталось {len(pending)} из {report.total}")
+
+        async def worker() -> None:
+            nonlocal last_saved, last_logged
+            for user_id in queue:
+                await self._send_one(user_id, checkpoint.text, report)
+                checkpoint.processed.add(user_id)
+
+                now = time.monotonic()
+                if now - last_saved >= CHECKPOINT_INTERVAL:
+                    last_saved = now
+                    await asyncio.to_thread(checkpoint.save)
+                if now - last_logged >= PROGRESS_LOG_INTERVAL:
+                    last_logged = now
+                    self._log_progress(report, report.done - done_at_start, now - started)
+
+        try:
+            await asyncio.gather(*(worker() for _ in range(min(self.concurrency, len(pending)) or 1)))
+            report.status = "done"
+            checkpoint.finished_at = time.time()
+        finally:
+            report.elapsed += time.monotonic() - started
+            self._active.pop(checkpoint.key, None)
+            # При отмене (остановка бота) прогресс тоже сохраняется
+            checkpoint.save()
+
+        metrics.inc("ndtp_broadcast_messages_total", "Отправленные сообщения рассылок", report.sent)
+        logger.info(
+            f"📬 Рассылка {report.key} завершена: отправлено {report.sent}/{report.total}, "
+            f"ошибок {report.failed}, заблокировали бота {report.blocked}, {report.elapsed:.1f} с"
+        )
+        return report
+
+    @staticmethod
+    def _log_progress(report: BroadcastReport, processed: int, elapsed: float) -> None:
+        speed = processed / elapsed if elapsed > 0 else 0.0
+        remaining = report.total - report.done
+        eta = f"{remaining / speed:.0f} с" if speed > 0 else "—"
+        logger.info(
+            f"📨 Рассылка {report.key}: {report.done}/{report.total}, "
+            f"{speed:.1f} сообщ/с, осталось ~{eta}"
+        )
+
+    async def broadcast(self, key: str, text: str, recipients: Iterable[int]) -> BroadcastReport:
+        """
+        Разослать text получателям и дождаться окончания
+
+        Args:
+            key: ключ идемпотентности - завершённая рассылка с тем же ключом
+                не повторяется, незавершённая продолжается, идущая не
+                запускается второй раз
+        """
+        return await asyncio.shield(self.start(key, text, recipients))
+
+    def start(self, key: str, text: str, recipients: Iterable[int]) -> asyncio.Task:
+        """Запустить рассылку фоновой задачей (одна задача на ключ)"""
+        task = self._tasks.get(key)
+        if task is None or task.done():
+            task = asyncio.create_task(self._broadcast(key, text, list(recipients)), name=f"broadcast:{key}")
+            self._tasks[key] = task
+            task.add_done_callback(self._task_done)
+        return task
+
+    async def _broadcast(self, key: str, text: str, recipients: List[int]) -> BroadcastReport:
+        if self.bot is None:
+            raise RuntimeError("Бот для рассылок не установлен")
+
+        checkpoint = self._load_checkpoint(key)
+        if checkpoint is not None and checkpoint.finished:
+            logger.info(f"⏭️ Рассылка {key} уже выполнена, повтор пропущен")
+            checkpoint.report.duplicate = True
+            return checkpoint.report
+        if checkpoint is None:
+            # Порядок сохраняется, повторы убираются
+            checkpoint = _Checkpoint(self._path(key), key, text, list(dict.fromkeys(recipients)))
+            await asyncio.to_thread(checkpoint.save)
+            logger.info(f"📣 Рассылка {key}: {checkpoint.report.total} получателей")
+
+        return await self._run(checkpoint)
+
+    def _task_done(self, task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"❌ Ошибка рассылки {task.get_name()}: {task.exception()}")
+
+    def resume_pending(self) -> int:
+        """Продолжить рассылки, прерванные остановкой бота; удалить старые завершённые"""
+        if not self.directory.exists():
+            return 0
+        resumed = 0
+        expire_before = time.time() - KEEP_FINISHED_DAYS * 86400
+        for path in self.directory.glob("*.json"):
+            try:
+                checkpoint = _Checkpoint.load(path)
+            except Exception as e:
+                logger.error(f"❌ Повреждён файл рассылки {path.name}: {e}")
+                continue
+            if not checkpoint.finished:
+                self.start(checkpoint.key, checkpoint.text, checkpoint.recipients)
+                resumed += 1
+            elif (checkpoint.finished_at or checkpoint.created_at) < expire_before:
+                path.unlink(missing_ok=True)
+        if resumed:
+            logger.info(f"▶️ Продолжено прерванных рассылок: {resumed}")
+        return resumed
+
+    def get_stats(self) -> Dict[str, Dict]:
+        """Идущие рассылки"""
+        return {key: asdict(report) for key, report in self._active.items()}
+
+    async def shutdown(self) -> None:
+        """Остановить идущие рассылки (прогресс сохраняется)"""
+        tasks = [task for task in self._tasks.values() if not task.done()]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+            logger.info(f"💾 Прервано рассылок: {len(tasks)}, продолжатся после запуска")
+        self._tasks.clear()
+
+
+# Глобальный экземпляр
+broadcast_engine = BroadcastEngine(
+    config.notifications_dir / "broadcasts",
+    rate=config.broadcast_rate,
+    concurrency=config.broadcast_concurrency,
+)
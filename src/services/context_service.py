@@ -6,6 +6,7 @@ from typing import Optional
 
 from ..core.config import config
 from ..core.constants import DOCUMENT_KEYWORDS, SCHEDULE_KEYWORDS
+from ..core.metrics import stage_timer
 from ..utils.helpers import is_context_related_to_keywords
 
 logger = logging.getLogger(__name__)
@@ -47,23 +48,32 @@ async def get_enhanced_context(query: str) -> str:
     Returns:
         Контекст для ответа ИИ
     """
+    with stage_timer("context_total"):
+        return await _build_enhanced_context(query)
+
+
+async def _build_enhanced_context(query: str) -> str:
+    """Сборка контекста: база знаний + расписание + документы"""
     try:
         # Получаем базовый контекст из лучшей доступной RAG системы
-        base_context = await _get_best_rag_context(query)
+        with stage_timer("context_rag"):
+            base_context = await _get_best_rag_context(query)
         
         enhanced_contexts = []
 
         # Проверяем, связан ли запрос с расписанием/сменами
         if is_context_related_to_keywords(query, SCHEDULE_KEYWORDS):
-            logger.info("📅 Запрос связан с расписанием - добавляем актуальную информацию")
-            schedule_context = await _get_schedule_context(query)
+            logger.debug("📅 Запрос связан с расписанием - добавляем актуальную информацию")
+            with stage_timer("context_schedule"):
+                schedule_context = await _get_schedule_context(query)
             if schedule_context:
                 enhanced_contexts.append(schedule_context)
 
         # Проверяем, связан ли запрос с документами
         if is_context_related_to_keywords(query, DOCUMENT_KEYWORDS):
-            logger.info("📄 Запрос связан с документами - добавляем актуальную информацию")
-            documents_context = await _get_documents_context(query)
+            logger.debug("📄 Запрос связан с документами - добавляем актуальную информацию")
+            with stage_timer("context_documents"):
+                documents_context = await _get_documents_context(query)
             if documents_context:
                 enhanced_contexts.append(documents_context)
 
@@ -74,10 +84,10 @@ async def get_enhanced_context(query: str) -> str:
             else:
                 final_context = "\n\n".join(enhanced_contexts)
 
-            logger.info("✅ Контекст обогащен дополнительной информацией")
+            logger.debug("✅ Контекст обогащен дополнительной информацией")
             return final_context
         else:
-            logger.info("📚 Используем только базовый контекст")
+            logger.debug("📚 Используем только базовый контекст")
             return base_context
 
     except Exception as e:
@@ -88,7 +98,7 @@ async def get_enhanced_context(query: str) -> str:
 
 async def _get_best_rag_context(query: str) -> str:
     """Получить контекст из базовой RAG системы"""
-    logger.info("📖 Используем базовую RAG систему")
+    logger.debug("📖 Используем базовую RAG систему")
     if basic_rag and BASIC_RAG_AVAILABLE:
         return basic_rag.get_context_for_query(query)
     else:
@@ -0,0 +1,249 @@
+"""
+Общий загрузчик страниц сайта технопарка
+
+Все парсеры (расписание, документы, учащиеся, списки) и календарь берут
+страницы ndtp.by через один SiteCrawler:
+
+- одна сессия aiohttp с пулом соединений;
+- повторная проверка страницы условным GET (If-None-Match /
+  If-Modified-Since) - при 304 тело не скачивается;
+- ответы хранятся на диске (cache_dir/http), поэтому после перезапуска
+  бот сразу ревалидирует, а при недоступности сайта отдаёт последнюю
+  сохранённую версию;
+- HTML каждой версии страницы разбирается один раз, дерево отдаётся всем
+  потребителям. Дерево общее - его нельзя изменять (decompose, extract и т.п.).
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import aiohttp
+from bs4 import BeautifulSoup
+
+from src.core.config import config
+from src.utils.cache import TTLCache
+
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = 'lxml'
+except ImportError:
+    HTML_PARSER = 'html.parser'
+
+logger = logging.getLogger(__name__)
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+}
+DEFAULT_TIMEOUT = 30
+# Разобранных деревьев в памяти (страниц у сайта немного)
+TREE_CACHE_SIZE = 16
+
+
+@dataclass(frozen=True)
+class Page:
+    """Версия страницы: тело, валидаторы HTTP и хэш содержимого"""
+
+    url: str
+    text: str
+    version: str
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    fetched_at: float = 0.0
+
+
+class SiteCrawler:
+    """Загрузка страниц сайта с условными запросами и кэшем разобранных деревьев"""
+
+    def __init__(self, cache_dir: Path, fresh_for: float, max_connections: int):
+        self.cache_dir = Path(cache_dir)
+        self.fresh_for = fresh_for
+        self.max_connections = max_connections
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._pages: Dict[str, Page] = {}
+        self._checked_at: Dict[str, float] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._trees = TTLCache(maxsize=TREE_CACHE_SIZE, ttl=0)
+        self._stats = {
+            'requests': 0, 'not_modified': 0, 'downloaded': 0, 'fresh_hits': 0,
+            'errors': 0, 'stale_served': 0, 'parses': 0,
+        }
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                headers=HEADERS,
+                connector=aiohttp.TCPConnector(limit_per_host=self.max_connections),
+            )
+        return self._session
+
+    def _lock(self, url: str) -> asyncio.Lock:
+        lock = self._locks.get(url)
+        if lock is None:
+            lock = self._locks[url] = asyncio.Lock()
+        return lock
+
+    # === ДИСКОВЫЙ КЭШ ===
+
+    def _cache_paths(self, url: str) -> Tuple[Path, Path]:
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()[:20]
+        return self.cache_dir / f"{key}.json", self.cache_dir / f"{key}.html"
+
+    def _read_cached(self, url: str) -> Optional[Page]:
+        meta_path, body_path = self._cache_paths(url)
+        try:
+            meta = json.loads(meta_path.read_text(encoding='utf-8'))
+            text = body_path.read_text(encoding='utf-8')
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"⚠️ Повреждён кэш страницы {url}: {e}")
+            return None
+        return Page(
+            url=url, text=text, version=meta['version'], etag=meta.get('etag'),
+            last_modified=meta.get('last_modified'), fetched_at=meta.get('fetched_at', 0.0),
+        )
+
+    def _write_cached(self, page: Page) -> None:
+        meta_path, body_path = self._cache_paths(page.url)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        meta = {
+            'url': page.url, 'version': page.version, 'etag': page.etag,
+            'last_modified': page.last_modified, 'fetched_at': page.fetched_at,
+        }
+        # Сначала тело, потом метаданные - версия в метаданных всегда есть на диске
+        for path, content in ((body_path, page.text), (meta_path, json.dumps(meta, ensure_ascii=False))):
+            tmp_path = path.with_suffix(f"{path.suffix}.{os.getpid()}.tmp")
+            tmp_path.write_text(content, encoding='utf-8')
+            os.replace(tmp_path, path)
+
+    # === ЗАГРУЗКА ===
+
+    async def _fetch_locked(self, url: str, max_age: float, timeout: float) -> Optional[Page]:
+        page = self._pages.get(url)
+        if page is None:
+            page = await asyncio.to_thread(self._read_cached, url)
+            if page is not None:
+                self._pages[url] = page
+
+        checked_at = self._checked_at.get(url)
+        if page is not None and checked_at is not None and time.monotonic() - checked_at < max_age:
+            self._stats['fresh_hits'] += 1
+            return page
+
+        request_headers = {}
+        if page is not None:
+            if page.etag:
+                request_headers['If-None-Match'] = page.etag
+            if page.last_modified:
+                request_headers['If-Modified-Since'] = page.last_modified
+
+        self._stats['requests'] += 1
+        started = time.perf_counter()
+        try:
+            async with self._get_session().get(
+                url, headers=request_headers, timeout=aiohttp.ClientTimeout(total=timeout)
+            ) as response:
+                if response.status == 304 and page is not None:
+                    self._stats['not_modified'] += 1
+                    self._checked_at[url] = time.monotonic()
+                    logger.debug(f"🌐 {url}: не изменилась ({(time.perf_counter() - started) * 1000:.0f} мс)")
+                    return page
+
+                response.raise_for_status()
+                text = await response.text()
+                new_page = Page(
+                    url=url,
+                    text=text,
+                    version=hashlib.sha256(text.encode('utf-8')).hexdigest()[:16],
+                    etag=response.headers.get('ETag'),
+                    last_modified=response.headers.get('Last-Modified'),
+                    fetched_at=time.time(),
+                )
+        except Exception as e:
+            self._stats['errors'] += 1
+            if page is not None:
+                self._stats['stale_served'] += 1
+                logger.warning(f"⚠️ Не удалось обновить {url} ({e}), используется сохранённая версия")
+                return page
+            logger.error(f"❌ Ошибка загрузки {url}: {e}")
+            return None
+
+        self._stats['downloaded'] += 1
+        self._pages[url] = new_page
+        self._checked_at[url] = time.monotonic()
+        changed = page is None or page.version != new_page.version
+        logger.info(
+            f"🌐 {url}: {'загружена новая версия' if changed else 'без изменений'} "
+            f"({len(text)} символов, {(time.perf_counter() - started) * 1000:.0f} мс)"
+        )
+        try:
+            await asyncio.to_thread(self._write_cached, new_page)
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось сохранить кэш страницы {url}: {e}")
+        return new_page
+
+    async def fetch(self, url: str, max_age: Optional[float] = None,
+                    timeout: float = DEFAULT_TIMEOUT) -> Optional[Page]:
+        """
+        Страница сайта (None, если её не удалось получить ни разу)
+
+        Args:
+            max_age: сколько секунд проверенная страница не перепроверяется
+                (по умолчанию из конфигурации; 0 - всегда условный GET)
+        """
+        max_age = self.fresh_for if max_age is None else max_age
+        async with self._lock(url):
+            return await self._fetch_locked(url, max_age, timeout)
+
+    async def fetch_text(self, url: str, max_age: Optional[float] = None,
+                         timeout: float = DEFAULT_TIMEOUT) -> Optional[str]:
+        """HTML страницы"""
+        page = await self.fetch(url, max_age, timeout)
+        return page.text if page is not None else None
+
+    async def soup(self, url: str, max_age: Optional[float] = None,
+                   timeout: float = DEFAULT_TIMEOUT) -> Optional[BeautifulSoup]:
+        """
+        Разобранное дерево страницы (общее для всех потребителей, не изменять)
+
+        Каждая версия страницы разбирается один раз.
+        """
+        max_age = self.fresh_for if max_age is None else max_age
+        async with self._lock(url):
+            page = await self._fetch_locked(url, max_age, timeout)
+            if page is None:
+                return None
+
+            key = (url, page.version)
+            tree = self._trees.get(key)
+            if tree is None:
+                started = time.perf_counter()
+                tree = await asyncio.to_thread(BeautifulSoup, page.text, HTML_PARSER)
+                self._trees.set(key, tree)
+                self._stats['parses'] += 1
+                logger.debug(f"🌳 {url}: разбор HTML {(time.perf_counter() - started) * 1000:.0f} мс")
+            return tree
+
+    def get_stats(self) -> dict:
+        return {**self._stats, 'pages': len(self._pages), 'trees': self._trees.get_stats()}
+
+    async def close(self) -> None:
+        """Закрыть сессию"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+# Глобальный экземпляр
+crawler = SiteCrawler(
+    config.cache_dir / "http",
+    fresh_for=config.crawler_fresh_seconds,
+    max_connections=config.crawler_max_connections,
+)
@@ -4,12 +4,14 @@
 import asyncio
 import json
 import logging
+import time
 from typing import AsyncGenerator, Dict, List, Optional
 
 import aiohttp
 from tenacity import retry, stop_after_attempt, wait_exponential
 
 from ..core.config import config
+from ..core.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
@@ -120,8 +122,13 @@ class DeepSeekAPI:
         Yields:
             Части ответа по мере их генерации
         """
+        queued_at = time.perf_counter()
         try:
             async with self.semaphore:
+                started = time.perf_counter()
+                metrics.observe_stage("llm_queue_wait", started - queued_at)
+                first_token_seen = False
+                
                 payload = {
                     "model": model,
                     "messages": messages,
@@ -149,23 +156,39 @@ class DeepSeekAPI:
                                     continue
 
                                 if response.status == 200:
-                                    async for line in response.content:
-                                        line = line.decode("utf-8").strip()
-                                        if line.startswith("data: "):
-                                            line = line[6:]  # Убираем "data: "
-                                            if line == "[DONE]":
-                                                break
-                                            try:
-                                                data = json.loads(line)
-                                                if (
-                                                    "choices" in data
-                                                    and len(data["choices"]) > 0
-                                                ):
-                                                    delta = data["choices"][0].get("delta", {})
-                                                    if "content" in delta:
-                                                        yield delta["content"]
-                                            except json.JSONDecodeError:
-                                                continue
+                                    try:
+                                        async for line in response.content:
+                                            line = line.decode("utf-8").strip()
+                                            if line.startswith("data: "):
+                                                line = line[6:]  # Убираем "data: "
+                                                if line == "[DONE]":
+                                                    break
+                                                try:
+                                                    data = json.loads(line)
+                                                    if (
+                                                        "choices" in data
+                                                        and len(data["choices"]) > 0
+                                                    ):
+                                                        delta = data["choices"][0].get("delta", {})
+                                                        if "content" in delta:
+                                                            if not first_token_seen:
+                                                                first_token_seen = True
+                                                                metrics.observe_stage(
+                                                                    "llm_first_token",
+                                                                    time.perf_counter() - started,
+                                                                )
+                                                            yield delta["content"]
+                                                except json.JSONDecodeError:
+                                                    continue
+                                    except (asyncio.CancelledError, GeneratorExit):
+                                        # Генерация отменена: рвём соединение, чтобы API
+                                        # перестал генерировать токены
+                                        response.close()
+                                        logger.info("⏹ Стриминг DeepSeek прерван клиентом")
+                                        raise
+                                    metrics.observe_stage(
+                                        "llm_stream_total", time.perf_counter() - started
+                                    )
                                     return
                                 else:
                                     logger.error(
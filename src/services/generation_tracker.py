@@ -0,0 +1,99 @@
+"""
+Отслеживание генераций ответов ИИ по пользователям
+
+Не даёт одному пользователю держать несколько параллельных стримов LLM:
+при новом вопросе предыдущая генерация отменяется, ставится в очередь
+или новый вопрос отклоняется - в зависимости от политики.
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from ..core.config import config
+
+logger = logging.getLogger(__name__)
+
+
+class GenerationTracker:
+    """Трекер активных генераций с политикой обработки повторных вопросов"""
+
+    POLICIES = ("cancel_previous", "queue", "reject")
+
+    def __init__(self, policy: str = "cancel_previous"):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Неизвестная политика генераций: {policy}")
+
+        self.policy = policy
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self.stats = {"started": 0, "cancelled": 0, "queued": 0, "rejected": 0}
+
+    def is_busy(self, user_id: int) -> bool:
+        """Идёт ли сейчас генерация для пользователя"""
+        task = self._tasks.get(user_id)
+        return task is not None and not task.done()
+
+    async def run(self, user_id: int, factory: Callable[[], Awaitable]) -> bool:
+        """
+        Выполнить генерацию для пользователя согласно политике
+
+        Args:
+            user_id: ID пользователя
+            factory: Функция, создающая корутину генерации
+
+        Returns:
+            False если генерация отклонена политикой reject, иначе True
+        """
+        previous = self._tasks.get(user_id)
+        if previous is not None and previous.done():
+            previous = None
+
+        if previous is not None:
+            if self.policy == "reject":
+                self.stats["rejected"] += 1
+                logger.info(f"🚫 Пользователь {user_id}: новый вопрос отклонён, идёт генерация")
+                return False
+
+            if self.policy == "cancel_previous":
+                previous.cancel()
+                self.stats["cancelled"] += 1
+                logger.info(f"⏹ Пользователь {user_id}: предыдущая генерация отменена")
+            else:
+                self.stats["queued"] += 1
+                logger.info(f"⏳ Пользователь {user_id}: вопрос поставлен в очередь")
+
+        task = asyncio.create_task(self._run_after(previous, factory))
+        self._tasks[user_id] = task
+        self.stats["started"] += 1
+
+        try:
+            # asyncio.wait не пробрасывает отмену дочерней задачи наружу
+            await asyncio.wait({task})
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        finally:
+            if self._tasks.get(user_id) is task:
+                del self._tasks[user_id]
+
+        if not task.cancelled() and task.exception() is not None:
+            raise task.exception()
+        return True
+
+    @staticmethod
+    async def _run_after(previous: Optional[asyncio.Task], factory: Callable[[], Awaitable]):
+        """Дождаться завершения предыдущей генерации (и освобождения слота LLM), затем начать новую"""
+        if previous is not None:
+            await asyncio.wait({previous})
+        return await factory()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика трекера"""
+        return {
+            "policy": self.policy,
+            "active": sum(1 for task in self._tasks.values() if not task.done()),
+            **self.stats,
+        }
+
+
+# Глобальный экземпляр трекера
+generation_tracker = GenerationTracker(config.generation_policy)
@@ -0,0 +1,311 @@
+"""
+Структуры маршрутизации запросов к консультантам
+
+WaitQueue - очередь ожидания консультанта:
+- порядок - упорядоченный словарь пользователь -> номер постановки в
+  очередь: начало очереди читается без сортировки, отмена запроса - O(1);
+- позиция в очереди считается деревом Фенвика по номерам постановки:
+  O(log n) и не требует перенумерации всей очереди после каждого изменения.
+
+SessionIndex - какие пользователи сейчас у какого консультанта (и наоборот),
+чтобы сообщение консультанта находило сессию без перебора всех сессий.
+
+OperatorRouter - кому предложить запрос: среди активных консультантов со
+свободными местами (capacity, None - без ограничения) и нужным навыком
+выбирается наименее загруженный. Загрузка - активные сессии плюс ещё не
+отвеченные предложения. Консультанты, которые отклонили запрос или не
+ответили вовремя, пропускаются; когда не ответили все подходящие, запрос
+рассылается всем сразу.
+
+Предложения, таймеры и отказы живут в памяти процесса: распределение
+рассчитано на один воркер бота. Общее хранилище состояния (Redis) сохраняет
+очередь и сессии между рестартами и не даёт двум воркерам принять один
+запрос, но не согласует между ними, кому запрос предложен.
+"""
+import asyncio
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from itertools import islice
+from operator import itemgetter
+from typing import Dict, FrozenSet, Iterable, Iterator, List, Optional, Set, Tuple
+
+# Начальный размер дерева Фенвика (растёт удвоением)
+INITIAL_CAPACITY = 64
+
+# Навыки консультантов и слова запроса, по которым он к ним относится
+SKILLS = ("schedule", "documents", "lists")
+SKILL_KEYWORDS = {
+    "schedule": ("расписан", "смен", "календар", "дат", "когда"),
+    "documents": ("документ", "заявлен", "справк", "договор", "анкет"),
+    "lists": ("спис", "зачисл", "прош", "результат", "участник"),
+}
+
+
+def classify_request(text: Optional[str]) -> Optional[str]:
+    """Навык, нужный для запроса (None - подойдёт любой консультант)"""
+    text = (text or "").lower()
+    scores = {
+        skill: sum(text.count(keyword) for keyword in keywords)
+        for skill, keywords in SKILL_KEYWORDS.items()
+    }
+    skill, score = max(scores.items(), key=itemgetter(1))
+    return skill if score else None
+
+
+class _Fenwick:
+    """Дерево Фенвика: отметки по номерам 1..size и префиксные суммы"""
+
+    def __init__(self, size: int, marked: Tuple[int, ...] = ()):
+        self.size = size
+        self.tree = [0] * (size + 1)
+        # Построение за O(n)
+        for index in marked:
+            self.tree[index] += 1
+        for index in range(1, size + 1):
+            parent = index + (index & -index)
+            if parent <= size:
+                self.tree[parent] += self.tree[index]
+
+    def add(self, index: int, delta: int) -> None:
+        while index <= self.size:
+            self.tree[index] += delta
+            index += index & -index
+
+    def prefix(self, index: int) -> int:
+        total = 0
+        while index > 0:
+            total += self.tree[index]
+            index -= index & -index
+        return total
+
+
+class WaitQueue:
+    """Очередь ожидания: порядок постановки, отмена и позиция за O(log n)"""
+
+    def __init__(self):
+        # user_id -> номер постановки, в порядке очереди
+        self._seq: "OrderedDict[int, int]" = OrderedDict()
+        self._next_seq = 1
+        self._fenwick = _Fenwick(INITIAL_CAPACITY)
+
+    def __len__(self) -> int:
+        return len(self._seq)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._seq
+
+    def __iter__(self) -> Iterator[int]:
+        """Пользователи в порядке очереди"""
+        return iter(self._seq)
+
+    def push(self, user_id: int) -> int:
+        """Поставить пользователя в конец очереди; его позиция (1 - первый)"""
+        if user_id in self._seq:
+            return self.position(user_id)
+        if self._next_seq > self._fenwick.size:
+            self._grow()
+        seq = self._next_seq
+        self._next_seq += 1
+        self._seq[user_id] = seq
+        self._fenwick.add(seq, 1)
+        return len(self._seq)
+
+    def remove(self, user_id: int) -> bool:
+        """Убрать пользователя из очереди (False, если его там нет)"""
+        seq = self._seq.pop(user_id, None)
+        if seq is None:
+            return False
+        self._fenwick.add(seq, -1)
+        return True
+
+    def position(self, user_id: int) -> Optional[int]:
+        """Позиция пользователя в очереди (None, если его там нет)"""
+        seq = self._seq.get(user_id)
+        if seq is None:
+            return None
+        return self._fenwick.prefix(seq)
+
+    def peek(self) -> Optional[int]:
+        """Первый в очереди (без извлечения)"""
+        return next(iter(self._seq), None)
+
+    def head(self, limit: int) -> List[int]:
+        """Первые limit пользователей в порядке очереди"""
+        return list(islice(self._seq, limit))
+
+    def pop(self) -> Optional[int]:
+        """Извлечь первого в очереди"""
+        user_id = self.peek()
+        if user_id is not None:
+            self.remove(user_id)
+        return user_id
+
+    def _grow(self) -> None:
+        """Номера постановки кончились: перенумеровать очередь и при необходимости удвоить дерево"""
+        capacity = self._fenwick.size
+        if 2 * len(self._seq) >= capacity:
+            capacity *= 2
+        self._seq = OrderedDict((user_id, seq) for seq, user_id in enumerate(self._seq, 1))
+        self._next_seq = len(self._seq) + 1
+        self._fenwick = _Fenwick(capacity, tuple(self._seq.values()))
+
+
+class SessionIndex:
+    """Соответствие консультант <-> пользователи в активных сессиях"""
+
+    def __init__(self):
+        self._operator_by_user: Dict[int, int] = {}
+        self._users_by_operator: Dict[int, Dict[int, datetime]] = {}
+
+    def bind(self, operator_id: int, user_id: int, since: Optional[datetime] = None) -> None:
+        """Запомнить сессию пользователя с консультантом"""
+        self.unbind(user_id)
+        self._operator_by_user[user_id] = operator_id
+        self._users_by_operator.setdefault(operator_id, {})[user_id] = since or datetime.now()
+
+    def touch(self, user_id: int) -> None:
+        """Сессия пользователя стала последней активной у своего консультанта"""
+        operator_id = self._operator_by_user.get(user_id)
+        if operator_id is not None:
+            self._users_by_operator[operator_id][user_id] = datetime.now()
+
+    def unbind(self, user_id: int) -> Optional[int]:
+        """Забыть сессию пользователя; консультант этой сессии"""
+        operator_id = self._operator_by_user.pop(user_id, None)
+        if operator_id is not None:
+            users = self._users_by_operator.get(operator_id, {})
+            users.pop(user_id, None)
+            if not users:
+                self._users_by_operator.pop(operator_id, None)
+        return operator_id
+
+    def operator_for(self, user_id: int) -> Optional[int]:
+        return self._operator_by_user.get(user_id)
+
+    def users_for(self, operator_id: int) -> Set[int]:
+        return set(self._users_by_operator.get(operator_id, ()))
+
+    def user_for(self, operator_id: int) -> Optional[int]:
+        """Пользователь последней активной сессии консультанта"""
+        users = self._users_by_operator.get(operator_id)
+        if not users:
+            return None
+        return max(users, key=users.__getitem__)
+
+    def load(self, operator_id: int) -> int:
+        """Сколько сессий сейчас у консультанта"""
+        return len(self._users_by_operator.get(operator_id, ()))
+
+
+def _current_task() -> Optional[asyncio.Task]:
+    try:
+        return asyncio.current_task()
+    except RuntimeError:
+        return None
+
+
+@dataclass
+class OperatorProfile:
+    """Консультант: сколько сессий ведёт одновременно (None - без ограничения) и по каким темам"""
+
+    operator_id: int
+    name: str
+    capacity: Optional[int] = 1
+    skills: FrozenSet[str] = frozenset()
+    is_active: bool = True
+
+    def has_skill(self, skill: Optional[str]) -> bool:
+        # Консультант без навыков отвечает на любые вопросы
+        return skill is None or not self.skills or skill in self.skills
+
+
+@dataclass
+class Offer:
+    """Запрос, предложенный одному консультанту"""
+
+    user_id: int
+    operator_id: int
+    skill: Optional[str]
+    message_id: Optional[int] = None
+    task: Optional[asyncio.Task] = None
+
+
+class OperatorRouter:
+    """Выбор наименее загруженного подходящего консультанта и учёт предложений"""
+
+    def __init__(self, sessions: SessionIndex):
+        self.sessions = sessions
+        self.offers: Dict[int, Offer] = {}  # user_id -> текущее предложение
+        self.tried: Dict[int, Set[int]] = {}  # user_id -> консультанты, которые не взяли запрос
+        self.broadcasted: Set[int] = set()  # запросы, разосланные всем консультантам
+        self._offer_load: Counter = Counter()
+
+    def load(self, operator_id: int) -> int:
+        """Сессии и неотвеченные предложения консультанта"""
+        return self.sessions.load(operator_id) + self._offer_load[operator_id]
+
+    def has_room(self, profile: OperatorProfile) -> bool:
+        if not profile.is_active:
+            return False
+        return profile.capacity is None or self.load(profile.operator_id) < profile.capacity
+
+    def fill_ratio(self, profile: OperatorProfile) -> float:
+        """Доля занятых мест (без ограничения - загрузка как есть)"""
+        load = self.load(profile.operator_id)
+        return load if profile.capacity is None else load / profile.capacity
+
+    def pick(self, operators: Iterable[OperatorProfile], skill: Optional[str],
+             exclude: Iterable[int] = ()) -> Tuple[Optional[int], bool]:
+        """
+        Кому предложить запрос: (консультант, все ли подходящие уже отказались)
+
+        Сначала - консультанты с нужным навыком. К остальным запрос уходит,
+        только когда его не взял ни один консультант с навыком.
+        """
+        exclude = set(exclude)
+        active = [profile for profile in operators if profile.is_active]
+        skilled = [profile for profile in active if profile.has_skill(skill)]
+        pool = [profile for profile in skilled if profile.operator_id not in exclude]
+        if not pool:
+            pool = [profile for profile in active if profile.operator_id not in exclude]
+        if not pool:
+            return None, bool(active)
+
+        free = [profile for profile in pool if self.has_room(profile)]
+        if not free:
+            return None, False
+        # При равной загрузке - тот, у кого тема указана явно
+        best = min(
+            free,
+            key=lambda profile: (self.fill_ratio(profile),
+                                 skill not in profile.skills,
+                                 self.load(profile.operator_id), profile.operator_id),
+        )
+        return best.operator_id, False
+
+    def add_offer(self, offer: Offer) -> None:
+        self.drop_offer(offer.user_id)
+        self.offers[offer.user_id] = offer
+        self._offer_load[offer.operator_id] += 1
+
+    def drop_offer(self, user_id: int, declined: bool = False) -> Optional[Offer]:
+        """Снять предложение (declined - консультант отказался или не ответил)"""
+        offer = self.offers.pop(user_id, None)
+        if offer is None:
+            return None
+        self._offer_load[offer.operator_id] -= 1
+        if self._offer_load[offer.operator_id] <= 0:
+            del self._offer_load[offer.operator_id]
+        if declined:
+            self.tried.setdefault(user_id, set()).add(offer.operator_id)
+        # Таймер предложения снимается, если его снимает не он сам
+        if offer.task is not None and offer.task is not _current_task():
+            offer.task.cancel()
+        return offer
+
+    def forget(self, user_id: int) -> Optional[Offer]:
+        """Запрос принят или отменён - забыть всё о его распределении"""
+        self.tried.pop(user_id, None)
+        self.broadcasted.discard(user_id)
+        return self.drop_offer(user_id)
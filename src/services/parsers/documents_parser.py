@@ -1,11 +1,12 @@
-import aiohttp
 import logging
 import json
 import asyncio
 from datetime import datetime, timedelta
-from typing import Dict, Optional, List
+from typing import Dict, Optional, List, Union
 from bs4 import BeautifulSoup
 from src.core.config import config
+from src.services.crawler import HTML_PARSER, crawler
+from src.services.refresh import background_refresher
 
 logger = logging.getLogger(__name__)
 
@@ -14,12 +15,11 @@ class DocumentsParser:
     
     def __init__(self):
         self.url = "https://ndtp.by/for_incoming_students/"
-        self.headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-        }
         # Используем централизованные пути из конфигурации
         self.cache_file = config.parsers_data_dir / "documents_cache.json"
         self.last_update_file = config.parsers_data_dir / "last_documents_update.txt"
+        # Время последнего обновления читается с диска один раз
+        self._last_update: Optional[datetime] = None
         self.base_url = "https://ndtp.by"
         
         # Создаем директорию для данных парсера если её нет
@@ -27,30 +27,12 @@ class DocumentsParser:
         
     async def fetch_page(self) -> Optional[str]:
         """Получает HTML страницы с документами"""
-        try:
-            logger.info(f"🌐 Запрос к {self.url}")
-            
-            async with aiohttp.ClientSession() as session:
-                async with session.get(self.url, headers=self.headers, timeout=30) as response:
-                    if response.status == 200:
-                        content = await response.text()
-                        logger.info(f"✅ Страница документов успешно загружена ({len(content)} символов)")
-                        return content
-                    else:
-                        logger.error(f"❌ Ошибка загрузки страницы документов: HTTP {response.status}")
-                        return None
-                        
-        except asyncio.TimeoutError:
-            logger.error("❌ Таймаут при загрузке страницы документов")
-        except Exception as e:
-            logger.error(f"❌ Ошибка при загрузке страницы документов: {e}")
-        
-        return None
+        return await crawler.fetch_text(self.url)
     
-    def parse_documents_section(self, html_content: str) -> Dict:
-        """Парсит раздел с необходимыми документами"""
+    def parse_documents_section(self, html_content: Union[str, BeautifulSoup]) -> Dict:
+        """Парсит раздел с необходимыми документами (из HTML или разобранного дерева)"""
         try:
-            soup = BeautifulSoup(html_content, 'html.parser')
+            soup = html_content if isinstance(html_content, BeautifulSoup) else BeautifulSoup(html_content, HTML_PARSER)
             
             # Ищем заголовок "Необходимые документы" (используем лямбда как в гайде)
             documents_header = soup.find(
@@ -224,8 +206,9 @@ class DocumentsParser:
                 json.dump(cache_data, f, ensure_ascii=False, indent=2)
             
             # Обновляем время последнего обновления
+            self._last_update = datetime.now()
             with open(self.last_update_file, 'w', encoding='utf-8') as f:
-                f.write(datetime.now().isoformat())
+                f.write(self._last_update.isoformat())
             
             logger.info(f"💾 Данные о документах сохранены в {self.cache_file}")
             return True
@@ -248,12 +231,15 @@ class DocumentsParser:
     
     def get_last_update_time(self) -> Optional[datetime]:
         """Получает время последнего обновления"""
+        if self._last_update is not None:
+            return self._last_update
         try:
             with open(self.last_update_file, 'r', encoding='utf-8') as f:
                 time_str = f.read().strip()
-                return datetime.fromisoformat(time_str)
+                self._last_update = datetime.fromisoformat(time_str)
         except (FileNotFoundError, ValueError):
-            return None
+            pass
+        return self._last_update
     
     def should_update(self, hours_threshold: int = 24) -> bool:
         """Проверяет, нужно ли обновление (по умолчанию каждые 24 часа)"""
@@ -273,13 +259,13 @@ class DocumentsParser:
             
             logger.info("🔄 Начинаем обновление данных о документах...")
             
-            # Получаем страницу
-            html_content = await self.fetch_page()
-            if not html_content:
+            # Получаем разобранную страницу (при force - с перепроверкой на сайте)
+            soup = await crawler.soup(self.url, max_age=0 if force else None)
+            if soup is None:
                 return False
             
             # Парсим документы
-            documents_data = self.parse_documents_section(html_content)
+            documents_data = await asyncio.to_thread(self.parse_documents_section, soup)
             if not documents_data:
                 logger.warning("⚠️ Не удалось извлечь данные о документах")
                 return False
@@ -359,12 +345,13 @@ documents_parser = DocumentsParser()
 async def get_documents_context_async(query: str = "") -> str:
     """Асинхронно получает контекст о документах"""
     try:
-        # Попробуем обновить данные, если нужно
-        await documents_parser.update_documents()
-        return documents_parser.get_documents_context(query)
+        # Отвечаем по сохранённому снимку, устаревшие данные обновляются в фоне
+        background_refresher.refresh_if_stale(
+            "documents", documents_parser.should_update, documents_parser.update_documents
+        )
     except Exception as e:
-        logger.error(f"❌ Ошибка получения контекста документов: {e}")
-        return documents_parser.get_documents_context(query)  # Попробуем с кешем
+        logger.error(f"❌ Ошибка запуска обновления документов: {e}")
+    return documents_parser.get_documents_context(query)
 
 def get_documents_context(query: str = "") -> str:
     """Синхронно получает контекст о документах"""
@@ -374,24 +361,7 @@ async def force_update_documents() -> bool:
     """Принудительно обновляет данные о документах"""
     return await documents_parser.update_documents(force=True)
 
-async def documents_updater_loop(interval_hours: int = 24):
-    """Фоновый цикл обновления данных о документах"""
-    logger.info(f"🔄 Запущен цикл обновления документов (каждые {interval_hours} часов)")
-    
-    while True:
-        try:
-            await asyncio.sleep(interval_hours * 60 * 60)  # Ждем заданное количество часов
-            
-            if documents_parser.should_update():
-                logger.info("⏰ Запуск планового обновления документов...")
-                success = await documents_parser.update_documents()
-                if success:
-                    logger.info("✅ Плановое обновление документов завершено")
-                else:
-                    logger.error("❌ Ошибка планового обновления документов")
-            else:
-                logger.info("✅ Данные о документах актуальны")
-                
-        except Exception as e:
-            logger.error(f"❌ Ошибка в цикле обновления документов: {e}")
-            await asyncio.sleep(60 * 60)  # Ждем час при ошибке 
\ No newline at end of file
+async def scheduled_update_documents() -> bool:
+    """Плановое обновление документов (задача планировщика)"""
+    # Через background_refresher - не пересекается с обновлением по устаревшему чтению
+    return await background_refresher.run("documents", documents_parser.update_documents)
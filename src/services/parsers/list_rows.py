@@ -0,0 +1,177 @@
+"""
+Разбор текста списков участников на структурированные строки
+
+Списки технопарка - таблицы "№ п/п | ФИО | Учреждение образования", которые
+после извлечения из PDF превращаются в поток строк: номер с фамилией,
+имя и отчество, область, школа в кавычках, класс. Колонки могут
+перемешиваться, поэтому сначала из блока строки вырезаются класс, область
+и школа, а оставшиеся слова с заглавной буквы считаются ФИО.
+"""
+import re
+from typing import Dict, List, Optional
+
+from src.services.parsers.lists_index import normalize_token
+
+ROW_START_RE = re.compile(r"^\s*(\d{1,4})\.\s+(\S.*)$")
+DIRECTION_RE = re.compile(r"направлени\w*\s*«([^»]*)»?", re.IGNORECASE)
+REGION_HEADING_RE = re.compile(r"^\s*([А-ЯЁ][а-яё]+ская\s+область|г\.\s?Минск)\s*$")
+
+CLASS_RE = re.compile(r"(\d{1,2})\s*класс\w*")
+REGION_RE = re.compile(r"(г\.\s?Минск(?![а-яё])|[А-ЯЁ][а-яё]+ская\s+обл(?:асть|\.)?)\s*,?")
+SCHOOL_RE = re.compile(
+    r"((?:ГУО|ГУДО|УО|ЧУО|ГУ|ОО)\s*«[^»]*»?(?:\s+[А-ЯЁ][а-яё]+(?:ого|ой|ий)\s+района)?"
+    r"|(?:Лицей|Гимназия|Колледж|Средняя школа)\b[^,]*)"
+)
+NAME_WORD_RE = re.compile(r"[А-ЯЁA-Z][а-яёa-z]+(?:-[А-ЯЁ][а-яё]+)?")
+NAME_SUFFIXES = {"оглы", "кызы"}
+PATRONYMIC_RE = re.compile(r"\b[А-ЯЁ][а-яё]+(?:вич|вна|ична|чна)\b")
+# Отчество, разорванное пробелом в текстовом слое PDF: "Алек сеевич"
+SPLIT_PATRONYMIC_RE = re.compile(r"\b([А-ЯЁ][а-яё]+) ([а-яё]+(?:вич|вна|ична|чна))\b")
+
+
+def detect_list_kind(doc_name: str) -> str:
+    """Вид списка по названию документа: enrolled / admitted / other"""
+    name = doc_name.lower()
+    if "зачисл" in name:
+        return "enrolled"
+    if "допущ" in name:
+        return "admitted"
+    return "other"
+
+
+def name_key(full_name: str) -> str:
+    """Ключ поиска по ФИО: нормализованные слова через пробел"""
+    return " ".join(normalize_token(word) for word in full_name.split())
+
+
+def _clean(text: str) -> str:
+    return " ".join(text.replace("« ", "«").replace(" »", "»").split()).strip(" ,")
+
+
+def _parse_row_block(row_number: int, block: str) -> Optional[Dict]:
+    """Разобрать склеенный текст одной строки таблицы"""
+    text = " ".join(block.split())
+
+    class_match = CLASS_RE.search(text)
+    grade = int(class_match.group(1)) if class_match else None
+    if class_match:
+        text = text[:class_match.start()] + " " + text[class_match.end():]
+
+    region_match = REGION_RE.search(text)
+    region = _clean(region_match.group(1)) if region_match else ""
+    if region_match:
+        text = text[:region_match.start()] + " " + text[region_match.end():]
+
+    school_match = SCHOOL_RE.search(text)
+    school = _clean(school_match.group(1)) if school_match else ""
+    if school_match:
+        text = text[:school_match.start()] + " " + text[school_match.end():]
+
+    words = NAME_WORD_RE.findall(SPLIT_PATRONYMIC_RE.sub(r"\1\2", text))
+    name_words = words[:3]
+    if len(words) > 3 and words[3].lower() in NAME_SUFFIXES:
+        name_words.append(words[3])
+    if len(name_words) < 2:
+        return None
+
+    # Отчество, перенесённое внутрь многострочного названия школы
+    if len(name_words) == 2:
+        patronymic_match = PATRONYMIC_RE.search(school)
+        if patronymic_match:
+            name_words.append(patronymic_match.group())
+            school = _clean(school[:patronymic_match.start()] + " " + school[patronymic_match.end():])
+
+    last_name, first_name, *rest = name_words
+    return {
+        "row_number": row_number,
+        "full_name": " ".join(name_words),
+        "last_name": last_name,
+        "first_name": first_name,
+        "patronymic": " ".join(rest),
+        "school": school,
+        "region": region,
+        "class": grade,
+    }
+
+
+def parse_list_rows(text: str) -> List[Dict]:
+    """
+    Разобрать текст списка участников на строки
+
+    Returns:
+        Строки с полями row_number, full_name, last_name, first_name,
+        patronymic, school, region, class, direction (образовательное
+        направление - оно же группа в списках зачисленных), section
+        (заголовок раздела: направление или область), text_start/text_end
+        (границы строки в тексте документа)
+    """
+    rows: List[Dict] = []
+    direction = ""
+    section = ""
+    current: Optional[Dict] = None
+    pending_heading = ""
+    offset = 0
+
+    def flush() -> None:
+        if current is None:
+            return
+        row = _parse_row_block(current["number"], " ".join(current["lines"]))
+        if row is not None:
+            # В списках допущенных область - заголовок раздела
+            if not row["region"] and current["section"] != current["direction"]:
+                row["region"] = current["section"]
+            row.update(
+                direction=current["direction"],
+                section=current["section"],
+                text_start=current["start"],
+                text_end=current["end"],
+            )
+            rows.append(row)
+
+    for line in text.splitlines(keepends=True):
+        line_start, offset = offset, offset + len(line)
+        stripped = line.strip()
+        if not stripped:
+            continue
+
+        # Заголовок направления может переноситься на следующую строку
+        if pending_heading:
+            pending_heading += " " + stripped
+            if "»" not in stripped:
+                continue
+            stripped, pending_heading = pending_heading, ""
+
+        direction_match = DIRECTION_RE.search(stripped)
+        if direction_match:
+            if "»" not in stripped[direction_match.start():]:
+                pending_heading = stripped
+                continue
+            flush()
+            current = None
+            direction = section = _clean(direction_match.group(1))
+            continue
+
+        region_match = REGION_HEADING_RE.match(stripped)
+        if region_match:
+            flush()
+            current = None
+            section = _clean(region_match.group(1))
+            continue
+
+        row_match = ROW_START_RE.match(stripped)
+        if row_match:
+            flush()
+            current = {
+                "number": int(row_match.group(1)),
+                "lines": [row_match.group(2)],
+                "direction": direction,
+                "section": section,
+                "start": line_start,
+                "end": offset,
+            }
+        elif current is not None:
+            current["lines"].append(stripped)
+            current["end"] = offset
+
+    flush()
+    return rows
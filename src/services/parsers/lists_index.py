@@ -0,0 +1,407 @@
+"""
+Позиционный инвертированный индекс по кэшу списков технопарка
+
+Строится один раз при загрузке/обновлении кэша: нормализованный токен ->
+{документ: позиции токена}. Поиск фразы - пересечение постингов с проверкой
+соседства позиций, поэтому время запроса зависит от числа вхождений слов
+запроса, а не от общего объёма текста документов.
+
+Токены нормализуются (регистр, ё/е, латинские буквы-двойники в кириллических
+словах), поэтому "Семенов" находит "Семёнов", а OCR-шное "Иванoв" с
+латинской o - "Иванов". Опечатки ищутся через словарь удалений в стиле
+SymSpell с проверкой расстояния Дамерау-Левенштейна; латиница в запросе
+транслитерируется. Совпадения ранжируются по качеству, приблизительные
+возвращаются, только если точных нет.
+"""
+import bisect
+import logging
+import re
+import time
+from array import array
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r"\w+")
+CYRILLIC_RE = re.compile(r"[а-яё]")
+LATIN_RE = re.compile(r"[a-z]")
+
+# Минимальная длина слова для поиска по префиксу ("иван" -> "иванов")
+MIN_PREFIX_LENGTH = 3
+# Минимальная длина слова для поиска с опечатками
+MIN_FUZZY_LENGTH = 4
+# Максимальная: вариантов удаления ~ длина², длиннее имён не бывает, а мусор
+# OCR или сообщение из одного длинного слова раздули бы словарь удалений
+MAX_FUZZY_LENGTH = 32
+# Максимальное расстояние правки, под которое строится словарь удалений
+MAX_EDIT_DISTANCE = 2
+
+# Штрафы за качество совпадения слова (0 - точное)
+PREFIX_COST = 0.3
+TRANSLIT_COST = 0.5
+REVERSED_COST = 0.1
+# Совпадения дороже этого считаются приблизительными
+APPROXIMATE_COST = 0.5
+
+# Латинские буквы, неотличимые от кириллических (частая ошибка OCR и раскладки)
+HOMOGLYPHS = str.maketrans("aceopxykmthb", "асеорхукмтнв")
+
+TRANSLIT_MULTI = (
+    ("shch", "щ"), ("sch", "щ"), ("zh", "ж"), ("kh", "х"), ("ts", "ц"), ("ch", "ч"),
+    ("sh", "ш"), ("yu", "ю"), ("ju", "ю"), ("ya", "я"), ("ja", "я"), ("yo", "е"),
+    ("jo", "е"), ("iy", "ий"), ("yy", "ый"), ("ey", "ей"), ("ay", "ай"), ("oy", "ой"),
+)
+TRANSLIT_SINGLE = str.maketrans({
+    "a": "а", "b": "б", "v": "в", "g": "г", "d": "д", "e": "е", "z": "з", "i": "и",
+    "y": "ы", "j": "й", "k": "к", "l": "л", "m": "м", "n": "н", "o": "о", "p": "п",
+    "r": "р", "s": "с", "t": "т", "u": "у", "f": "ф", "h": "х", "c": "ц", "w": "в",
+    "x": "кс", "q": "к",
+})
+
+
+def normalize_token(token: str) -> str:
+    """
+    Нормализация токена для индекса и запроса
+
+    Регистр, ё -> е; в словах с кириллицей латинские буквы-двойники
+    заменяются кириллическими. Длина токена не меняется.
+    """
+    token = token.lower().replace("ё", "е")
+    if LATIN_RE.search(token) and CYRILLIC_RE.search(token):
+        token = token.translate(HOMOGLYPHS)
+    return token
+
+
+def transliterate(token: str) -> str:
+    """Латинская запись имени -> кириллица (приближённо, для поиска)"""
+    for latin, cyrillic in TRANSLIT_MULTI:
+        token = token.replace(latin, cyrillic)
+    return token.translate(TRANSLIT_SINGLE)
+
+
+def tokenize(text: str) -> List[str]:
+    """Разбить строку на нормализованные токены"""
+    return [normalize_token(match.group()) for match in TOKEN_RE.finditer(text)]
+
+
+def max_edit_distance(token: str) -> int:
+    """Допустимое число опечаток для слова запроса данной длины"""
+    if not MIN_FUZZY_LENGTH <= len(token) <= MAX_FUZZY_LENGTH:
+        return 0
+    return 1 if len(token) < 8 else MAX_EDIT_DISTANCE
+
+
+def deletes(token: str, distance: int) -> Set[str]:
+    """Все варианты слова с удалением до distance символов"""
+    result = {token}
+    frontier = {token}
+    for _ in range(distance):
+        frontier = {word[:i] + word[i + 1:] for word in frontier for i in range(len(word))}
+        result |= frontier
+    return result
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Расстояние Дамерау-Левенштейна (с перестановкой соседних), не больше limit + 1"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+
+    previous_row = None
+    row = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        before, previous_row = previous_row, row
+        row = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            row[j] = min(previous_row[j] + 1, row[j - 1] + 1, previous_row[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                row[j] = min(row[j], before[j - 2] + 1)
+        if min(row) > limit:
+            return limit + 1
+    return row[-1]
+
+
+@dataclass(frozen=True)
+class IndexedDocument:
+    """Документ в индексе: исходные данные и символьные границы токенов"""
+
+    shift: str
+    url: str
+    data: dict
+    starts: array
+    ends: array
+
+
+@dataclass(frozen=True)
+class IndexMatch:
+    """Найденное вхождение запроса в документе"""
+
+    doc_id: int
+    match_info: str
+    start: int  # Смещение начала совпадения в тексте документа
+    end: int
+    score: float = 0.0  # Штраф за неточность, 0 - точное совпадение
+
+    @property
+    def is_approximate(self) -> bool:
+        return self.score >= APPROXIMATE_COST
+
+
+class ListsIndex:
+    """Позиционный инвертированный индекс документов списков"""
+
+    def __init__(self, text_loader: Optional[Callable[[str, str, int, int], str]] = None):
+        self.documents: List[IndexedDocument] = []
+        self._postings: Dict[str, Dict[int, array]] = {}
+        self._vocabulary: List[str] = []
+        self._deletes: Dict[str, List[str]] = {}
+        self._expand_cache: Dict[Tuple[str, bool], Dict[str, float]] = {}
+        self._text_loader = text_loader
+        self.build_time = 0.0
+
+    @classmethod
+    def build(
+        cls,
+        pdf_cache: Dict[str, Dict[str, dict]],
+        texts: Iterable[Tuple[str, str, str]],
+        text_loader: Callable[[str, str, int, int], str],
+    ) -> "ListsIndex":
+        """
+        Построить индекс по текстам документов
+
+        Args:
+            pdf_cache: Метаданные документов {смена: {url: данные}}
+            texts: Поток (смена, url, текст) - тексты не удерживаются в памяти
+            text_loader: Фрагмент текста документа (смена, url, начало, конец)
+                для контекста результата
+
+        Индекс неизменяем после построения: при обновлении кэша строится
+        новый и подменяется целиком, поэтому поиск не требует блокировок.
+        """
+        index = cls(text_loader)
+        started = time.perf_counter()
+
+        for shift_name, doc_url, text in texts:
+            doc_data = pdf_cache.get(shift_name, {}).get(doc_url)
+            if doc_data is not None:
+                index._add_document(shift_name, doc_url, doc_data, text)
+
+        index._vocabulary = sorted(index._postings)
+        index._build_deletes()
+        index.build_time = time.perf_counter() - started
+        logger.info(
+            f"🗂 Индекс списков построен: {len(index.documents)} документов, "
+            f"{len(index._vocabulary)} токенов за {index.build_time * 1000:.0f} мс"
+        )
+        return index
+
+    def _add_document(self, shift_name: str, doc_url: str, doc_data: dict, text: str) -> None:
+        doc_id = len(self.documents)
+        starts = array("I")
+        ends = array("I")
+        postings = self._postings
+
+        for position, match in enumerate(TOKEN_RE.finditer(text)):
+            starts.append(match.start())
+            ends.append(match.end())
+            token = normalize_token(match.group())
+            token_postings = postings.get(token)
+            if token_postings is None:
+                token_postings = postings[token] = {}
+            positions = token_postings.get(doc_id)
+            if positions is None:
+                positions = token_postings[doc_id] = array("I")
+            positions.append(position)
+
+        self.documents.append(IndexedDocument(shift_name, doc_url, doc_data, starts, ends))
+
+    def _build_deletes(self) -> None:
+        """Словарь удалений SymSpell: вариант с удалёнными буквами -> слова словаря"""
+        for token in self._vocabulary:
+            if MIN_FUZZY_LENGTH - 1 <= len(token) <= MAX_FUZZY_LENGTH and token.isalpha():
+                for variant in deletes(token, MAX_EDIT_DISTANCE):
+                    self._deletes.setdefault(variant, []).append(token)
+
+    # === ПОИСК ===
+
+    def _prefix_matches(self, token: str) -> List[str]:
+        vocabulary = self._vocabulary
+        i = bisect.bisect_left(vocabulary, token)
+        found = []
+        while i < len(vocabulary) and vocabulary[i].startswith(token):
+            found.append(vocabulary[i])
+            i += 1
+        return found
+
+    def _fuzzy_matches(self, token: str) -> Dict[str, int]:
+        """Слова словаря в пределах допустимого числа опечаток"""
+        distance = max_edit_distance(token)
+        if not distance or not token.isalpha():
+            return {}
+
+        found = {}
+        for variant in deletes(token, distance):
+            for candidate in self._deletes.get(variant, ()):
+                if candidate not in found:
+                    found[candidate] = edit_distance(token, candidate, distance)
+        return {candidate: d for candidate, d in found.items() if 0 < d <= distance}
+
+    def _expand(self, token: str, allow_prefix: bool) -> Dict[str, float]:
+        """
+        Слова словаря, соответствующие слову запроса, со штрафом за неточность
+
+        Точное совпадение - 0, продолжение слова (последнее слово запроса) -
+        PREFIX_COST, опечатки - по числу правок, латиница - через транслитерацию.
+        """
+        key = (token, allow_prefix)
+        expanded = self._expand_cache.get(key)
+        if expanded is not None:
+            return expanded
+
+        expanded = {}
+
+        def add(candidate: str, cost: float) -> None:
+            if cost < expanded.get(candidate, float("inf")):
+                expanded[candidate] = cost
+
+        variants = [(token, 0.0)]
+        if LATIN_RE.search(token) and not CYRILLIC_RE.search(token):
+            variants.append((transliterate(token), TRANSLIT_COST))
+
+        for variant, base_cost in variants:
+            if variant in self._postings:
+                add(variant, base_cost)
+            if allow_prefix and len(variant) >= MIN_PREFIX_LENGTH:
+                for candidate in self._prefix_matches(variant):
+                    add(candidate, base_cost + PREFIX_COST)
+            for candidate, distance in self._fuzzy_matches(variant).items():
+                add(candidate, base_cost + distance)
+
+        if len(self._expand_cache) > 10000:
+            self._expand_cache.clear()
+        self._expand_cache[key] = expanded
+        return expanded
+
+    def _positions(self, expanded: Dict[str, float]) -> Dict[int, Dict[int, float]]:
+        """Позиции слов словаря по документам с минимальным штрафом"""
+        result: Dict[int, Dict[int, float]] = {}
+        for token, cost in expanded.items():
+            for doc_id, positions in self._postings[token].items():
+                doc_positions = result.setdefault(doc_id, {})
+                for position in positions:
+                    if cost < doc_positions.get(position, float("inf")):
+                        doc_positions[position] = cost
+        return result
+
+    def _find_phrase(
+        self, parts: List[str], doc_filter: Optional[Callable[[IndexedDocument], bool]]
+    ) -> Dict[int, Tuple[int, float]]:
+        """
+        Найти фразу из подряд идущих слов
+
+        Последнее слово может совпасть по префиксу - так недописанное
+        окончание ("Иванов Пет") находит "Иванов Петр".
+
+        Returns:
+            {doc_id: (позиция первого слова лучшего вхождения, штраф)}
+        """
+        postings = []
+        for i, part in enumerate(parts):
+            positions = self._positions(self._expand(part, allow_prefix=i == len(parts) - 1))
+            if not positions:
+                return {}
+            postings.append(positions)
+
+        # Пересечение документов начинаем с самого редкого слова
+        candidates = set(min(postings, key=len))
+        for positions in postings:
+            candidates.intersection_update(positions)
+
+        found = {}
+        for doc_id in candidates:
+            if doc_filter is not None and not doc_filter(self.documents[doc_id]):
+                continue
+            starts = dict(postings[0][doc_id])
+            for offset, positions in enumerate(postings[1:], 1):
+                doc_positions = positions[doc_id]
+                starts = {
+                    start: cost + doc_positions[start + offset]
+                    for start, cost in starts.items()
+                    if start + offset in doc_positions
+                }
+                if not starts:
+                    break
+            if starts:
+                best = min(starts, key=lambda start: (starts[start], start))
+                found[doc_id] = (best, starts[best])
+        return found
+
+    def search(
+        self,
+        query: str,
+        doc_filter: Optional[Callable[[IndexedDocument], bool]] = None,
+    ) -> List[IndexMatch]:
+        """
+        Поиск слова или фразы (для двух слов - и в обратном порядке)
+
+        Returns:
+            Совпадения по возрастанию штрафа (при равенстве - в порядке
+            документов в кэше). Приблизительные совпадения возвращаются,
+            только если точных нет.
+        """
+        parts = tokenize(query)
+        if not parts:
+            return []
+
+        matches: Dict[int, IndexMatch] = {}
+
+        def collect(found: Dict[int, Tuple[int, float]], extra_cost: float, label: str) -> None:
+            for doc_id, (position, cost) in found.items():
+                score = round(cost + extra_cost, 3)
+                if doc_id in matches and matches[doc_id].score <= score:
+                    continue
+                document = self.documents[doc_id]
+                end = document.ends[position + len(parts) - 1]
+                match_info = f"{label} (похожее написание)" if score >= APPROXIMATE_COST else label
+                matches[doc_id] = IndexMatch(doc_id, match_info, document.starts[position], end, score)
+
+        if len(parts) == 1:
+            collect(self._find_phrase(parts, doc_filter), 0.0, f"найдено слово: {parts[0]}")
+        else:
+            phrase = " ".join(parts)
+            collect(self._find_phrase(parts, doc_filter), 0.0, f"найдена фраза: {phrase}")
+
+            if len(parts) == 2:
+                reversed_parts = [parts[1], parts[0]]
+                collect(
+                    self._find_phrase(reversed_parts, doc_filter),
+                    REVERSED_COST,
+                    f"найдена фраза (обратный порядок): {' '.join(reversed_parts)}",
+                )
+
+        ranked = sorted(matches.values(), key=lambda match: (match.score, match.doc_id))
+        if ranked and not ranked[0].is_approximate:
+            ranked = [match for match in ranked if not match.is_approximate]
+        return ranked
+
+    def get_context(self, match: IndexMatch, context_size: int = 100, max_length: int = 200) -> str:
+        """Фрагмент текста вокруг совпадения"""
+        document = self.documents[match.doc_id]
+        if self._text_loader is None:
+            return ""
+        # Читается только окрестность совпадения, а не весь документ
+        start = max(0, match.start - context_size)
+        text = self._text_loader(document.shift, document.url, start, match.end + context_size)
+        context = " ".join(text.split())
+        return context[:max_length] + "..." if len(context) > max_length else context
+
+    def get_stats(self) -> Dict[str, float]:
+        """Статистика индекса"""
+        return {
+            "documents": len(self.documents),
+            "tokens": len(self._vocabulary),
+            "postings": sum(len(docs) for docs in self._postings.values()),
+            "deletes": len(self._deletes),
+            "build_ms": round(self.build_time * 1000, 1),
+        }
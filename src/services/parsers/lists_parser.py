@@ -1,23 +1,32 @@
 import asyncio
-import io
-import json
+import hashlib
+import inspect
 import logging
+import multiprocessing
 import os
 import re
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
+from typing import Awaitable, Callable, Optional, Union
 
-import PyPDF2
-import requests
-from bs4 import BeautifulSoup
+import aiohttp
 
 from src.core.config import config
+from src.services.crawler import crawler
+from src.services.parsers.list_rows import detect_list_kind, name_key, parse_list_rows
+from src.services.parsers.lists_index import ListsIndex
+from src.services.parsers.lists_store import ListsStore
+from src.services.parsers.pdf_extraction import (
+    OCR_AVAILABLE,
+    extract_page_texts,
+    is_text_layer_good,
+    ocr_page
+)
 
-try:
-    from pdf2image import convert_from_bytes
-    import pytesseract
-    OCR_AVAILABLE = True
-except ImportError:
-    OCR_AVAILABLE = False
+if not OCR_AVAILABLE:
     logging.warning("⚠️ OCR библиотеки недоступны (pdf2image, pytesseract)")
 
 # Настройка логирования
@@ -30,6 +39,11 @@ logger = logging.getLogger(__name__)
 • При поиске одного слова - ищет это слово как отдельное слово (с границами)
 • При поиске нескольких слов - ищет их ТОЛЬКО как целую фразу
 • Поддерживает обратный порядок для двух слов (Имя Фамилия ↔ Фамилия Имя)
+• Последнее слово может быть недописанным (от 3 букв): "Иван" → "Иванов"
+• Поиск идёт по позиционному индексу (lists_index), а не по тексту документов
+• Е/Ё, латинские буквы-двойники и небольшие опечатки не мешают поиску:
+  "Семенов" → "Семёнов", "Ивонов" → "Иванов", "Ivanov" → "Иванов"
+  (похожие написания показываются, только если точных совпадений нет)
 • НЕ находит документы, где слова есть по отдельности в разных местах
 
 ✅ Примеры правильного поиска:
@@ -46,17 +60,98 @@ BASE_URL = "https://ndtp.by"
 SCHEDULE_URL = f"{BASE_URL}/schedule/"
 
 # Добавляем константы для кэширования
-PDF_CACHE_FILE = config.cache_dir / 'lists_cache.json'
+LISTS_STORE_FILE = config.cache_dir / 'lists_store.sqlite3'
+PDF_CACHE_FILE = config.cache_dir / 'lists_cache.json'  # прежний формат, переносится в SQLite
 CACHE_LIFETIME = 3600  # 1 час в секундах
 PDF_CACHE_EXPIRY = 86400  # 24 часа в секундах
+OCR_PAGE_CACHE_DIR = config.cache_dir / 'ocr_pages'
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7',
+}
+PAGE_TIMEOUT = 10
+PDF_TIMEOUT = aiohttp.ClientTimeout(total=30)
+
+# Исходы проверки документа при обновлении кэша
+REFRESH_OUTCOMES = ('new', 'changed', 'not_modified', 'unchanged', 'fresh', 'failed')
+
+# (обработано, всего, название документа) - синхронная функция или корутина
+ProgressCallback = Callable[[int, int, str], Union[None, Awaitable[None]]]
 
 class ListsParser:
     """Класс для парсинга и поиска в списках участников технопарка"""
     
     def __init__(self):
+        # Хранилище и индекс открываются в load(): импорт модуля не должен
+        # читать SQLite и строить индекс в event loop
+        self.store: Optional[ListsStore] = None
+        # В памяти только метаданные документов, тексты - в хранилище
+        self.pdf_cache = {}
+        self.index = ListsIndex()
+        self._loaded = False
+        self._load_lock = asyncio.Lock()
+        self.last_update = None
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._download_semaphore = asyncio.Semaphore(config.lists_download_concurrency)
+        self._ingest_lock = asyncio.Lock()
+        self._preload_task: Optional[asyncio.Task] = None
+        self.last_refresh_summary: Optional[dict] = None
+    
+    def _load(self):
+        """Открытие хранилища, разбор строк и построение индекса (синхронно)"""
         self.ensure_cache_dir()
+        self.store = ListsStore(LISTS_STORE_FILE)
         self.pdf_cache = self.load_pdf_cache()
-        self.last_update = None
+        self._backfill_rows()
+        self.index = self._build_index()
+    
+    async def load(self):
+        """Загрузка хранилища и индекса в потоке (однократно, до первого поиска)"""
+        if self._loaded:
+            return
+        async with self._load_lock:
+            if self._loaded:
+                return
+            try:
+                await asyncio.to_thread(self._load)
+                self._loaded = True
+            except Exception as e:
+                logger.error(f"❌ Ошибка загрузки хранилища списков: {e}")
+    
+    def _build_index(self) -> ListsIndex:
+        """Построение индекса потоковым чтением текстов из хранилища"""
+        return ListsIndex.build(self.pdf_cache, self.store.iter_texts(), self.store.get_text_range)
+    
+    async def rebuild_index(self):
+        """Перестроение поискового индекса после изменения кэша (вне event loop)"""
+        try:
+            self.index = await asyncio.to_thread(self._build_index)
+        except Exception as e:
+            logger.error(f"❌ Ошибка построения индекса списков: {e}")
+    
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """Пул процессов для извлечения текста и OCR (создаётся при первой загрузке)"""
+        if self._executor is None:
+            workers = config.lists_extract_workers or os.cpu_count() or 1
+            # spawn: дочерние процессы не наследуют event loop и потоки логирования
+            self._executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            logger.info(f"⚙️ Пул извлечения текста PDF: {workers} процессов")
+        return self._executor
+    
+    def close(self):
+        """Остановка пула процессов извлечения и закрытие хранилища"""
+        if self._preload_task is not None and not self._preload_task.done():
+            self._preload_task.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        if self.store is not None:
+            self.store.close()
     
     @staticmethod
     def ensure_cache_dir():
@@ -70,84 +165,87 @@ class ListsParser:
             logger.error(f"❌ Ошибка создания директории кэша: {e}")
     
     def load_pdf_cache(self):
-        """Загрузка кэша PDF-файлов"""
+        """Загрузка метаданных документов из хранилища (с переносом прежнего JSON-кэша)"""
         try:
-            if os.path.exists(PDF_CACHE_FILE):
-                with open(PDF_CACHE_FILE, 'r', encoding='utf-8') as f:
-                    cache_data = json.load(f)
-                    logger.info(f"📚 Загружен кэш PDF-файлов: {len(cache_data)} смен")
-                    return cache_data
+            if self.store.is_empty() and os.path.exists(PDF_CACHE_FILE):
+                self.store.import_legacy_json(PDF_CACHE_FILE)
+            
+            cache_data = self.store.load_metadata()
+            logger.info(f"📚 Загружен кэш PDF-файлов: {len(cache_data)} смен")
+            return cache_data
         except Exception as e:
             logger.error(f"❌ Ошибка при загрузке кэша PDF: {e}")
         return {}
     
-    def save_pdf_cache(self, cache):
-        """Сохранение кэша PDF-файлов"""
+    def save_document(self, shift_name, doc_url, entry):
+        """Сохранение одного документа (текст пишется, только если он есть в entry)"""
+        try:
+            self.store.upsert(shift_name, doc_url, entry)
+            if 'text' in entry:
+                self._store_rows(shift_name, doc_url, entry, entry['text'])
+        except Exception as e:
+            logger.error(f"❌ Ошибка при сохранении документа {doc_url}: {e}")
+    
+    def _store_rows(self, shift_name, doc_url, doc_data, text) -> int:
+        """Разбор текста списка участников на строки и их сохранение"""
+        rows = []
+        if doc_data.get('is_student_list', False):
+            list_kind = detect_list_kind(doc_data.get('name', ''))
+            rows = parse_list_rows(text)
+            for row in rows:
+                row['list_kind'] = list_kind
+                row['name_key'] = name_key(row['full_name'])
+        self.store.replace_rows(shift_name, doc_url, rows)
+        return len(rows)
+    
+    def _backfill_rows(self):
+        """Разбор строк для документов, сохранённых до появления таблицы строк"""
         try:
-            with open(PDF_CACHE_FILE, 'w', encoding='utf-8') as f:
-                json.dump(cache, f, ensure_ascii=False, indent=2)
-            logger.info(f"💾 Кэш PDF-файлов сохранен: {len(cache)} смен")
+            if self.store.count_rows() or not self.pdf_cache:
+                return
+            started = time.perf_counter()
+            total = 0
+            for shift_name, doc_url, text in self.store.iter_texts():
+                doc_data = self.pdf_cache.get(shift_name, {}).get(doc_url, {})
+                total += self._store_rows(shift_name, doc_url, doc_data, text)
+            if total:
+                logger.info(
+                    f"🧾 Строки списков разобраны из сохранённых текстов: {total} "
+                    f"за {(time.perf_counter() - started) * 1000:.0f} мс"
+                )
         except Exception as e:
-            logger.error(f"❌ Ошибка при сохранении кэша PDF: {e}")
+            logger.error(f"❌ Ошибка разбора строк списков: {e}")
+    
+    def find_rows(self, full_name: str, list_kind: Optional[str] = None) -> list:
+        """
+        Строки списков по ФИО (по началу: "Иванов Петр" найдёт и с отчеством)
+        
+        Порядок "Имя Фамилия" тоже проверяется.
+        """
+        key = name_key(full_name)
+        if not key or self.store is None:
+            return []
+        rows = self.store.find_rows(key, list_kind)
+        words = key.split()
+        if not rows and len(words) == 2:
+            rows = self.store.find_rows(f"{words[1]} {words[0]}", list_kind)
+        return rows
+    
+    def get_rows(self, list_kind: Optional[str] = None, url: Optional[str] = None) -> list:
+        """Строки списков участников (enrolled - зачисленные, admitted - допущенные)"""
+        if self.store is None:
+            return []
+        return self.store.get_rows(list_kind, url)
     
     async def get_shifts_info(self):
         """Получение информации о всех сменах с сайта"""
         try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-                'Accept-Language': 'ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7',
-            }
-            
-            logger.info(f"🌐 Запрос к {SCHEDULE_URL}")
-            response = requests.get(SCHEDULE_URL, headers=headers, timeout=10)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.text, 'html.parser')
-            shifts = []
-            panels = soup.find_all('div', class_='panel-default')
+            soup = await crawler.soup(SCHEDULE_URL, timeout=PAGE_TIMEOUT)
+            if soup is None:
+                return []
             
-            logger.info(f"📋 Найдено панелей: {len(panels)}")
-            
-            for panel in panels:
-                try:
-                    title_elem = panel.find(['h1', 'h2', 'h3', 'h4', 'h5'], 
-                        string=lambda x: x and ('смена' in x.lower() or 'смены' in x.lower()))
-                    
-                    if not title_elem:
-                        continue
-                    
-                    shift_name = title_elem.text.strip()
-                    panel_body = panel.find('div', class_='panel-body')
-                    
-                    if not panel_body:
-                        continue
-                    
-                    # Поиск дат
-                    dates = self._extract_dates(panel_body)
-                    if not dates:
-                        continue
-                    
-                    # Поиск информации о заявках
-                    application_period = self._extract_application_info(panel_body)
-                    if not application_period:
-                        continue
-                    
-                    # Поиск документов
-                    documents = self._extract_documents(panel_body)
-                    if not documents:
-                        continue
-                    
-                    shifts.append({
-                        'name': shift_name,
-                        'dates': dates,
-                        'application_period': application_period,
-                        'documents': documents
-                    })
-                    
-                except Exception as e:
-                    logger.error(f"❌ Ошибка при обработке панели: {e}")
-                    continue
+            # Разбор страницы - в потоке, чтобы не задерживать обработку сообщений
+            shifts = await asyncio.to_thread(self._parse_shifts, soup)
             
             logger.info(f"✅ Обработано смен: {len(shifts)}")
             return shifts
@@ -156,6 +254,55 @@ class ListsParser:
             logger.error(f"❌ Ошибка получения информации о сменах: {e}")
             return []
     
+    def _parse_shifts(self, soup):
+        """Разбор страницы расписания на смены с документами"""
+        shifts = []
+        panels = soup.find_all('div', class_='panel-default')
+        
+        logger.info(f"📋 Найдено панелей: {len(panels)}")
+        
+        for panel in panels:
+            try:
+                title_elem = panel.find(['h1', 'h2', 'h3', 'h4', 'h5'], 
+                    string=lambda x: x and ('смена' in x.lower() or 'смены' in x.lower()))
+                
+                if not title_elem:
+                    continue
+                
+                shift_name = title_elem.text.strip()
+                panel_body = panel.find('div', class_='panel-body')
+                
+                if not panel_body:
+                    continue
+                
+                # Поиск дат
+                dates = self._extract_dates(panel_body)
+                if not dates:
+                    continue
+                
+                # Поиск информации о заявках
+                application_period = self._extract_application_info(panel_body)
+                if not application_period:
+                    continue
+                
+                # Поиск документов
+                documents = self._extract_documents(panel_body)
+                if not documents:
+                    continue
+                
+                shifts.append({
+                    'name': shift_name,
+                    'dates': dates,
+                    'application_period': application_period,
+                    'documents': documents
+                })
+                
+            except Exception as e:
+                logger.error(f"❌ Ошибка при обработке панели: {e}")
+                continue
+        
+        return shifts
+    
     def _extract_dates(self, panel_body):
         """Извлечение дат из панели"""
         date_patterns = [
@@ -223,240 +370,364 @@ class ListsParser:
         else:
             return 'other'
     
-    async def extract_text_from_pdf(self, url, force_ocr=False):
+    async def _download(self, session: aiohttp.ClientSession, url: str, validators: Optional[dict] = None):
+        """
+        Загрузка документа с ограничением числа одновременных загрузок
+        
+        Args:
+            validators: ETag/Last-Modified из кэша для условного запроса
+        
+        Returns:
+            (содержимое или None при 304 Not Modified, заголовки ответа)
+        """
+        headers = {}
+        if validators:
+            if validators.get('etag'):
+                headers['If-None-Match'] = validators['etag']
+            if validators.get('last_modified'):
+                headers['If-Modified-Since'] = validators['last_modified']
+        
+        async with self._download_semaphore:
+            async with session.get(url, headers=headers, timeout=PDF_TIMEOUT) as response:
+                if response.status == 304:
+                    return None, response.headers
+                response.raise_for_status()
+                return await response.read(), response.headers
+    
+    async def _run_in_pool(self, func, *args):
+        """Выполнение функции в пуле процессов извлечения"""
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        try:
+            return await loop.run_in_executor(executor, func, *args)
+        except BrokenProcessPool:
+            # Упавший процесс ломает весь пул - следующая загрузка создаст новый
+            if self._executor is executor:
+                self._executor = None
+                executor.shutdown(wait=False, cancel_futures=True)
+            raise
+    
+    @staticmethod
+    def _write_temp_pdf(pdf_content: bytes) -> str:
+        """Временный файл с PDF для OCR страниц (удаляет вызывающий)"""
+        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f:
+            f.write(pdf_content)
+            return f.name
+    
+    async def _extract_text(self, pdf_content: bytes, force_ocr: bool, doc_name: str):
+        """
+        Извлечение текста из PDF в пуле процессов
+        
+        Для каждой страницы берётся текстовый слой, если он пригоден;
+        остальные страницы распознаются параллельно (по странице на процесс)
+        с кэшированием результата по хэшу изображения. Для OCR PDF один раз
+        пишется во временный файл - задачам передаётся путь, а не байты.
+        
+        Args:
+            force_ocr: Распознавать все страницы независимо от текстового слоя
+        
+        Returns:
+            (текст или None, сведения: method, pages, ocr_pages, ocr_cached)
+        """
+        page_texts, warnings = await self._run_in_pool(extract_page_texts, pdf_content)
+        ocr_pages = [
+            number for number, page_text in enumerate(page_texts, 1)
+            if force_ocr or not is_text_layer_good(page_text)
+        ]
+        info = {'method': 'text', 'pages': len(page_texts), 'ocr_pages': 0, 'ocr_cached': 0}
+        
+        if ocr_pages and OCR_AVAILABLE:
+            pdf_path = await asyncio.to_thread(self._write_temp_pdf, pdf_content)
+            try:
+                results = await asyncio.gather(
+                    *(
+                        self._run_in_pool(ocr_page, pdf_path, number, config.ocr_dpi, str(OCR_PAGE_CACHE_DIR))
+                        for number in ocr_pages
+                    ),
+                    return_exceptions=True,
+                )
+            finally:
+                os.unlink(pdf_path)
+            for number, result in zip(ocr_pages, results):
+                if isinstance(result, BaseException):
+                    warnings.append(f"OCR страницы {number} не удался: {result}")
+                    continue
+                ocr_text, cached = result
+                layer_text = page_texts[number - 1]
+                # Непригодный слой заменяется любым распознанным текстом,
+                # пригодный (при force_ocr) - только более содержательным
+                if ocr_text.strip() and (
+                    not is_text_layer_good(layer_text) or len(ocr_text.strip()) > len(layer_text.strip())
+                ):
+                    page_texts[number - 1] = ocr_text
+                    info['ocr_pages'] += 1
+                    info['ocr_cached'] += cached
+            
+            if info['ocr_pages']:
+                info['method'] = 'ocr' if info['ocr_pages'] == len(page_texts) else 'mixed'
+        
+        for warning in warnings:
+            logger.warning(f"⚠️ {doc_name}: {warning}")
+        
+        text = "".join(page_text + "\n" for page_text in page_texts if page_text)
+        return (text if text.strip() else None), info
+    
+    async def extract_text_from_pdf(self, url, force_ocr=False, session=None):
         """Извлечение текста из PDF-файла"""
         try:
             logger.info(f"📄 Извлекаем текст из PDF: {url}")
-            response = requests.get(url, timeout=30)
-            response.raise_for_status()
-            
-            pdf_content = response.content
-            text = ""
-            
-            # Пробуем стандартное извлечение
-            try:
-                with io.BytesIO(pdf_content) as file_stream:
-                    reader = PyPDF2.PdfReader(file_stream)
-                    for page in reader.pages:
-                        page_text = page.extract_text()
-                        if page_text:
-                            text += page_text + "\n"
-            except Exception as e:
-                logger.warning(f"⚠️ Стандартное извлечение не удалось: {e}")
-            
-            # Если OCR доступен и нужен
-            if (force_ocr or len(text.strip()) < 100) and OCR_AVAILABLE:
-                try:
-                    logger.info("🔍 Используем OCR для извлечения текста")
-                    images = convert_from_bytes(pdf_content)
-                    ocr_text = ""
-                    for i, image in enumerate(images):
-                        logger.info(f"📖 Обрабатываем страницу {i+1}/{len(images)}")
-                        page_text = pytesseract.image_to_string(image, lang='rus')
-                        ocr_text += page_text + "\n"
-                    
-                    if len(ocr_text.strip()) > len(text.strip()):
-                        text = ocr_text
-                        logger.info(f"✅ OCR дал лучший результат: {len(text)} символов")
-                except Exception as e:
-                    logger.warning(f"⚠️ OCR не удался: {e}")
-            
-            logger.info(f"✅ Извлечено {len(text)} символов из PDF")
-            return text if text.strip() else None
+            if session is None:
+                async with aiohttp.ClientSession(headers=HEADERS) as own_session:
+                    pdf_content, _ = await self._download(own_session, url)
+            else:
+                pdf_content, _ = await self._download(session, url)
+            
+            text, info = await self._extract_text(pdf_content, force_ocr, url)
+            logger.info(
+                f"✅ Извлечено {len(text or '')} символов из PDF ({info['method']}, "
+                f"OCR страниц: {info['ocr_pages']}/{info['pages']}, из кэша: {info['ocr_cached']})"
+            )
+            return text
             
         except Exception as e:
             logger.error(f"❌ Ошибка извлечения текста из PDF {url}: {e}")
             return None
     
-    async def preload_pdf_files(self, force_reload=False):
-        """Предзагрузка PDF-файлов"""
+    async def _ingest_document(self, session, shift_name, doc, cached_doc, conditional=True, reextract=False):
+        """
+        Проверка и загрузка одного документа
+        
+        Returns:
+            (смена, документ, исход, запись кэша или None, время обработки)
+            Исход: new / changed / not_modified / unchanged / failed
+        """
+        started = time.perf_counter()
+        is_student_list = doc['type'] == 'student_list'
         try:
-            logger.info("🚀 Начинаем предзагрузку PDF-файлов...")
-            
-            current_time = datetime.now().timestamp()
-            shifts = await self.get_shifts_info()
+            validators = cached_doc if conditional and not reextract else None
+            pdf_content, headers = await self._download(session, doc['url'], validators)
+            
+            entry = dict(cached_doc) if cached_doc else {}
+            entry.update({
+                'name': doc['name'],
+                'is_student_list': is_student_list,
+                'type': doc['type'],
+                'checked_at': datetime.now().timestamp(),
+                'etag': headers.get('ETag') or entry.get('etag'),
+                'last_modified': headers.get('Last-Modified') or entry.get('last_modified'),
+            })
+            
+            if pdf_content is None:
+                return shift_name, doc, 'not_modified', entry, time.perf_counter() - started
+            
+            content_hash = hashlib.sha256(pdf_content).hexdigest()
+            if cached_doc and not reextract and cached_doc.get('sha256') == content_hash:
+                return shift_name, doc, 'unchanged', entry, time.perf_counter() - started
+            
+            text, info = await self._extract_text(pdf_content, False, doc['name'])
+            if not text:
+                logger.warning(f"⚠️ Не удалось извлечь текст: {doc['name']}")
+                return shift_name, doc, 'failed', None, time.perf_counter() - started
+            
+            entry.update({
+                'text': text,
+                'timestamp': entry['checked_at'],
+                'sha256': content_hash,
+                'extraction': info['method'],
+                'pages': info['pages'],
+                'ocr_pages': info['ocr_pages'],
+            })
+            outcome = 'changed' if cached_doc else 'new'
+            return shift_name, doc, outcome, entry, time.perf_counter() - started
             
-            if not shifts:
-                logger.warning("⚠️ Не найдено смен для загрузки")
-                return self.pdf_cache
-            
-            total_docs = sum(len(shift['documents']) for shift in shifts if shift['documents'])
-            processed_docs = 0
-            
-            logger.info(f"📊 Найдено {len(shifts)} смен, {total_docs} документов")
-            
-            for shift in shifts:
-                shift_name = shift['name']
-                if shift_name not in self.pdf_cache:
-                    self.pdf_cache[shift_name] = {}
-                
-                logger.info(f"📝 Обрабатываем смену: {shift_name}")
+        except Exception as e:
+            logger.error(f"❌ Ошибка загрузки {doc['name']}: {e}")
+            return shift_name, doc, 'failed', None, time.perf_counter() - started
+    
+    @staticmethod
+    async def _report_progress(progress_callback, processed, total, doc_name):
+        """Передача прогресса загрузки вызывающему коду"""
+        if progress_callback is None:
+            return
+        try:
+            result = progress_callback(processed, total, doc_name)
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            logger.warning(f"⚠️ Ошибка обработчика прогресса: {e}")
+    
+    async def preload_pdf_files(
+        self,
+        force_reload=False,
+        progress_callback: Optional[ProgressCallback] = None,
+        reextract=False,
+    ):
+        """
+        Предзагрузка PDF-файлов
+        
+        Загрузки идут параллельно (не более LISTS_DOWNLOAD_CONCURRENCY),
+        извлечение текста и OCR - в пуле процессов, event loop бота
+        при этом не блокируется.
+        
+        Документы из кэша перепроверяются условным запросом (If-None-Match /
+        If-Modified-Since); текст извлекается заново, только если изменился
+        SHA-256 содержимого.
+        
+        Args:
+            force_reload: Проверить все документы, не дожидаясь истечения кэша
+            progress_callback: Вызывается после каждого документа с
+                (обработано, всего, название документа)
+            reextract: Извлечь текст заново даже для неизменившихся документов
+        
+        Returns:
+            Метаданные кэша или None, если загрузка не удалась
+        """
+        if self._ingest_lock.locked():
+            logger.info("⏳ Загрузка списков уже идёт, ждём её завершения")
+        
+        await self.load()
+        async with self._ingest_lock:
+            try:
+                logger.info("🚀 Начинаем предзагрузку PDF-файлов...")
+                started = time.perf_counter()
+                current_time = datetime.now().timestamp()
+                summary = {outcome: 0 for outcome in REFRESH_OUTCOMES}
                 
-                for doc in shift['documents']:
-                    processed_docs += 1
-                    doc_url = doc['url']
-                    doc_name = doc['name']
-                    doc_type = doc['type']
-                    
-                    logger.info(f"[{processed_docs}/{total_docs}] {doc_name}")
+                async with aiohttp.ClientSession(headers=HEADERS) as session:
+                    shifts = await self.get_shifts_info()
                     
-                    is_pdf = doc_url.lower().endswith('.pdf') or ('media_dl=' in doc_url.lower())
+                    if not shifts:
+                        logger.warning("⚠️ Не найдено смен для загрузки")
+                        return self.pdf_cache
                     
-                    if is_pdf:
-                        # Проверяем кэш
-                        if not force_reload and doc_url in self.pdf_cache[shift_name]:
-                            cached_doc = self.pdf_cache[shift_name][doc_url]
-                            if current_time - cached_doc['timestamp'] < PDF_CACHE_EXPIRY:
-                                logger.info("📚 Используем кэшированную версию")
+                    jobs = []
+                    for shift in shifts:
+                        shift_name = shift['name']
+                        shift_cache = self.pdf_cache.setdefault(shift_name, {})
+                        
+                        for doc in shift['documents']:
+                            doc_url = doc['url']
+                            is_pdf = doc_url.lower().endswith('.pdf') or ('media_dl=' in doc_url.lower())
+                            if not is_pdf:
                                 continue
+                            
+                            # Недавно проверенные документы не запрашиваем
+                            cached_doc = shift_cache.get(doc_url)
+                            if cached_doc and not force_reload and not reextract:
+                                checked_at = cached_doc.get('checked_at', cached_doc['timestamp'])
+                                if current_time - checked_at < PDF_CACHE_EXPIRY:
+                                    summary['fresh'] += 1
+                                    continue
+                            
+                            jobs.append((shift_name, doc, cached_doc))
+                    
+                    total = len(jobs)
+                    total_docs = sum(len(shift['documents']) for shift in shifts if shift['documents'])
+                    logger.info(
+                        f"📊 Найдено {len(shifts)} смен, {total_docs} документов, "
+                        f"к проверке: {total}"
+                    )
+                    
+                    tasks = [
+                        self._ingest_document(session, shift_name, doc, cached_doc, reextract=reextract)
+                        for shift_name, doc, cached_doc in jobs
+                    ]
+                    for processed, next_done in enumerate(asyncio.as_completed(tasks), 1):
+                        shift_name, doc, outcome, entry, elapsed = await next_done
+                        summary[outcome] += 1
                         
-                        is_student_list = doc_type == 'student_list'
+                        if entry is not None:
+                            await asyncio.to_thread(self.save_document, shift_name, doc['url'], entry)
+                            text_length = len(entry.pop('text', ''))
+                            self.pdf_cache[shift_name][doc['url']] = entry
                         
-                        try:
-                            text = await self.extract_text_from_pdf(doc_url, force_ocr=is_student_list)
-                            if text:
-                                self.pdf_cache[shift_name][doc_url] = {
-                                    'name': doc_name,
-                                    'text': text,
-                                    'timestamp': current_time,
-                                    'is_student_list': is_student_list,
-                                    'type': doc_type
-                                }
-                                logger.info(f"✅ Загружен: {doc_name}")
-                            else:
-                                logger.warning(f"⚠️ Не удалось извлечь текст: {doc_name}")
-                        except Exception as e:
-                            logger.error(f"❌ Ошибка загрузки {doc_name}: {e}")
-            
-            self.save_pdf_cache(self.pdf_cache)
-            self.last_update = datetime.now()
-            
-            total_cached = sum(len(docs) for docs in self.pdf_cache.values())
-            logger.info(f"🎉 Предзагрузка завершена! Кэшировано {total_cached} документов")
-            
-            return self.pdf_cache
-            
-        except Exception as e:
-            logger.error(f"❌ Ошибка предзагрузки PDF-файлов: {e}")
-            return {}
+                        if outcome in ('new', 'changed'):
+                            logger.info(
+                                f"[{processed}/{total}] ✅ {doc['name']}: {text_length} символов "
+                                f"({outcome}, {entry['extraction']}, OCR {entry['ocr_pages']}/{entry['pages']} стр., "
+                                f"{elapsed:.1f} с)"
+                            )
+                        elif outcome != 'failed':
+                            logger.info(f"[{processed}/{total}] 📚 {doc['name']}: без изменений ({outcome})")
+                        
+                        await self._report_progress(progress_callback, processed, total, doc['name'])
+                
+                if summary['new'] or summary['changed']:
+                    await self.rebuild_index()
+                self.last_update = datetime.now()
+                self.last_refresh_summary = summary
+                
+                total_cached = sum(len(docs) for docs in self.pdf_cache.values())
+                logger.info(
+                    f"🎉 Предзагрузка завершена за {time.perf_counter() - started:.1f} с: "
+                    f"новых {summary['new']}, изменённых {summary['changed']}, "
+                    f"без изменений {summary['not_modified'] + summary['unchanged']} "
+                    f"(304: {summary['not_modified']}, тот же хэш: {summary['unchanged']}), "
+                    f"не проверялись {summary['fresh']}, ошибок {summary['failed']}. "
+                    f"Кэшировано {total_cached} документов"
+                )
+                
+                return self.pdf_cache
+                
+            except Exception as e:
+                logger.error(f"❌ Ошибка предзагрузки PDF-файлов: {e}")
+                return None
+    
+    def start_preload(self, force_reload=False):
+        """Запуск предзагрузки фоновой задачей (не задерживает запуск бота)"""
+        if self._preload_task is None or self._preload_task.done():
+            self._preload_task = asyncio.create_task(self.preload_pdf_files(force_reload=force_reload))
+        return self._preload_task
     
     async def search_in_lists(self, query: str, search_type='all') -> list:
-        """Поиск в списках участников"""
+        """Поиск в списках участников по инвертированному индексу (с учётом опечаток)"""
         try:
-            logger.info(f"🔍 Поиск: '{query}' (тип: {search_type})")
-            
             if not query or not query.strip():
                 return []
             
-            # Нормализуем запрос
-            query_lower = query.lower().strip()
-            query_parts = query_lower.split()
+            await self.load()
+            started = time.perf_counter()
+            index = self.index
             
-            results = []
-            total_docs = sum(len(docs) for docs in self.pdf_cache.values())
-            processed = 0
-            
-            logger.info(f"📊 Поиск в {total_docs} документах")
+            doc_filter = None
+            if search_type == 'student_lists':
+                doc_filter = lambda document: document.data.get('is_student_list', False)
             
-            for shift_name, docs in self.pdf_cache.items():
-                for doc_url, doc_data in docs.items():
-                    processed += 1
-                    
-                    # Фильтруем по типу поиска
-                    if search_type == 'student_lists' and not doc_data.get('is_student_list', False):
-                        continue
-                    
-                    doc_text = doc_data['text'].lower()
-                    doc_name = doc_data['name']
-                    
-                    # Поиск
-                    found, match_info = self._search_in_text(query_lower, query_parts, doc_text)
-                    
-                    if found:
-                        logger.info(f"✅ НАЙДЕНО! {match_info} в '{doc_name}' ({shift_name})")
-                        
-                        context = self._get_context(doc_text, query_lower, query_parts)
-                        
-                        result = {
-                            'shift': shift_name,
-                            'document': doc_name,
-                            'url': doc_url,
-                            'type': doc_data.get('type', 'other'),
-                            'match_info': match_info,
-                            'context': context,
-                            'is_student_list': doc_data.get('is_student_list', False)
-                        }
-                        
-                        # Приоритет для списков студентов
-                        if doc_data.get('is_student_list', False):
-                            results.insert(0, result)
-                        else:
-                            results.append(result)
-            
-            logger.info(f"🎉 Найдено результатов: {len(results)}")
+            results = []
+            for match in index.search(query, doc_filter):
+                document = index.documents[match.doc_id]
+                doc_data = document.data
+                
+                result = {
+                    'shift': document.shift,
+                    'document': doc_data['name'],
+                    'url': document.url,
+                    'type': doc_data.get('type', 'other'),
+                    'match_info': match.match_info,
+                    'context': index.get_context(match),
+                    'is_student_list': doc_data.get('is_student_list', False),
+                    'score': match.score,
+                    'approximate': match.is_approximate,
+                    'row': None
+                }
+                if result['is_student_list']:
+                    # Строка таблицы с совпадением: ФИО, школа, направление
+                    result['row'] = self.store.row_at(document.shift, document.url, match.start)
+                results.append(result)
+            
+            # По качеству совпадения, при равном - приоритет спискам студентов
+            results.sort(key=lambda result: (result['score'], not result['is_student_list']))
+            
+            logger.info(
+                f"🔍 Поиск '{query}' (тип: {search_type}): {len(results)} результатов "
+                f"за {(time.perf_counter() - started) * 1000:.2f} мс"
+            )
             return results
             
         except Exception as e:
             logger.error(f"❌ Ошибка поиска: {e}")
             return []
     
-    def _search_in_text(self, query, query_parts, text):
-        """Поиск в тексте с защитой от частичных совпадений"""
-        # 1. Точное совпадение полной фразы
-        if query in text:
-            return True, "полное совпадение"
-        
-        # 2. Если несколько слов - ищем только целую фразу
-        if len(query_parts) >= 2:
-            # Убираем логику поиска по частям - только полное совпадение фразы
-            # Проверяем различные варианты написания (с разными пробелами)
-            import re
-            
-            # Создаем паттерн для поиска с учетом возможных вариаций пробелов
-            pattern = r'\b' + r'\s+'.join(re.escape(part) for part in query_parts) + r'\b'
-            
-            if re.search(pattern, text, re.IGNORECASE):
-                return True, f"найдена фраза: {query}"
-            
-            # Проверяем инвертированный порядок (Имя Фамилия -> Фамилия Имя)
-            if len(query_parts) == 2:
-                reversed_query = f"{query_parts[1]} {query_parts[0]}"
-                if reversed_query in text:
-                    return True, f"найдена фраза (обратный порядок): {reversed_query}"
-                
-                # И с regex для обратного порядка
-                reversed_pattern = r'\b' + re.escape(query_parts[1]) + r'\s+' + re.escape(query_parts[0]) + r'\b'
-                if re.search(reversed_pattern, text, re.IGNORECASE):
-                    return True, f"найдена фраза (обратный порядок): {reversed_query}"
-        
-        # 3. Одно слово (если достаточно длинное)
-        elif len(query_parts) == 1 and len(query_parts[0]) >= 3:
-            # Используем границы слов для точного поиска
-            import re
-            pattern = r'\b' + re.escape(query_parts[0]) + r'\b'
-            if re.search(pattern, text, re.IGNORECASE):
-                return True, f"найдено слово: {query_parts[0]}"
-        
-        return False, ""
-    
-    def _get_context(self, text, query, query_parts, context_size=100):
-        """Получение контекста вокруг найденного текста"""
-        try:
-            index = text.find(query)
-            if index == -1 and query_parts:
-                index = text.find(query_parts[0])
-            
-            if index >= 0:
-                start = max(0, index - context_size)
-                end = min(len(text), index + len(query) + context_size)
-                context = text[start:end].strip()
-                context = re.sub(r'\s+', ' ', context)
-                return context[:200] + "..." if len(context) > 200 else context
-            
-            return ""
-        except Exception:
-            return ""
-    
     def get_cache_stats(self):
         """Статистика кэша"""
         try:
@@ -474,19 +745,22 @@ class ListsParser:
                 'total_documents': total_docs,
                 'student_lists': student_lists,
                 'last_update': self.last_update.strftime('%Y-%m-%d %H:%M:%S') if self.last_update else 'Никогда',
-                'cache_file_exists': os.path.exists(PDF_CACHE_FILE),
+                'cache_file_exists': os.path.exists(LISTS_STORE_FILE),
+                'store': self.store.get_stats() if self.store is not None else {},
+                'index': self.index.get_stats(),
+                'last_refresh': self.last_refresh_summary,
                 'ocr_available': OCR_AVAILABLE
             }
         except Exception as e:
             logger.error(f"❌ Ошибка статистики: {e}")
             return {}
     
-    async def update_cache(self, force=False):
+    async def update_cache(self, force=False, progress_callback: Optional[ProgressCallback] = None):
         """Обновление кэша"""
         try:
             logger.info("🔄 Обновление кэша...")
-            await self.preload_pdf_files(force_reload=force)
-            return True
+            result = await self.preload_pdf_files(force_reload=force, progress_callback=progress_callback)
+            return result is not None
         except Exception as e:
             logger.error(f"❌ Ошибка обновления кэша: {e}")
             return False
@@ -499,9 +773,14 @@ async def search_name_in_lists(query: str, search_type='all'):
     """Поиск имени в списках технопарка"""
     return await lists_parser.search_in_lists(query, search_type)
 
-async def update_lists_cache(force=False):
+async def update_lists_cache(force=False, progress_callback: Optional[ProgressCallback] = None):
     """Обновление кэша списков"""
-    return await lists_parser.update_cache(force)
+    return await lists_parser.update_cache(force, progress_callback)
+
+async def scheduled_update_lists() -> bool:
+    """Плановое обновление списков (задача планировщика)"""
+    # Через start_preload - не пересекается с загрузкой, начатой при запуске
+    return await lists_parser.start_preload() is not None
 
 def get_lists_stats():
     """Статистика списков"""
@@ -511,11 +790,12 @@ async def initialize_lists_parser():
     """Инициализация парсера списков"""
     try:
         logger.info("🚀 Инициализация парсера списков...")
+        await lists_parser.load()
         stats = lists_parser.get_cache_stats()
         
         if stats.get('total_documents', 0) == 0:
-            logger.info("📥 Кэш пуст, загружаем документы...")
-            await lists_parser.preload_pdf_files()
+            logger.info("📥 Кэш пуст, загружаем документы в фоне...")
+            lists_parser.start_preload()
         else:
             logger.info(f"📚 Загружен кэш: {stats['total_documents']} документов")
         
@@ -524,6 +804,10 @@ async def initialize_lists_parser():
         logger.error(f"❌ Ошибка инициализации: {e}")
         return False
 
+def shutdown_lists_parser():
+    """Остановка фоновой загрузки и пула процессов парсера списков"""
+    lists_parser.close()
+
 # Тестовый код для проверки работы модуля
 if __name__ == "__main__":
     import asyncio
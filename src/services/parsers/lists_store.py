@@ -0,0 +1,319 @@
+"""
+Хранилище извлечённых текстов списков технопарка (SQLite)
+
+Метаданные документов (название, тип, валидаторы HTTP, хэш) держатся в
+памяти, тексты хранятся на диске сжатыми zlib и читаются по требованию:
+при построении индекса - целиком и потоково, для контекста результата -
+только куски text_chunks (по TEXT_CHUNK_CHARS символов) вокруг совпадения,
+без распаковки всего документа.
+Запись идёт построчно: обновление одного документа не переписывает
+остальные.
+
+Строки списков участников (ФИО, школа, направление) хранятся в отдельной
+таблице list_rows с индексом по нормализованному ФИО.
+"""
+import json
+import logging
+import sqlite3
+import threading
+import zlib
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Поля метаданных документа (всё, кроме текста)
+META_FIELDS = (
+    'name', 'type', 'is_student_list', 'timestamp', 'checked_at',
+    'etag', 'last_modified', 'sha256', 'extraction', 'pages', 'ocr_pages',
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    shift TEXT NOT NULL,
+    url TEXT NOT NULL,
+    name TEXT NOT NULL,
+    type TEXT,
+    is_student_list INTEGER NOT NULL DEFAULT 0,
+    timestamp REAL,
+    checked_at REAL,
+    etag TEXT,
+    last_modified TEXT,
+    sha256 TEXT,
+    extraction TEXT,
+    pages INTEGER,
+    ocr_pages INTEGER,
+    text_length INTEGER NOT NULL DEFAULT 0,
+    text_z BLOB,
+    PRIMARY KEY (shift, url)
+);
+
+CREATE TABLE IF NOT EXISTS list_rows (
+    shift TEXT NOT NULL,
+    url TEXT NOT NULL,
+    row_index INTEGER NOT NULL,
+    list_kind TEXT NOT NULL,
+    row_number INTEGER,
+    full_name TEXT NOT NULL,
+    last_name TEXT,
+    first_name TEXT,
+    patronymic TEXT,
+    name_key TEXT NOT NULL,
+    school TEXT,
+    region TEXT,
+    class INTEGER,
+    direction TEXT,
+    section TEXT,
+    text_start INTEGER,
+    text_end INTEGER,
+    PRIMARY KEY (shift, url, row_index)
+);
+CREATE TABLE IF NOT EXISTS text_chunks (
+    shift TEXT NOT NULL,
+    url TEXT NOT NULL,
+    chunk INTEGER NOT NULL,
+    text_z BLOB NOT NULL,
+    PRIMARY KEY (shift, url, chunk)
+);
+
+CREATE INDEX IF NOT EXISTS idx_list_rows_name ON list_rows (name_key);
+CREATE INDEX IF NOT EXISTS idx_list_rows_position ON list_rows (shift, url, text_start);
+"""
+
+ROW_FIELDS = (
+    'list_kind', 'row_number', 'full_name', 'last_name', 'first_name', 'patronymic',
+    'name_key', 'school', 'region', 'class', 'direction', 'section', 'text_start', 'text_end',
+)
+
+COMPRESSION_LEVEL = 6
+
+# Символов текста в одном куске text_chunks
+TEXT_CHUNK_CHARS = 4096
+
+
+class ListsStore:
+    """SQLite-хранилище документов списков со сжатыми текстами"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        # Соединение используется из event loop и из потоков (построение
+        # индекса, запись), поэтому доступ сериализуется блокировкой
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+        self._backfill_chunks()
+
+    @staticmethod
+    def _chunk_values(shift: str, url: str, text: str) -> List[tuple]:
+        return [
+            (shift, url, number,
+             zlib.compress(text[start:start + TEXT_CHUNK_CHARS].encode('utf-8'), COMPRESSION_LEVEL))
+            for number, start in enumerate(range(0, len(text), TEXT_CHUNK_CHARS))
+        ]
+
+    def _write_chunks(self, shift: str, url: str, text: str) -> None:
+        """Заменить куски текста документа (вызывается под блокировкой в транзакции)"""
+        self._conn.execute("DELETE FROM text_chunks WHERE shift=? AND url=?", (shift, url))
+        self._conn.executemany(
+            "INSERT INTO text_chunks (shift, url, chunk, text_z) VALUES (?, ?, ?, ?)",
+            self._chunk_values(shift, url, text),
+        )
+
+    def _backfill_chunks(self) -> None:
+        """Куски текста для документов, сохранённых до появления text_chunks"""
+        with self._lock:
+            keys = self._conn.execute(
+                "SELECT shift, url FROM documents d WHERE text_z IS NOT NULL AND text_length > 0 "
+                "AND NOT EXISTS (SELECT 1 FROM text_chunks c WHERE c.shift=d.shift AND c.url=d.url)"
+            ).fetchall()
+        for shift, url in keys:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT text_z FROM documents WHERE shift=? AND url=?", (shift, url)
+                ).fetchone()
+                with self._conn:
+                    self._write_chunks(shift, url, zlib.decompress(row[0]).decode('utf-8'))
+        if keys:
+            logger.info(f"🧩 Тексты списков разбиты на куски для контекста: {len(keys)} документов")
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM documents LIMIT 1").fetchone() is None
+
+    def load_metadata(self) -> Dict[str, Dict[str, dict]]:
+        """Метаданные всех документов: {смена: {url: данные без текста}}"""
+        columns = ", ".join(META_FIELDS)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT shift, url, {columns} FROM documents ORDER BY rowid"
+            ).fetchall()
+
+        cache: Dict[str, Dict[str, dict]] = {}
+        for shift, url, *values in rows:
+            entry = {field: value for field, value in zip(META_FIELDS, values) if value is not None}
+            entry['is_student_list'] = bool(entry.get('is_student_list'))
+            cache.setdefault(shift, {})[url] = entry
+        return cache
+
+    def upsert(self, shift: str, url: str, entry: dict) -> None:
+        """
+        Записать документ
+
+        Если в entry есть 'text', текст сжимается и перезаписывается,
+        иначе обновляются только метаданные.
+        """
+        meta = {field: entry.get(field) for field in META_FIELDS}
+        meta['is_student_list'] = int(bool(meta['is_student_list']))
+        text = entry.get('text')
+
+        columns = ["shift", "url", *META_FIELDS]
+        values = [shift, url, *meta.values()]
+        if text is not None:
+            columns += ["text_length", "text_z"]
+            values += [len(text), zlib.compress(text.encode('utf-8'), COMPRESSION_LEVEL)]
+
+        updates = ", ".join(f"{column}=excluded.{column}" for column in columns[2:])
+        sql = (
+            f"INSERT INTO documents ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+            f"ON CONFLICT(shift, url) DO UPDATE SET {updates}"
+        )
+        with self._lock:
+            with self._conn:
+                self._conn.execute(sql, values)
+                if text is not None:
+                    self._write_chunks(shift, url, text)
+
+    def get_text_range(self, shift: str, url: str, start: int, end: int) -> str:
+        """Фрагмент текста документа [start, end): распаковываются только нужные куски"""
+        start = max(0, start)
+        if end <= start:
+            return ""
+        first, last = start // TEXT_CHUNK_CHARS, (end - 1) // TEXT_CHUNK_CHARS
+        with self._lock:
+            chunks = self._conn.execute(
+                "SELECT text_z FROM text_chunks WHERE shift=? AND url=? AND chunk BETWEEN ? AND ? ORDER BY chunk",
+                (shift, url, first, last),
+            ).fetchall()
+        text = "".join(zlib.decompress(chunk).decode('utf-8') for chunk, in chunks)
+        offset = first * TEXT_CHUNK_CHARS
+        return text[start - offset:end - offset]
+
+    def iter_texts(self) -> Iterator[Tuple[str, str, str]]:
+        """Потоковый обход текстов (смена, url, текст) без удержания их в памяти"""
+        with self._lock:
+            keys = self._conn.execute("SELECT shift, url FROM documents ORDER BY rowid").fetchall()
+
+        for shift, url in keys:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT text_z FROM documents WHERE shift=? AND url=?", (shift, url)
+                ).fetchone()
+            if row and row[0]:
+                yield shift, url, zlib.decompress(row[0]).decode('utf-8')
+
+    # === СТРОКИ СПИСКОВ ===
+
+    def replace_rows(self, shift: str, url: str, rows: List[dict]) -> None:
+        """Заменить строки документа (одной транзакцией)"""
+        columns = ", ".join(ROW_FIELDS)
+        placeholders = ", ".join("?" * (len(ROW_FIELDS) + 3))
+        values = [
+            (shift, url, row_index, *(row.get(field) for field in ROW_FIELDS))
+            for row_index, row in enumerate(rows)
+        ]
+        with self._lock:
+            with self._conn:
+                self._conn.execute("DELETE FROM list_rows WHERE shift=? AND url=?", (shift, url))
+                self._conn.executemany(
+                    f"INSERT INTO list_rows (shift, url, row_index, {columns}) VALUES ({placeholders})",
+                    values,
+                )
+
+    def count_rows(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM list_rows").fetchone()[0]
+
+    def _select_rows(self, where: str, params: tuple) -> List[dict]:
+        columns = ["shift", "url", *ROW_FIELDS]
+        with self._lock:
+            cursor = self._conn.execute(
+                f"SELECT {', '.join(columns)} FROM list_rows WHERE {where}", params
+            )
+            return [dict(zip(columns, values)) for values in cursor.fetchall()]
+
+    def row_at(self, shift: str, url: str, position: int) -> Optional[dict]:
+        """Строка списка, в которую попадает символ position текста документа"""
+        rows = self._select_rows(
+            "shift=? AND url=? AND text_start<=? AND text_end>? ORDER BY text_start DESC LIMIT 1",
+            (shift, url, position, position),
+        )
+        return rows[0] if rows else None
+
+    def find_rows(self, key: str, list_kind: Optional[str] = None) -> List[dict]:
+        """Строки по началу нормализованного ФИО ("иванов петр" -> "иванов петр сергеевич")"""
+        escaped = key.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        where = "(name_key = ? OR name_key LIKE ? ESCAPE '\\')"
+        params: tuple = (key, escaped + " %")
+        if list_kind:
+            where += " AND list_kind = ?"
+            params += (list_kind,)
+        return self._select_rows(where + " ORDER BY rowid", params)
+
+    def get_rows(self, list_kind: Optional[str] = None, url: Optional[str] = None) -> List[dict]:
+        """Все строки (с фильтром по виду списка и документу) в порядке документов"""
+        conditions, params = [], []
+        if list_kind:
+            conditions.append("list_kind = ?")
+            params.append(list_kind)
+        if url:
+            conditions.append("url = ?")
+            params.append(url)
+        where = " AND ".join(conditions) or "1"
+        return self._select_rows(where + " ORDER BY shift, url, row_index", tuple(params))
+
+    def import_legacy_json(self, json_path: Path) -> int:
+        """
+        Перенос документов из прежнего lists_cache.json
+
+        Файл после переноса переименовывается в *.migrated.
+
+        Returns:
+            Число перенесённых документов
+        """
+        with open(json_path, 'r', encoding='utf-8') as f:
+            legacy = json.load(f)
+
+        imported = 0
+        for shift, docs in legacy.items():
+            for url, entry in docs.items():
+                self.upsert(shift, url, entry)
+                imported += 1
+
+        json_path.rename(json_path.with_suffix(json_path.suffix + '.migrated'))
+        logger.info(f"📦 Кэш списков перенесён из {json_path.name} в SQLite: {imported} документов")
+        return imported
+
+    def get_stats(self) -> Dict[str, Optional[float]]:
+        """Размеры хранилища"""
+        with self._lock:
+            documents, raw, compressed = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(text_length), 0), COALESCE(SUM(LENGTH(text_z)), 0) FROM documents"
+            ).fetchone()
+            rows = self._conn.execute("SELECT COUNT(*) FROM list_rows").fetchone()[0]
+        return {
+            'documents': documents,
+            'rows': rows,
+            'text_chars': raw,
+            'compressed_bytes': compressed,
+            'file_bytes': self.path.stat().st_size if self.path.exists() else None,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
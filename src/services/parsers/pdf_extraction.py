@@ -0,0 +1,118 @@
+"""
+Извлечение текста из PDF в отдельных процессах
+
+Функции модуля выполняются в ProcessPoolExecutor парсера списков, поэтому
+модуль не импортирует конфигурацию и сервисы бота: дочерний процесс
+получает байты PDF (текстовый слой) или путь к временному файлу PDF (OCR
+страницы - чтобы не передавать весь файл в каждую задачу) и возвращает текст.
+
+Решение принимается по страницам: текстовый слой используется там, где он
+нормальный, распознаются только страницы без него. Результаты OCR
+кэшируются на диске по хэшу изображения страницы.
+"""
+import hashlib
+import io
+import os
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import PyPDF2
+
+# Каждый процесс пула распознаёт одну страницу - без внутренних потоков
+# Tesseract не конкурирует за ядра с соседними процессами
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+try:
+    from pdf2image import convert_from_path, pdfinfo_from_bytes
+    import pytesseract
+    OCR_AVAILABLE = True
+except ImportError:
+    OCR_AVAILABLE = False
+
+# Меньше этого объёма текстовый слой страницы считается отсутствующим
+MIN_PAGE_TEXT_LENGTH = 40
+# Минимальная доля букв среди непробельных символов нормального текста
+MIN_LETTER_RATIO = 0.5
+OCR_LANG = 'rus'
+
+
+def is_text_layer_good(page_text: str) -> bool:
+    """Пригоден ли текстовый слой страницы (не пустой и не мусор из глифов)"""
+    stripped = page_text.strip()
+    if len(stripped) < MIN_PAGE_TEXT_LENGTH:
+        return False
+    if "(cid:" in stripped or stripped.count("�") > len(stripped) // 100:
+        return False
+
+    visible = [char for char in stripped if not char.isspace()]
+    letters = sum(1 for char in visible if char.isalpha())
+    return letters >= MIN_LETTER_RATIO * len(visible)
+
+
+def extract_page_texts(pdf_content: bytes) -> Tuple[List[str], List[str]]:
+    """
+    Текстовый слой каждой страницы PDF
+
+    Returns:
+        (тексты страниц, предупреждения). Если PyPDF2 не смог прочитать
+        файл, число страниц берётся у poppler, тексты страниц пустые.
+    """
+    warnings = []
+    try:
+        with io.BytesIO(pdf_content) as file_stream:
+            reader = PyPDF2.PdfReader(file_stream)
+            page_texts = []
+            for page in reader.pages:
+                try:
+                    page_texts.append(page.extract_text() or "")
+                except Exception as e:
+                    warnings.append(f"Текстовый слой страницы {len(page_texts) + 1} не прочитан: {e}")
+                    page_texts.append("")
+            return page_texts, warnings
+    except Exception as e:
+        warnings.append(f"Стандартное извлечение не удалось: {e}")
+
+    if OCR_AVAILABLE:
+        try:
+            return [""] * pdfinfo_from_bytes(pdf_content)["Pages"], warnings
+        except Exception as e:
+            warnings.append(f"Не удалось определить число страниц: {e}")
+    return [], warnings
+
+
+def _page_cache_path(cache_dir: str, image_hash: str) -> Path:
+    return Path(cache_dir) / image_hash[:2] / f"{image_hash}.txt"
+
+
+def ocr_page(pdf_path: str, page_number: int, dpi: int, cache_dir: Optional[str]) -> Tuple[str, bool]:
+    """
+    Распознать одну страницу PDF-файла pdf_path (нумерация с 1)
+
+    Страница растеризуется в оттенках серого с заданным DPI. Ключ кэша -
+    SHA-256 пикселей страницы, поэтому одинаковые страницы в повторно
+    опубликованных PDF не распознаются заново.
+
+    Returns:
+        (текст страницы, взят ли результат из кэша)
+    """
+    image = convert_from_path(
+        pdf_path, dpi=dpi, first_page=page_number, last_page=page_number, grayscale=True
+    )[0]
+
+    cache_path = None
+    if cache_dir:
+        digest = hashlib.sha256(f"{OCR_LANG}:{image.size}:".encode())
+        digest.update(image.tobytes())
+        cache_path = _page_cache_path(cache_dir, digest.hexdigest())
+        if cache_path.exists():
+            return cache_path.read_text(encoding="utf-8"), True
+
+    text = pytesseract.image_to_string(image, lang=OCR_LANG)
+
+    if cache_path is not None:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_text(text, encoding="utf-8")
+        os.replace(tmp_path, cache_path)
+
+    return text, False
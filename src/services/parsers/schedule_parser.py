@@ -2,12 +2,16 @@ import asyncio
 import json
 import logging
 import re
-from datetime import datetime
-from typing import List, Dict, Optional, Tuple
-import aiohttp
+from datetime import date, datetime
+from typing import List, Dict, Optional, Tuple, Union
 from bs4 import BeautifulSoup
 import os
 
+from src.services.crawler import HTML_PARSER, crawler
+from src.services.parsers.shift_documents import extract_shift_documents
+from src.services.parsers.shift_repository import ShiftRecord, shift_repository
+from src.services.refresh import background_refresher
+
 logger = logging.getLogger(__name__)
 
 class ScheduleParser:
@@ -16,11 +20,10 @@ class ScheduleParser:
     def __init__(self):
         from ...core.config import config
         self.url = "https://ndtp.by/educational-shifts/schedule/"
-        self.headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-        }
         self.shifts_file = config.parsers_data_dir / "current_shifts.json"
         self.last_update_file = config.parsers_data_dir / "last_schedule_update.txt"
+        # Время последнего обновления читается с диска один раз
+        self._last_update: Optional[datetime] = None
         
         # Словарь для названий месяцев
         self.month_map = {
@@ -68,30 +71,12 @@ class ScheduleParser:
     
     async def fetch_page(self) -> Optional[str]:
         """Получает HTML страницы с расписанием"""
-        try:
-            logger.info(f"🌐 Запрос к {self.url}")
-            
-            async with aiohttp.ClientSession() as session:
-                async with session.get(self.url, headers=self.headers, timeout=30) as response:
-                    if response.status == 200:
-                        content = await response.text()
-                        logger.info(f"✅ Страница успешно загружена ({len(content)} символов)")
-                        return content
-                    else:
-                        logger.error(f"❌ Ошибка загрузки страницы: HTTP {response.status}")
-                        return None
-                        
-        except asyncio.TimeoutError:
-            logger.error("❌ Таймаут при загрузке страницы")
-        except Exception as e:
-            logger.error(f"❌ Ошибка при загрузке страницы: {e}")
-        
-        return None
+        return await crawler.fetch_text(self.url)
     
-    def parse_shifts(self, html_content: str) -> List[Dict]:
-        """Парсит HTML и извлекает информацию о сменах"""
+    def parse_shifts(self, html_content: Union[str, BeautifulSoup]) -> List[Dict]:
+        """Парсит HTML (или уже разобранное дерево) и извлекает информацию о сменах"""
         try:
-            soup = BeautifulSoup(html_content, 'html.parser')
+            soup = html_content if isinstance(html_content, BeautifulSoup) else BeautifulSoup(html_content, HTML_PARSER)
             
             # Найдем все панели аккордеона
             panels = soup.find_all('div', class_='fusion-panel')
@@ -177,6 +162,16 @@ class ScheduleParser:
             logger.error(f"❌ Ошибка парсинга HTML: {e}")
             return []
     
+    def _parse_page(self, soup: BeautifulSoup) -> Tuple[List[Dict], Optional[Dict[int, List[Dict]]]]:
+        """Смены и документы смен из одного дерева страницы"""
+        shifts = self.parse_shifts(soup)
+        try:
+            documents = extract_shift_documents(soup)
+        except Exception as e:
+            logger.error(f"❌ Ошибка извлечения документов смен: {e}")
+            documents = None
+        return shifts, documents
+    
     def get_month_from_name(self, month_name: str) -> int:
         """Получает номер месяца по названию"""
         month_mapping = {
@@ -186,8 +181,8 @@ class ScheduleParser:
         }
         return month_mapping.get(month_name, 1)
     
-    def save_shifts(self, shifts: List[Dict]) -> bool:
-        """Сохраняет список смен в JSON файл"""
+    def save_shifts(self, shifts: List[Dict], documents: Optional[Dict[int, List[Dict]]] = None) -> bool:
+        """Сохраняет список смен (и документы смен по месяцам) в JSON файл"""
         try:
             # Добавляем метаданные
             data = {
@@ -196,13 +191,21 @@ class ScheduleParser:
                 "source_url": self.url,
                 "shifts": shifts
             }
+            if documents is not None:
+                data["documents"] = {str(month): docs for month, docs in sorted(documents.items())}
             
             with open(self.shifts_file, 'w', encoding='utf-8') as f:
                 json.dump(data, f, ensure_ascii=False, indent=2)
+            shift_repository.invalidate()
+            
+            # Даты приема заявок могли измениться - перестроить план напоминаний
+            from src.services.reminders import reminder_planner
+            reminder_planner.reschedule()
             
             # Сохраняем время последнего обновления
+            self._last_update = datetime.now()
             with open(self.last_update_file, 'w', encoding='utf-8') as f:
-                f.write(datetime.now().isoformat())
+                f.write(self._last_update.isoformat())
             
             logger.info(f"💾 Данные сохранены в {self.shifts_file}")
             return True
@@ -212,27 +215,21 @@ class ScheduleParser:
             return False
     
     def load_shifts(self) -> Optional[Dict]:
-        """Загружает сохраненные данные о сменах"""
-        try:
-            if os.path.exists(self.shifts_file):
-                with open(self.shifts_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                logger.info(f"📖 Загружены данные: {data.get('total_shifts', 0)} смен")
-                return data
-        except Exception as e:
-            logger.error(f"❌ Ошибка загрузки данных: {e}")
-        return None
+        """Загружает сохраненные данные о сменах (из общей модели в памяти)"""
+        return shift_repository.get_data()
     
     def get_last_update_time(self) -> Optional[datetime]:
         """Получает время последнего обновления"""
+        if self._last_update is not None:
+            return self._last_update
         try:
             if os.path.exists(self.last_update_file):
                 with open(self.last_update_file, 'r', encoding='utf-8') as f:
                     time_str = f.read().strip()
-                return datetime.fromisoformat(time_str)
+                self._last_update = datetime.fromisoformat(time_str)
         except Exception as e:
             logger.error(f"❌ Ошибка получения времени обновления: {e}")
-        return None
+        return self._last_update
     
     def should_update(self, hours_threshold: int = 6) -> bool:
         """Проверяет, нужно ли обновлять данные"""
@@ -246,7 +243,7 @@ class ScheduleParser:
         if should_update:
             logger.info(f"⏰ Данные устарели (последнее обновление: {last_update})")
         else:
-            logger.info(f"✅ Данные актуальны (последнее обновление: {last_update})")
+            logger.debug(f"✅ Данные актуальны (последнее обновление: {last_update})")
         
         return should_update
     
@@ -258,18 +255,19 @@ class ScheduleParser:
             
             logger.info("🔄 Начинаем обновление расписания смен...")
             
-            # Получаем страницу
-            html_content = await self.fetch_page()
-            if not html_content:
+            # Получаем разобранную страницу (общую с календарём);
+            # принудительное обновление всегда перепроверяет её на сайте
+            soup = await crawler.soup(self.url, max_age=0 if force else None)
+            if soup is None:
                 return False
             
-            # Парсим данные
-            shifts = self.parse_shifts(html_content)
+            # Парсим данные и документы смен для календаря
+            shifts, documents = await asyncio.to_thread(self._parse_page, soup)
             if not shifts:
                 logger.warning("⚠️ Не удалось извлечь данные о сменах")
                 return False
             
-            # Создаем новые данные для проверки изменений
+            # Новые данные для сравнения с прошлым расписанием
             new_shifts_data = {
                 "last_updated": datetime.now().isoformat(),
                 "total_shifts": len(shifts),
@@ -277,32 +275,23 @@ class ScheduleParser:
                 "shifts": shifts
             }
             
-            # Проверяем изменения в расписании для уведомлений
+            if not self.save_shifts(shifts, documents):
+                return False
+            logger.info(f"✅ Расписание успешно обновлено: {len(shifts)} смен")
+            
+            # События изменений пишутся только для сохранённого расписания
             try:
                 from src.handlers.notification_system import notification_system
-                changes = notification_system.check_schedule_changes(new_shifts_data)
-                
-                # Сохраняем данные
-                if self.save_shifts(shifts):
-                    logger.info(f"✅ Расписание успешно обновлено: {len(shifts)} смен")
-                    
-                    # Отправляем уведомления об изменениях (если есть)
-                    if changes and changes.get("has_changes"):
-                        logger.info("📬 Обнаружены изменения в расписании - отправляем уведомления")
-                        await notification_system.send_schedule_update_notification(changes)
-                    
-                    return True
-                else:
-                    return False
-                    
             except ImportError:
                 logger.warning("⚠️ Система уведомлений недоступна")
-                # Сохраняем данные без уведомлений
-                if self.save_shifts(shifts):
-                    logger.info(f"✅ Расписание успешно обновлено: {len(shifts)} смен")
-                    return True
-                else:
-                    return False
+                return True
+            
+            changes = notification_system.check_schedule_changes(new_shifts_data)
+            if changes and changes.get("has_changes"):
+                logger.info("📬 Обнаружены изменения в расписании - отправляем уведомления")
+                await notification_system.send_schedule_update_notification(changes)
+            
+            return True
                 
         except Exception as e:
             logger.error(f"❌ Ошибка обновления расписания: {e}")
@@ -310,14 +299,16 @@ class ScheduleParser:
     
     def get_current_shifts_info(self) -> str:
         """Возвращает текущую информацию о сменах для контекста ИИ"""
-        data = self.load_shifts()
-        if not data or not data.get('shifts'):
+        return shift_repository.memoize('current_shifts_info', self._render_current_shifts_info)
+    
+    def _render_current_shifts_info(self) -> str:
+        data = shift_repository.get_data()
+        records = shift_repository.get_records()
+        if not data or not records:
             return "Информация о расписании смен недоступна."
         
-        shifts = data['shifts']
-        
-        # Сортируем смены по дате начала
-        shifts_sorted = sorted(shifts, key=lambda x: datetime.strptime(x['start_date'], '%d.%m.%Y'))
+        # Сортируем смены по дате начала (без даты - в конец)
+        shifts_sorted = sorted(records, key=lambda record: record.start or date.max)
         
         info_parts = [
             f"📅 АКТУАЛЬНОЕ РАСПИСАНИЕ СМЕН (обновлено: {data['last_updated'][:16]})",
@@ -325,29 +316,20 @@ class ScheduleParser:
         ]
         
         for shift in shifts_sorted:
-            try:
-                # Используем новую функцию для определения статуса
-                shift_status, app_status = self.get_shift_status(shift, datetime.now())
-                
-                info_parts.extend([
-                    f"• {shift['name']}: {shift['start_date']} - {shift['end_date']}",
-                    f"  Статус смены: {shift_status}",
-                    f"  Прием заявок: {app_status}",
-                    ""
-                ])
-                
-            except Exception as e:
-                logger.error(f"Ошибка обработки смены {shift.get('name', 'Unknown')}: {e}")
-                continue
+            shift_status, app_status = shift_repository.get_status(shift)
+            
+            info_parts.extend([
+                f"• {shift.name}: {shift.start_date} - {shift.end_date}",
+                f"  Статус смены: {shift_status}",
+                f"  Прием заявок: {app_status}",
+                ""
+            ])
         
         return "\n".join(info_parts)
     
     def get_shifts_for_query(self, query: str) -> str:
         """Возвращает информацию о сменах для запроса пользователя"""
         try:
-            with open(self.shifts_file, 'r', encoding='utf-8') as file:
-                data = json.load(file)
-            
             # Проверяем, связан ли запрос с подачей заявок
             application_keywords = ['заявк', 'подач', 'подать', 'записат', 'регистр', 'поступ']
             is_about_applications = any(keyword in query.lower() for keyword in application_keywords)
@@ -356,144 +338,109 @@ class ScheduleParser:
                 return self.get_available_shifts_for_application()
             
             # Обычный запрос - показываем все смены
-            info_parts = [
-                "📅 РАСПИСАНИЕ ОБРАЗОВАТЕЛЬНЫХ СМЕН НА 2025 ГОД",
-                f"Обновлено: {data['last_updated']}",
-                f"Сегодня: {datetime.now().strftime('%d.%m.%Y (%A)')}",
-                ""
-            ]
-            
-            for shift in data['shifts']:
-                # Используем новую функцию для определения статуса
-                shift_status, app_status = self.get_shift_status(shift, datetime.now())
-                
-                info_parts.append(f"🎓 {shift['name']}")
-                info_parts.append(f"📅 Даты: {shift['start_date']} - {shift['end_date']}")
-                info_parts.append(f"📊 Статус: {shift_status}")
-                info_parts.append(f"📝 Заявки: {app_status}")
-                info_parts.append("")
+            return shift_repository.memoize('shifts_for_query', self._render_shifts_for_query)
             
-            return "\n".join(info_parts)
-            
-        except FileNotFoundError:
-            return "❌ Информация о расписании временно недоступна"
         except Exception as e:
             logger.error(f"Ошибка получения информации о сменах: {e}")
             return "❌ Ошибка загрузки информации о сменах"
     
+    def _render_shifts_for_query(self) -> str:
+        data = shift_repository.get_data()
+        if data is None:
+            return "❌ Информация о расписании временно недоступна"
+        
+        info_parts = [
+            "📅 РАСПИСАНИЕ ОБРАЗОВАТЕЛЬНЫХ СМЕН НА 2025 ГОД",
+            f"Обновлено: {data['last_updated']}",
+            f"Сегодня: {datetime.now().strftime('%d.%m.%Y (%A)')}",
+            ""
+        ]
+        
+        for shift in shift_repository.get_records():
+            shift_status, app_status = shift_repository.get_status(shift)
+            
+            info_parts.append(f"🎓 {shift.name}")
+            info_parts.append(f"📅 Даты: {shift.start_date} - {shift.end_date}")
+            info_parts.append(f"📊 Статус: {shift_status}")
+            info_parts.append(f"📝 Заявки: {app_status}")
+            info_parts.append("")
+        
+        return "\n".join(info_parts)
+    
     def get_shift_status(self, shift: Dict, current_date: datetime) -> Tuple[str, str]:
         """Определяет статус смены и заявок на основе текущей даты"""
-        try:
-            start_date = datetime.strptime(shift['start_date'], '%d.%m.%Y').date()
-            end_date = datetime.strptime(shift['end_date'], '%d.%m.%Y').date()
-            current_date_only = current_date.date()
-            
-            # Определяем статус смены
-            if current_date_only < start_date:
-                if (start_date - current_date_only).days <= 30:
-                    shift_status = "🔜 Скоро начнется"
-                else:
-                    shift_status = "📅 Запланирована"
-            elif start_date <= current_date_only <= end_date:
-                shift_status = "⚡ Активная смена"
-            else:
-                shift_status = "✅ Завершена"
-            
-            # Определяем статус заявок
-            app_status = "❓ Информация уточняется"
-            
-            if shift.get('application_start_date') and shift.get('application_end_date'):
-                try:
-                    app_start = datetime.strptime(shift['application_start_date'], '%d.%m.%Y').date()
-                    app_end = datetime.strptime(shift['application_end_date'], '%d.%m.%Y').date()
-                    
-                    if current_date_only < app_start:
-                        app_status = f"🔜 Скоро откроется ({shift['application_start_date']})"
-                    elif app_start <= current_date_only <= app_end:
-                        app_status = f"🟢 Прием открыт (до {shift['application_end_date']})"
-                    else:
-                        app_status = f"🔴 Прием закрыт (был до {shift['application_end_date']})"
-                except ValueError:
-                    pass
-            elif shift.get('raw_status') == "Подачи нет":
-                app_status = "🔴 Подача заявок закрыта"
-            
-            return shift_status, app_status
-            
-        except (ValueError, KeyError) as e:
-            logger.warning(f"⚠️ Ошибка определения статуса для смены {shift.get('name', 'Unknown')}: {e}")
-            return "❓ Статус неизвестен", "❓ Информация уточняется"
+        return ShiftRecord.from_dict(shift).status(current_date.date())
     
     def get_available_shifts_for_application(self) -> str:
         """Возвращает информацию о доступных для подачи заявок сменах"""
         try:
-            with open(self.shifts_file, 'r', encoding='utf-8') as file:
-                data = json.load(file)
-            
-            available_shifts = []
-            upcoming_shifts = []
-            
-            for shift in data['shifts']:
-                shift_status, app_status = self.get_shift_status(shift, datetime.now())
-                
-                # Собираем смены с открытыми заявками
-                if "🟢" in app_status:  # Открытые заявки
-                    available_shifts.append((shift, shift_status, app_status))
-                elif "🟡" in app_status:  # Скоро откроются
-                    upcoming_shifts.append((shift, shift_status, app_status))
-            
-            info_parts = [
-                "📝 ИНФОРМАЦИЯ О ПОДАЧЕ ЗАЯВОК НА ОБРАЗОВАТЕЛЬНЫЕ СМЕНЫ",
-                f"Актуально на: {datetime.now().strftime('%d.%m.%Y')}", 
-                ""
-            ]
-            
-            if available_shifts:
-                info_parts.append("🟢 СЕЙЧАС ОТКРЫТ ПРИЕМ ЗАЯВОК:")
+            return shift_repository.memoize('available_shifts', self._render_available_shifts)
+        except Exception as e:
+            logger.error(f"Ошибка получения доступных смен: {e}")
+            return "❌ Ошибка загрузки информации о доступных сменах"
+    
+    def _render_available_shifts(self) -> str:
+        if shift_repository.get_data() is None:
+            return "❌ Информация о расписании временно недоступна"
+        records = shift_repository.get_records()
+        
+        available_shifts = []
+        upcoming_shifts = []
+        
+        for shift in records:
+            shift_status, app_status = shift_repository.get_status(shift)
+            
+            # Собираем смены с открытыми заявками
+            if "🟢" in app_status:  # Открытые заявки
+                available_shifts.append((shift, shift_status, app_status))
+            elif "🟡" in app_status:  # Скоро откроются
+                upcoming_shifts.append((shift, shift_status, app_status))
+        
+        info_parts = [
+            "📝 ИНФОРМАЦИЯ О ПОДАЧЕ ЗАЯВОК НА ОБРАЗОВАТЕЛЬНЫЕ СМЕНЫ",
+            f"Актуально на: {datetime.now().strftime('%d.%m.%Y')}", 
+            ""
+        ]
+        
+        if available_shifts:
+            info_parts.append("🟢 СЕЙЧАС ОТКРЫТ ПРИЕМ ЗАЯВОК:")
+            info_parts.append("")
+            
+            for shift, shift_status, app_status in available_shifts:
+                info_parts.append(f"✅ {shift.name}")
+                info_parts.append(f"📅 Даты смены: {shift.start_date} - {shift.end_date}")
+                info_parts.append(f"📝 {app_status}")
                 info_parts.append("")
-                
-                for shift, shift_status, app_status in available_shifts:
-                    info_parts.append(f"✅ {shift['name']}")
-                    info_parts.append(f"📅 Даты смены: {shift['start_date']} - {shift['end_date']}")
-                    info_parts.append(f"📝 {app_status}")
-                    info_parts.append("")
-            
-            if upcoming_shifts:
-                info_parts.append("🟡 СКОРО ОТКРОЕТСЯ ПРИЕМ ЗАЯВОК:")
+        
+        if upcoming_shifts:
+            info_parts.append("🟡 СКОРО ОТКРОЕТСЯ ПРИЕМ ЗАЯВОК:")
+            info_parts.append("")
+            
+            for shift, shift_status, app_status in upcoming_shifts:
+                info_parts.append(f"⏰ {shift.name}")
+                info_parts.append(f"📅 Даты смены: {shift.start_date} - {shift.end_date}")
+                info_parts.append(f"📝 {app_status}")
                 info_parts.append("")
+        
+        if not available_shifts and not upcoming_shifts:
+            info_parts.append("🔴 К сожалению, сейчас нет открытых смен для подачи заявок.")
+            info_parts.append("")
+            info_parts.append("📋 Все смены на 2025 год:")
+            info_parts.append("")
+            
+            for shift in records:
+                shift_status, app_status = shift_repository.get_status(shift)
                 
-                for shift, shift_status, app_status in upcoming_shifts:
-                    info_parts.append(f"⏰ {shift['name']}")
-                    info_parts.append(f"📅 Даты смены: {shift['start_date']} - {shift['end_date']}")
-                    info_parts.append(f"📝 {app_status}")
-                    info_parts.append("")
-            
-            if not available_shifts and not upcoming_shifts:
-                info_parts.append("🔴 К сожалению, сейчас нет открытых смен для подачи заявок.")
+                info_parts.append(f"• {shift.name}: {shift.start_date} - {shift.end_date}")
+                info_parts.append(f"  {app_status}")
                 info_parts.append("")
-                info_parts.append("📋 Все смены на 2025 год:")
-                info_parts.append("")
-                
-                for shift in data['shifts']:
-                    # Используем новую функцию для определения статуса
-                    shift_status, app_status = self.get_shift_status(shift, datetime.now())
-                    
-                    info_parts.append(f"• {shift['name']}: {shift['start_date']} - {shift['end_date']}")
-                    info_parts.append(f"  {app_status}")
-                    info_parts.append("")
-                
-                info_parts.append("💡 Рекомендации:")
-                info_parts.append("• Следите за обновлениями на сайте ndtp.by")
-                info_parts.append("• Подготовьте проект заранее")
-                info_parts.append("• При вопросах обращайтесь к консультанту через /help")
-            
-            return "\n".join(info_parts)
             
-        except FileNotFoundError:
-            return "❌ Информация о расписании временно недоступна"
-        except Exception as e:
-            logger.error(f"Ошибка получения доступных смен: {e}")
-            return "❌ Ошибка загрузки информации о доступных сменах"
+            info_parts.append("💡 Рекомендации:")
+            info_parts.append("• Следите за обновлениями на сайте ndtp.by")
+            info_parts.append("• Подготовьте проект заранее")
+            info_parts.append("• При вопросах обращайтесь к консультанту через /help")
+        
+        return "\n".join(info_parts)
 
 # Глобальный экземпляр парсера
 schedule_parser = ScheduleParser()
@@ -502,8 +449,10 @@ schedule_parser = ScheduleParser()
 async def get_schedule_context_async(query: str = "") -> str:
     """Асинхронно получает контекст о расписании смен"""
     try:
-        # Обновляем данные если нужно
-        await schedule_parser.update_schedule()
+        # Отвечаем по сохранённому снимку, устаревшие данные обновляются в фоне
+        background_refresher.refresh_if_stale(
+            "schedule", schedule_parser.should_update, schedule_parser.update_schedule
+        )
         
         # Возвращаем релевантную информацию
         if query:
@@ -531,15 +480,7 @@ async def force_update_schedule() -> bool:
     """Принудительно обновляет расписание"""
     return await schedule_parser.update_schedule(force=True)
 
-# Функция для автоматического обновления
-async def schedule_updater_loop(interval_hours: int = 6):
-    """Цикл автоматического обновления расписания"""
-    logger.info(f"🔄 Запущен цикл обновления расписания (каждые {interval_hours} часов)")
-    
-    while True:
-        try:
-            await schedule_parser.update_schedule()
-            await asyncio.sleep(interval_hours * 3600)  # Ждем указанное количество часов
-        except Exception as e:
-            logger.error(f"❌ Ошибка в цикле обновления расписания: {e}")
-            await asyncio.sleep(300)  # При ошибке ждем 5 минут и пробуем снова 
\ No newline at end of file
+async def scheduled_update_schedule() -> bool:
+    """Плановое обновление расписания (задача планировщика)"""
+    # Через background_refresher - не пересекается с обновлением по устаревшему чтению
+    return await background_refresher.run("schedule", schedule_parser.update_schedule)
@@ -0,0 +1,144 @@
+"""
+Документы смен со страницы расписания
+
+Ссылки на положения, списки участников и места проведения извлекаются из
+панелей аккордеона за один проход по странице - сразу для всех смен.
+Результат сохраняется вместе с расписанием (current_shifts.json, ключ
+"documents") и отдаётся календарю из памяти.
+"""
+import logging
+import re
+from typing import Dict, List
+
+from bs4 import BeautifulSoup
+
+logger = logging.getLogger(__name__)
+
+BASE_URL = "https://ndtp.by"
+
+MONTH_SHIFT_NAMES = {
+    1: "Январская", 2: "Февральская", 3: "Мартовская", 4: "Апрельская",
+    5: "Майская", 6: "Июньская", 7: "Июльская", 8: "Августовская",
+    9: "Сентябрьская", 10: "Октябрьская", 11: "Ноябрьская", 12: "Декабрьская"
+}
+
+DOCUMENT_EXTENSIONS = ('.pdf', '.doc', '.docx')
+DOCUMENT_KEYWORDS = [
+    'положение', 'список', 'состав', 'участник',
+    'место', 'проведение', 'зачисл', 'смен', 'группа'
+]
+
+
+def classify_document(title: str) -> str:
+    """Классифицирует тип документа"""
+    title_lower = title.lower()
+
+    if 'положение' in title_lower:
+        return 'regulation'
+    elif 'список' in title_lower and 'участник' in title_lower:
+        return 'participants_list'
+    elif 'место' in title_lower and 'проведение' in title_lower:
+        return 'venues'
+    elif 'зачисл' in title_lower:
+        return 'enrolled_list'
+    else:
+        return 'other'
+
+
+def shorten_document_title(title: str) -> str:
+    """Сокращает название документа для красивого отображения"""
+    title_lower = title.lower()
+
+    # Положение об образовательной смене - оставляем как есть
+    if 'положение' in title_lower and 'образовательн' in title_lower:
+        return "Положение об образовательной смене"
+
+    # Список участников, допущенных ко второму этапу
+    if ('список' in title_lower or 'состав' in title_lower) and \
+       ('участник' in title_lower) and \
+       ('допущ' in title_lower or 'втор' in title_lower or '2' in title):
+        return "Список участников 2 этапа"
+
+    # Места проведения - оставляем как есть
+    if 'место' in title_lower and 'проведен' in title_lower:
+        return "Места проведения"
+
+    # Список зачисленных в НДТП
+    if ('список' in title_lower or 'состав' in title_lower) and \
+       ('зачислен' in title_lower or 'групп' in title_lower) and \
+       ('технопарк' in title_lower or 'ндтп' in title_lower):
+        return "Список зачисленных в НДТП"
+
+    # Если ничего не подошло, оставляем оригинальное название, но укорачиваем
+    if len(title) > 45:
+        return title[:42] + "..."
+
+    return title
+
+
+def _absolute_url(href: str) -> str:
+    if href.startswith('/'):
+        return BASE_URL + href
+    if href.startswith('http'):
+        return href
+    return BASE_URL + '/' + href
+
+
+def _panel_documents(content) -> List[Dict]:
+    """Ссылки на документы в контенте панели"""
+    documents = []
+    for link in content.find_all('a', href=True):
+        href = link.get('href', '')
+        text = link.get_text(strip=True)
+
+        # Пропускаем пустые ссылки
+        if not text or not href:
+            continue
+
+        # Фильтруем ссылки на документы PDF и DOC
+        text_lower = text.lower()
+        if not (href.endswith(DOCUMENT_EXTENSIONS) or any(keyword in text_lower for keyword in DOCUMENT_KEYWORDS)):
+            continue
+
+        clean_title = re.sub(r'\s+', ' ', text).strip()
+        documents.append({
+            'title': shorten_document_title(clean_title),
+            'url': _absolute_url(href),
+            'type': classify_document(text),
+        })
+    return documents
+
+
+def extract_shift_documents(soup: BeautifulSoup) -> Dict[int, List[Dict]]:
+    """
+    Документы всех смен страницы расписания
+
+    Returns:
+        {номер месяца: [{'title', 'url', 'type'}, ...]} для каждой смены,
+        у которой есть панель (список пуст, если документов нет). Для
+        смены берётся первая панель с документами.
+    """
+    documents_by_month: Dict[int, List[Dict]] = {}
+
+    for panel in soup.find_all('div', class_='fusion-panel'):
+        title_elem = panel.find('span', class_='fusion-toggle-heading')
+        if not title_elem:
+            continue
+
+        title_text = title_elem.get_text()
+        months = [month for month, name in MONTH_SHIFT_NAMES.items() if name in title_text]
+        months = [month for month in months if not documents_by_month.get(month)]
+        if not months:
+            continue
+
+        # Ищем контент панели (на сайте встречаются оба варианта разметки)
+        content = panel.find('div', class_='panel-body') or panel.find('div', class_='fusion-toggle-content')
+        documents = _panel_documents(content) if content else []
+        for month in months:
+            documents_by_month[month] = documents
+
+    logger.info(
+        f"📄 Документы смен: {sum(len(docs) for docs in documents_by_month.values())} "
+        f"в {len(documents_by_month)} сменах"
+    )
+    return documents_by_month
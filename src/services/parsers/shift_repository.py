@@ -0,0 +1,238 @@
+"""
+Модель расписания смен в памяти процесса
+
+current_shifts.json читается один раз и перечитывается, только когда файл
+изменился (по mtime и размеру). Смены хранятся неизменяемыми ShiftRecord с
+уже разобранными датами; статусы считаются один раз в день, готовые тексты
+ответов и календаря запоминаются по (версия данных, дата).
+
+Документы смен (ключ "documents", собирается при обходе сайта) хранятся по
+номеру месяца и отдаются календарю без обращения к сайту.
+"""
+import json
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from datetime import date, datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple, TypeVar
+
+from src.core.config import config
+
+logger = logging.getLogger(__name__)
+
+# Как часто проверять mtime файла (чаще - без обращения к диску)
+STAT_INTERVAL = 5.0
+
+T = TypeVar("T")
+
+
+def parse_date(value: Optional[str]) -> Optional[date]:
+    """Дата из строки DD.MM.YYYY (день и месяц могут быть без нуля)"""
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%d.%m.%Y').date()
+    except ValueError:
+        return None
+
+
+@dataclass(frozen=True)
+class ShiftRecord:
+    """Смена с исходными строками дат (для вывода) и разобранными датами"""
+
+    name: str
+    start_date: str
+    end_date: str
+    month_number: int
+    raw_status: str
+    application_start_date: Optional[str]
+    application_end_date: Optional[str]
+    start: Optional[date]
+    end: Optional[date]
+    application_start: Optional[date]
+    application_end: Optional[date]
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "ShiftRecord":
+        return cls(
+            name=data.get('name', ''),
+            start_date=data.get('start_date', ''),
+            end_date=data.get('end_date', ''),
+            month_number=data.get('month_number', 0),
+            raw_status=data.get('raw_status', ''),
+            application_start_date=data.get('application_start_date'),
+            application_end_date=data.get('application_end_date'),
+            start=parse_date(data.get('start_date')),
+            end=parse_date(data.get('end_date')),
+            application_start=parse_date(data.get('application_start_date')),
+            application_end=parse_date(data.get('application_end_date')),
+        )
+
+    @property
+    def has_application_period(self) -> bool:
+        return bool(self.application_start_date and self.application_end_date)
+
+    def status(self, today: date) -> Tuple[str, str]:
+        """Статус смены и статус приема заявок на дату"""
+        if self.start is None or self.end is None:
+            return "❓ Статус неизвестен", "❓ Информация уточняется"
+
+        if today < self.start:
+            shift_status = "🔜 Скоро начнется" if (self.start - today).days <= 30 else "📅 Запланирована"
+        elif today <= self.end:
+            shift_status = "⚡ Активная смена"
+        else:
+            shift_status = "✅ Завершена"
+
+        app_status = "❓ Информация уточняется"
+        if self.has_application_period:
+            if self.application_start is not None and self.application_end is not None:
+                if today < self.application_start:
+                    app_status = f"🔜 Скоро откроется ({self.application_start_date})"
+                elif today <= self.application_end:
+                    app_status = f"🟢 Прием открыт (до {self.application_end_date})"
+                else:
+                    app_status = f"🔴 Прием закрыт (был до {self.application_end_date})"
+        elif self.raw_status == "Подачи нет":
+            app_status = "🔴 Подача заявок закрыта"
+
+        return shift_status, app_status
+
+
+class ShiftRepository:
+    """Расписание смен с пересчётом статусов раз в день"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._signature: Optional[Tuple[int, int]] = None
+        self._checked_at = 0.0
+        self._data: Optional[Dict] = None
+        self._records: Tuple[ShiftRecord, ...] = ()
+        self._by_month: Dict[int, ShiftRecord] = {}
+        # None - документы ещё не собирались (старый формат файла)
+        self._documents: Optional[Dict[int, Tuple[Dict, ...]]] = None
+        self._version = 0
+        # Статусы и тексты, посчитанные для (версия, дата)
+        self._memo_key: Optional[Tuple[int, date]] = None
+        self._memo: Dict[object, object] = {}
+
+    def _file_signature(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _ensure_fresh(self) -> None:
+        """Перечитать файл, если он изменился с прошлой загрузки"""
+        now = time.monotonic()
+        if now - self._checked_at < STAT_INTERVAL:
+            return
+
+        with self._lock:
+            self._checked_at = now
+            signature = self._file_signature()
+            if signature == self._signature:
+                return
+
+            data = None
+            if signature is not None:
+                try:
+                    with open(self.path, 'r', encoding='utf-8') as f:
+                        data = json.load(f)
+                except Exception as e:
+                    logger.error(f"❌ Ошибка загрузки данных о сменах: {e}")
+                    return
+
+            records = tuple(ShiftRecord.from_dict(shift) for shift in (data or {}).get('shifts', []))
+            self._data = data
+            self._records = records
+            self._by_month = {record.month_number: record for record in records}
+            self._documents = self._documents_from(data)
+            self._version += 1
+            self._signature = signature
+            if data is not None:
+                logger.info(f"📖 Загружены данные: {len(records)} смен (версия {self._version})")
+
+    @staticmethod
+    def _documents_from(data: Optional[Dict]) -> Optional[Dict[int, Tuple[Dict, ...]]]:
+        documents = (data or {}).get('documents')
+        if documents is None:
+            return None
+        return {int(month): tuple(docs) for month, docs in documents.items()}
+
+    def invalidate(self) -> None:
+        """Проверить файл при следующем обращении (после записи)"""
+        self._checked_at = 0.0
+
+    @property
+    def version(self) -> int:
+        self._ensure_fresh()
+        return self._version
+
+    def get_data(self) -> Optional[Dict]:
+        """Данные current_shifts.json (None, если файла нет)"""
+        self._ensure_fresh()
+        return self._data
+
+    def get_records(self) -> Tuple[ShiftRecord, ...]:
+        self._ensure_fresh()
+        return self._records
+
+    def get_by_month(self, month_number: int) -> Optional[ShiftRecord]:
+        self._ensure_fresh()
+        return self._by_month.get(month_number)
+
+    def has_documents(self) -> bool:
+        """Собраны ли документы смен"""
+        self._ensure_fresh()
+        return self._documents is not None
+
+    def get_documents(self, month_number: int) -> Optional[Tuple[Dict, ...]]:
+        """Документы смены (None, если документы ещё не собирались)"""
+        self._ensure_fresh()
+        if self._documents is None:
+            return None
+        return self._documents.get(month_number, ())
+
+    def set_documents(self, documents: Dict[int, List[Dict]]) -> None:
+        """
+        Документы, собранные вне обновления расписания (до перечитывания файла)
+
+        Версия увеличивается - запомненные карточки смен пересобираются.
+        """
+        self._ensure_fresh()
+        with self._lock:
+            self._documents = {month: tuple(docs) for month, docs in documents.items()}
+            self._version += 1
+
+    def _memo_for_today(self) -> Dict[object, object]:
+        key = (self.version, date.today())
+        if key != self._memo_key:
+            self._memo_key, self._memo = key, {}
+        return self._memo
+
+    def get_statuses(self) -> Dict[int, Tuple[str, str]]:
+        """Статусы всех смен на сегодня: {месяц: (статус смены, статус заявок)}"""
+        return self.memoize(
+            'statuses',
+            lambda: {record.month_number: record.status(date.today()) for record in self._records},
+        )
+
+    def get_status(self, record: ShiftRecord) -> Tuple[str, str]:
+        status = self.get_statuses().get(record.month_number)
+        return status if status is not None else record.status(date.today())
+
+    def memoize(self, key: object, render: Callable[[], T]) -> T:
+        """Результат render, запомненный до смены версии данных или даты"""
+        memo = self._memo_for_today()
+        if key not in memo:
+            memo[key] = render()
+        return memo[key]
+
+
+# Глобальный экземпляр
+shift_repository = ShiftRepository(config.parsers_data_dir / "current_shifts.json")
@@ -1,16 +1,40 @@
-import aiohttp
 import logging
 import json
 import asyncio
 from datetime import datetime
-from typing import Dict, Optional
+from typing import Dict, Optional, Set, Tuple, Union
 from bs4 import BeautifulSoup
 import re
 
+
 from src.core.config import config
+from src.services.crawler import HTML_PARSER, crawler
+from src.services.parsers.students_repository import students_repository
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_TITLE = "Список учащихся"
+HEADER_TAGS = ('h1', 'h2', 'h3', 'h4', 'h5', 'h6')
+# Элементы, которые просматриваются при разборе текстовых блоков
+TEXT_WALK_TAGS = [*HEADER_TAGS, 'p', 'div', 'table']
+STUDENT_DIV_KEYWORDS = ('student', 'учащийся', 'список', 'list')
+# Навигационные элементы и меню, которые не являются ФИО
+EXCLUDE_KEYWORDS = (
+    'онлайн заявка', 'научные выходные', 'льготы для выпускников',
+    'инженерно-технические центры', 'платные услуги', 'результат поиска',
+    'общая информация', 'наблюдательный совет', 'сми о нас', 'одно окно',
+    'администрация', 'отделы', 'проживание', 'история и традиции', 'профсоюз',
+    'образовательные смены', 'об образовательных сменах', 'образовательные направления',
+    'как попасть', 'календарь образовательных смен', 'для поступивших',
+    'дистанционное обучение', 'пул перспективных проектов', 'часто задаваемые вопросы',
+    'объединения по интересам', 'способы оплаты', 'наши достижения',
+    'методическая деятельность', 'выставочная и экскурсионная деятельность',
+    'профориентация', 'международные и республиканские мероприятия', 'juniorskills',
+    'ицаэ', 'дополнительное образование', 'списочный состав групп учащихся',
+    'зачисленных в учреждение образования', 'национальный детский технопарк',
+    'обучения в рамках', 'образовательной смены'
+)
+
 class StudentsParser:
     """Парсер списка учащихся Национального детского технопарка"""
     
@@ -35,9 +59,6 @@ class StudentsParser:
     
     def __init__(self):
         self.url = "https://ndtp.by/schedule/"
-        self.headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-        }
         # Используем централизованные пути из конфигурации
         self.students_file = config.parsers_data_dir / "students_list.json"
         self.last_update_file = config.parsers_data_dir / "last_students_update.txt"
@@ -53,32 +74,30 @@ class StudentsParser:
             "https://ndtp.by/students/"
         ]
         
-    async def fetch_page(self) -> Optional[str]:
+    async def fetch_page(self, url: Optional[str] = None, timeout: int = 30) -> Optional[str]:
         """Получает HTML страницы со списком учащихся"""
-        try:
-            logger.info(f"🌐 Запрос к {self.url}")
-            
-            async with aiohttp.ClientSession() as session:
-                async with session.get(self.url, headers=self.headers, timeout=30) as response:
-                    if response.status == 200:
-                        content = await response.text()
-                        logger.info(f"✅ Страница учащихся успешно загружена ({len(content)} символов)")
-                        return content
-                    else:
-                        logger.error(f"❌ Ошибка загрузки страницы учащихся: HTTP {response.status}")
-                        return None
-                        
-        except asyncio.TimeoutError:
-            logger.error("❌ Таймаут при загрузке страницы учащихся")
-        except Exception as e:
-            logger.error(f"❌ Ошибка при загрузке страницы учащихся: {e}")
-        
-        return None
+        return await crawler.fetch_text(url or self.url, timeout=timeout)
+    
+    @staticmethod
+    def _student_key(student: Dict) -> Tuple[str, str]:
+        """Ключ дедупликации: ФИО без учёта регистра и пробелов + заголовок списка"""
+        return " ".join(student.get('full_name', '').lower().split()), student.get('table_title', '')
     
-    def parse_students_list(self, html_content: str) -> Dict:
-        """Парсит список учащихся со страницы"""
+    def _add_student(self, students_info: Dict, seen: Set[Tuple[str, str]], student_data: Optional[Dict]) -> bool:
+        """Добавить учащегося, если такого ещё нет"""
+        if not student_data:
+            return False
+        key = self._student_key(student_data)
+        if key in seen:
+            return False
+        seen.add(key)
+        students_info["students"].append(student_data)
+        return True
+    
+    def parse_students_list(self, html_content: Union[str, BeautifulSoup]) -> Dict:
+        """Парсит список учащихся со страницы (HTML или разобранное дерево)"""
         try:
-            soup = BeautifulSoup(html_content, 'html.parser')
+            soup = html_content if isinstance(html_content, BeautifulSoup) else BeautifulSoup(html_content, HTML_PARSER)
             
             students_info = {
                 "title": "Список учащихся НДТП",
@@ -87,6 +106,7 @@ class StudentsParser:
                 "last_updated": datetime.now().isoformat(),
                 "source_url": self.url
             }
+            seen: Set[Tuple[str, str]] = set()
             
             # Ищем таблицы со списками учащихся
             tables = soup.find_all('table')
@@ -101,7 +121,7 @@ class StudentsParser:
                     rows = table.find_all('tr')
                     logger.info(f"📋 Таблица {table_idx + 1}: {len(rows)} строк")
                     
-                    table_students = []
+                    table_students = 0
                     
                     for row_idx, row in enumerate(rows):
                         # Пропускаем заголовки таблицы
@@ -109,22 +129,21 @@ class StudentsParser:
                             continue
                         
                         student_data = self._parse_student_row(row, table_title)
-                        if student_data:
-                            table_students.append(student_data)
+                        if self._add_student(students_info, seen, student_data):
+                            table_students += 1
                     
                     if table_students:
-                        students_info["students"].extend(table_students)
-                        logger.info(f"✅ Извлечено учащихся из таблицы {table_idx + 1}: {len(table_students)}")
+                        logger.info(f"✅ Извлечено учащихся из таблицы {table_idx + 1}: {table_students}")
                 
                 except Exception as e:
                     logger.warning(f"⚠️ Ошибка обработки таблицы {table_idx + 1}: {e}")
                     continue
             
             # Также ищем списки учащихся в других форматах
-            self._parse_students_from_lists(soup, students_info)
+            self._parse_students_from_lists(soup, students_info, seen)
             
             # Ищем учащихся в параграфах и div'ах
-            self._parse_students_from_text(soup, students_info)
+            self._parse_students_from_text(soup, students_info, seen)
             
             students_info["total_count"] = len(students_info["students"])
             logger.info(f"🎯 Всего извлечено учащихся: {students_info['total_count']}")
@@ -180,7 +199,7 @@ class StudentsParser:
                     if direction.lower() in title.lower():
                         return f'Образовательное направление «{direction}»'
         
-        return "Список учащихся"
+        return DEFAULT_TITLE
     
     def _is_header_row(self, row) -> bool:
         """Проверяет, является ли строка заголовком таблицы"""
@@ -241,7 +260,7 @@ class StudentsParser:
             logger.error(f"❌ Ошибка парсинга строки учащегося: {e}")
             return None
     
-    def _parse_students_from_lists(self, soup, students_info: Dict):
+    def _parse_students_from_lists(self, soup, students_info: Dict, seen: Set[Tuple[str, str]]):
         """Парсит учащихся из списков (ul, ol)"""
         try:
             lists = soup.find_all(['ul', 'ol'])
@@ -257,8 +276,7 @@ class StudentsParser:
                     
                     # Пытаемся извлечь информацию об учащемся
                     student_data = self._extract_student_from_text(student_text, list_title)
-                    if student_data:
-                        students_info["students"].append(student_data)
+                    self._add_student(students_info, seen, student_data)
                         
         except Exception as e:
             logger.error(f"❌ Ошибка парсинга учащихся из списков: {e}")
@@ -268,77 +286,52 @@ class StudentsParser:
         prev_sibling = list_elem.find_previous_sibling(['h1', 'h2', 'h3', 'h4', 'h5', 'h6'])
         if prev_sibling:
             return prev_sibling.get_text(strip=True)
-        return "Список учащихся"
+        return DEFAULT_TITLE
+    
+    @staticmethod
+    def _is_student_div(div) -> bool:
+        classes = div.get('class')
+        if not classes:
+            return False
+        return any(keyword in class_name.lower() for class_name in classes for keyword in STUDENT_DIV_KEYWORDS)
     
-    def _parse_students_from_text(self, soup, students_info: Dict):
-        """Парсит учащихся из текстовых блоков"""
+    def _parse_students_from_text(self, soup, students_info: Dict, seen: Set[Tuple[str, str]]):
+        """
+        Парсит учащихся из текстовых блоков
+        
+        Один проход по документу: заголовок "Образовательное направление"
+        задаёт группу для следующих за ним параграфов и блоков до ближайшей
+        таблицы (её строки разбираются отдельно).
+        """
         try:
-            # Ищем параграфы с именами учащихся
-            paragraphs = soup.find_all('p')
-            
-            for p in paragraphs:
-                text = p.get_text(strip=True)
-                if len(text) < 5:
+            current_direction = DEFAULT_TITLE
+            
+            for element in soup.find_all(TEXT_WALK_TAGS):
+                if element.name in HEADER_TAGS:
+                    title = element.get_text(strip=True)
+                    if 'образовательное направление' in title.lower():
+                        current_direction = title
+                        logger.info(f"📚 Найдено образовательное направление: {title}")
                     continue
                 
-                # Разбиваем текст на строки
-                lines = [line.strip() for line in text.split('\n') if line.strip()]
+                if element.name == 'table':
+                    current_direction = DEFAULT_TITLE
+                    continue
                 
-                for line in lines:
-                    if len(line) < 3:
-                        continue
-                    
-                    student_data = self._extract_student_from_text(line, "Список учащихся")
-                    if student_data:
-                        students_info["students"].append(student_data)
-            
-            # Ищем учащихся в div'ах с определенными классами
-            student_divs = soup.find_all('div', class_=lambda x: x and any(keyword in x.lower() for keyword in ['student', 'учащийся', 'список', 'list']))
-            
-            for div in student_divs:
-                text = div.get_text(strip=True)
-                if len(text) < 5:
+                if element.name == 'div' and not self._is_student_div(element):
                     continue
                 
-                lines = [line.strip() for line in text.split('\n') if line.strip()]
+                text = element.get_text(strip=True)
+                if len(text) < 5:
+                    continue
                 
-                for line in lines:
+                for line in text.split('\n'):
+                    line = line.strip()
                     if len(line) < 3:
                         continue
                     
-                    student_data = self._extract_student_from_text(line, "Список учащихся")
-                    if student_data:
-                        students_info["students"].append(student_data)
-            
-            # Ищем образовательные направления в заголовках
-            headers = soup.find_all(['h1', 'h2', 'h3', 'h4', 'h5', 'h6'])
-            current_direction = "Список учащихся"
-            
-            for header in headers:
-                title = header.get_text(strip=True)
-                if 'образовательное направление' in title.lower():
-                    current_direction = title
-                    logger.info(f"📚 Найдено образовательное направление: {title}")
-                    
-                    # Ищем учащихся после этого заголовка
-                    next_elements = header.find_all_next(['p', 'div', 'table'])
-                    for element in next_elements[:10]:  # Ограничиваем поиск
-                        if element.name == 'table':
-                            break  # Останавливаемся на следующей таблице
-                        
-                        text = element.get_text(strip=True)
-                        if len(text) < 5:
-                            continue
-                        
-                        lines = [line.strip() for line in text.split('\n') if line.strip()]
-                        
-                        for line in lines:
-                            if len(line) < 3:
-                                continue
-                            
-                            student_data = self._extract_student_from_text(line, current_direction)
-                            if student_data:
-                                students_info["students"].append(student_data)
+                    student_data = self._extract_student_from_text(line, current_direction)
+                    self._add_student(students_info, seen, student_data)
                         
         except Exception as e:
             logger.error(f"❌ Ошибка парсинга учащихся из текста: {e}")
@@ -353,26 +346,9 @@ class StudentsParser:
                 return None
             
             # Исключаем навигационные элементы и меню
-            exclude_keywords = [
-                'онлайн заявка', 'научные выходные', 'льготы для выпускников',
-                'инженерно-технические центры', 'платные услуги', 'результат поиска',
-                'общая информация', 'наблюдательный совет', 'сми о нас', 'одно окно',
-                'администрация', 'отделы', 'проживание', 'история и традиции', 'профсоюз',
-                'образовательные смены', 'об образовательных сменах', 'образовательные направления',
-                'как попасть', 'календарь образовательных смен', 'для поступивших',
-                'дистанционное обучение', 'пул перспективных проектов', 'часто задаваемые вопросы',
-                'объединения по интересам', 'способы оплаты', 'наши достижения',
-                'методическая деятельность', 'выставочная и экскурсионная деятельность',
-                'профориентация', 'международные и республиканские мероприятия', 'juniorskills',
-                'ицаэ', 'дополнительное образование', 'списочный состав групп учащихся',
-                'зачисленных в учреждение образования', 'национальный детский технопарк',
-                'обучения в рамках', 'образовательной смены'
-            ]
-            
             text_lower = text.lower()
-            for keyword in exclude_keywords:
-                if keyword in text_lower:
-                    return None
+            if any(keyword in text_lower for keyword in EXCLUDE_KEYWORDS):
+                return None
             
             # Проверяем, что это похоже на имя (содержит пробелы и буквы)
             if not re.search(r'[а-яё]', text, re.IGNORECASE):
@@ -421,6 +397,7 @@ class StudentsParser:
         try:
             with open(self.students_file, 'w', encoding='utf-8') as f:
                 json.dump(students_data, f, ensure_ascii=False, indent=2)
+            students_repository.invalidate()
             
             # Сохраняем время обновления
             with open(self.last_update_file, 'w', encoding='utf-8') as f:
@@ -434,15 +411,8 @@ class StudentsParser:
             return False
     
     def load_students_cache(self) -> Optional[Dict]:
-        """Загружает список учащихся из кэша"""
-        try:
-            if self.students_file.exists():
-                with open(self.students_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-        except Exception as e:
-            logger.error(f"❌ Ошибка загрузки кэша учащихся: {e}")
-        
-        return None
+        """Загружает список учащихся из кэша (через общий репозиторий в памяти)"""
+        return students_repository.get_data()
     
     def get_last_update_time(self) -> Optional[datetime]:
         """Получает время последнего обновления"""
@@ -474,34 +444,40 @@ class StudentsParser:
             
             logger.info("🔄 Обновление списка учащихся...")
             
-            # Парсим основную страницу
-            html_content = await self.fetch_page()
-            if html_content:
-                students_data = self.parse_students_list(html_content)
-            else:
-                students_data = {
-                    "title": "Список учащихся НДТП",
-                    "students": [],
-                    "total_count": 0,
-                    "last_updated": datetime.now().isoformat(),
-                    "source_url": self.url
-                }
-            
-            # Парсим дополнительные страницы
-            for url in self.additional_urls:
-                try:
-                    logger.info(f"🔍 Поиск учащихся на {url}")
-                    async with aiohttp.ClientSession() as session:
-                        async with session.get(url, headers=self.headers, timeout=10) as response:
-                            if response.status == 200:
-                                content = await response.text()
-                                additional_data = self.parse_students_list(content)
-                                if additional_data and additional_data.get('students'):
-                                    students_data['students'].extend(additional_data['students'])
-                                    logger.info(f"✅ Найдено {len(additional_data['students'])} учащихся на {url}")
-                except Exception as e:
-                    logger.warning(f"⚠️ Ошибка при парсинге {url}: {e}")
+            # Все страницы загружаются параллельно через общий загрузчик сайта
+            # (при force - с перепроверкой на сайте)
+            urls = [self.url, *self.additional_urls]
+            pages = await asyncio.gather(*(
+                crawler.soup(url, max_age=0 if force else None, timeout=30 if url == self.url else 10)
+                for url in urls
+            ))
+            
+            students_data = {
+                "title": "Список учащихся НДТП",
+                "students": [],
+                "total_count": 0,
+                "last_updated": datetime.now().isoformat(),
+                "source_url": self.url
+            }
+            seen: Set[Tuple[str, str]] = set()
+            
+            for url, soup in zip(urls, pages):
+                if soup is None:
                     continue
+                # Обход дерева - CPU-работа, вне event loop
+                page_data = await asyncio.to_thread(self.parse_students_list, soup)
+                added = sum(
+                    self._add_student(students_data, seen, student)
+                    for student in page_data.get('students', [])
+                )
+                if url != self.url and added:
+                    logger.info(f"✅ Найдено {added} учащихся на {url}")
+            
+            # Зачисленные из PDF-списков технопарка (строки разобраны при загрузке)
+            enrolled = self._students_from_lists()
+            added = sum(self._add_student(students_data, seen, student) for student in enrolled)
+            if added:
+                logger.info(f"✅ Добавлено {added} учащихся из списков зачисленных")
             
             # Обновляем общее количество
             students_data["total_count"] = len(students_data["students"])
@@ -523,10 +499,32 @@ class StudentsParser:
             logger.error(f"❌ Ошибка обновления списка учащихся: {e}")
             return False
     
+    def _students_from_lists(self) -> list:
+        """Учащиеся из списков зачисленных (строки из хранилища парсера списков)"""
+        if not config.enable_lists:
+            return []
+        try:
+            from src.services.parsers.lists_parser import lists_parser
+            
+            students = []
+            for row in lists_parser.get_rows(list_kind="enrolled"):
+                students.append({
+                    "table_title": f"{row['shift']}: {row['direction']}" if row['direction'] else row['shift'],
+                    "row_number": row['row_number'],
+                    "full_name": row['full_name'],
+                    "group": row['direction'],
+                    "class": f"{row['class']} класс" if row['class'] else "",
+                    "additional_info": row['school'],
+                })
+            return students
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось получить строки списков зачисленных: {e}")
+            return []
+    
     def get_students_context(self, query: str = "") -> str:
         """Получает контекст о списке учащихся для ответа"""
         try:
-            students_data = self.load_students_cache()
+            students_data = students_repository.get_data()
             if not students_data:
                 return "❌ Данные о списке учащихся недоступны. Попробуйте обновить данные."
             
@@ -543,16 +541,8 @@ class StudentsParser:
             response += f"Последнее обновление: {last_updated}\n\n"
             
             if query:
-                # Фильтруем по запросу
-                filtered_students = []
-                query_lower = query.lower()
-                
-                for student in students:
-                    full_name = student.get('full_name', '').lower()
-                    group = student.get('group', '').lower()
-                    
-                    if query_lower in full_name or query_lower in group:
-                        filtered_students.append(student)
+                # Фильтруем по запросу (индекс слов ФИО и группы)
+                filtered_students = students_repository.search(query)
                 
                 if filtered_students:
                     response += f"Найдено по запросу '{query}': {len(filtered_students)}\n\n"
@@ -602,7 +592,7 @@ class StudentsParser:
     def get_students_summary(self) -> str:
         """Получает краткую сводку о списке учащихся"""
         try:
-            students_data = self.load_students_cache()
+            students_data = students_repository.get_data()
             if not students_data:
                 return "❌ Данные о списке учащихся недоступны"
             
@@ -629,40 +619,31 @@ class StudentsParser:
         return info
 
 
+# Глобальная инстанция
+students_parser = StudentsParser()
+
+
 # Асинхронные функции для удобства использования
 async def get_students_context_async(query: str = "") -> str:
     """Асинхронная функция для получения контекста учащихся"""
-    parser = StudentsParser()
-    return parser.get_students_context(query)
+    return students_parser.get_students_context(query)
 
 
 def get_students_context(query: str = "") -> str:
     """Синхронная функция для получения контекста учащихся"""
-    parser = StudentsParser()
-    return parser.get_students_context(query)
+    return students_parser.get_students_context(query)
 
 
 async def force_update_students() -> bool:
     """Принудительное обновление списка учащихся"""
-    parser = StudentsParser()
-    return await parser.update_students(force=True)
+    return await students_parser.update_students(force=True)
 
 
-async def students_updater_loop(interval_hours: int = 24):
-    """Цикл обновления списка учащихся"""
-    parser = StudentsParser()
-    
-    while True:
-        try:
-            await parser.update_students()
-            logger.info(f"⏰ Следующее обновление списка учащихся через {interval_hours} часов")
-            await asyncio.sleep(interval_hours * 3600)
-        except Exception as e:
-            logger.error(f"❌ Ошибка в цикле обновления учащихся: {e}")
-            await asyncio.sleep(3600)  # Ждем час при ошибке
+async def scheduled_update_students() -> bool:
+    """Плановое обновление списка учащихся (задача планировщика)"""
+    return await students_parser.update_students()
 
 
-# Функция для тестирования
 async def test_students_parser():
     """Тестирует парсер учащихся"""
     parser = StudentsParser()
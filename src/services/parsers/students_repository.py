@@ -0,0 +1,129 @@
+"""
+Репозиторий списка учащихся в памяти процесса
+
+students_list.json читается один раз и перечитывается, только когда файл
+изменился (по mtime и размеру). Для поиска строятся индексы токенов ФИО и
+группы: запрос ищется по началу слов пересечением множеств, без полного
+перебора учащихся.
+"""
+import bisect
+import json
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from src.core.config import config
+from src.services.parsers.lists_index import tokenize
+
+logger = logging.getLogger(__name__)
+
+# Как часто проверять mtime файла (чаще - без обращения к диску)
+STAT_INTERVAL = 5.0
+
+
+class StudentsRepository:
+    """Список учащихся с индексами по ФИО и группе"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._signature: Optional[Tuple[int, int]] = None
+        self._checked_at = 0.0
+        self._data: Optional[Dict] = None
+        self._tokens: Dict[str, Set[int]] = {}
+        self._vocabulary: List[str] = []
+
+    def _file_signature(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _ensure_fresh(self) -> None:
+        """Перечитать файл, если он изменился с прошлой загрузки"""
+        now = time.monotonic()
+        if now - self._checked_at < STAT_INTERVAL:
+            return
+
+        with self._lock:
+            self._checked_at = now
+            signature = self._file_signature()
+            if signature == self._signature:
+                return
+
+            data = None
+            if signature is not None:
+                try:
+                    with open(self.path, 'r', encoding='utf-8') as f:
+                        data = json.load(f)
+                except Exception as e:
+                    logger.error(f"❌ Ошибка загрузки кэша учащихся: {e}")
+                    return
+            self._load(data)
+            self._signature = signature
+
+    def _load(self, data: Optional[Dict]) -> None:
+        """Построить индексы по загруженным данным"""
+        started = time.perf_counter()
+        tokens: Dict[str, Set[int]] = {}
+        for student_id, student in enumerate((data or {}).get('students', [])):
+            text = f"{student.get('full_name', '')} {student.get('group', '')}"
+            for token in tokenize(text):
+                tokens.setdefault(token, set()).add(student_id)
+
+        self._data = data
+        self._tokens = tokens
+        self._vocabulary = sorted(tokens)
+        if data is not None:
+            logger.info(
+                f"📋 Список учащихся загружен: {len(data.get('students', []))} записей, "
+                f"{len(tokens)} токенов за {(time.perf_counter() - started) * 1000:.1f} мс"
+            )
+
+    def invalidate(self) -> None:
+        """Проверить файл при следующем обращении (после записи)"""
+        self._checked_at = 0.0
+
+    def get_data(self) -> Optional[Dict]:
+        """Данные students_list.json (None, если файла нет)"""
+        self._ensure_fresh()
+        return self._data
+
+    def _token_ids(self, token: str) -> Set[int]:
+        """Учащиеся, у которых есть слово, начинающееся с token"""
+        vocabulary = self._vocabulary
+        i = bisect.bisect_left(vocabulary, token)
+        found: Set[int] = set()
+        while i < len(vocabulary) and vocabulary[i].startswith(token):
+            found |= self._tokens[vocabulary[i]]
+            i += 1
+        return found
+
+    def search(self, query: str) -> List[Dict]:
+        """
+        Учащиеся, у которых каждое слово запроса - начало слова ФИО или группы
+
+        Результат в порядке списка.
+        """
+        self._ensure_fresh()
+        data, tokens = self._data, tokenize(query)
+        if not data or not tokens:
+            return []
+
+        # Сначала самые редкие слова - пересечение быстрее сужается
+        candidates = sorted((self._token_ids(token) for token in tokens), key=len)
+        ids = set(candidates[0])
+        for other in candidates[1:]:
+            ids &= other
+            if not ids:
+                return []
+
+        students = data.get('students', [])
+        return [students[student_id] for student_id in sorted(ids)]
+
+
+# Глобальный экземпляр
+students_repository = StudentsRepository(config.parsers_data_dir / "students_list.json")
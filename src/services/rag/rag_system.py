@@ -4,6 +4,8 @@ from typing import List, Dict, Any
 import re
 from difflib import SequenceMatcher
 
+from ...core.log_pipeline import trace_enabled
+
 logger = logging.getLogger(__name__)
 
 class RAGSystem:
@@ -21,7 +23,7 @@ class RAGSystem:
             with open(self.knowledge_base_path, 'r', encoding='utf-8') as f:
                 self.knowledge_base = json.load(f)
             logger.info(f"База знаний загружена из {self.knowledge_base_path}")
-            logger.info(f"Разделы в базе знаний: {list(self.knowledge_base.keys())}")
+            logger.info("Разделы в базе знаний: %s", list(self.knowledge_base.keys()))
         except FileNotFoundError:
             logger.error(f"Файл базы знаний {self.knowledge_base_path} не найден")
             self.knowledge_base = {}
@@ -31,7 +33,8 @@ class RAGSystem:
     
     def search_knowledge(self, query: str, max_results: int = 3) -> List[Dict[str, Any]]:
         """Поиск релевантной информации в базе знаний"""
-        logger.info(f"Поиск по запросу: '{query}'")
+        if trace_enabled():
+            logger.info("Поиск по запросу: %r", query)
         
         if not self.knowledge_base:
             logger.warning("База знаний пуста")
@@ -42,7 +45,8 @@ class RAGSystem:
         
         # Улучшенное извлечение ключевых слов
         keywords = self._extract_keywords(query_lower)
-        logger.info(f"Извлеченные ключевые слова: {keywords}")
+        if trace_enabled():
+            logger.info("Извлеченные ключевые слова: %s", keywords)
         
         # Поиск в разных разделах базы знаний
         technopark_info = self.knowledge_base.get("technopark_info", {})
@@ -67,7 +71,8 @@ class RAGSystem:
                     "content": general_info,
                     "relevance": min(1.0, relevance)
                 })
-                logger.info(f"Найдена общая информация, релевантность: {min(1.0, relevance)}")
+                if trace_enabled():
+                    logger.info("Найдена общая информация, релевантность: %.3f", min(1.0, relevance))
         
         # Поиск в образовательных программах
         programs = technopark_info.get("educational_programs", [])
@@ -80,7 +85,8 @@ class RAGSystem:
                     "content": program,
                     "relevance": relevance
                 })
-                logger.info(f"Найдена программа '{program.get('name')}', релевантность: {relevance}")
+                if trace_enabled():
+                    logger.info("Найдена программа %r, релевантность: %.3f", program.get('name'), relevance)
         
         # Поиск в информации о поступлении
         enrollment = technopark_info.get("enrollment", {})
@@ -92,7 +98,8 @@ class RAGSystem:
                 "content": enrollment,
                 "relevance": relevance
             })
-            logger.info(f"Найдена информация о поступлении, релевантность: {relevance}")
+            if trace_enabled():
+                logger.info("Найдена информация о поступлении, релевантность: %.3f", relevance)
         
         # Поиск в мероприятиях
         events = technopark_info.get("events", [])
@@ -105,7 +112,8 @@ class RAGSystem:
                     "content": event,
                     "relevance": relevance
                 })
-                logger.info(f"Найдено мероприятие '{event.get('name')}', релевантность: {relevance}")
+                if trace_enabled():
+                    logger.info("Найдено мероприятие %r, релевантность: %.3f", event.get('name'), relevance)
         
         # Поиск в FAQ
         faq = technopark_info.get("faq", [])
@@ -118,7 +126,8 @@ class RAGSystem:
                     "content": item,
                     "relevance": relevance
                 })
-                logger.info(f"Найден FAQ: '{item.get('question')}', релевантность: {relevance}")
+                if trace_enabled():
+                    logger.info("Найден FAQ: %r, релевантность: %.3f", item.get('question'), relevance)
         
         # Поиск в оборудовании
         facilities = technopark_info.get("facilities", [])
@@ -131,11 +140,12 @@ class RAGSystem:
                     "content": facility,
                     "relevance": relevance
                 })
-                logger.info(f"Найдено оборудование '{facility.get('name')}', релевантность: {relevance}")
+                if trace_enabled():
+                    logger.info("Найдено оборудование %r, релевантность: %.3f", facility.get('name'), relevance)
         
         # Сортировка по релевантности и возврат топ результатов
         results.sort(key=lambda x: x["relevance"], reverse=True)
-        logger.info(f"Найдено результатов: {len(results)}, возвращаем топ {max_results}")
+        logger.debug("Найдено результатов: %d, возвращаем топ %d", len(results), max_results)
         
         return results[:max_results]
     
@@ -202,9 +212,10 @@ class RAGSystem:
                 elif keyword == main_word:
                     extended_keywords.extend(synonyms)
         
-        logger.info(f"Исходный текст: '{text}'")
-        logger.info(f"Базовые ключевые слова: {filtered_keywords}")
-        logger.info(f"Расширенные ключевые слова: {list(set(extended_keywords))}")
+        if trace_enabled():
+            logger.info("Исходный текст: %r", text)
+            logger.info("Базовые ключевые слова: %s", filtered_keywords)
+            logger.info("Расширенные ключевые слова: %s", list(set(extended_keywords)))
         
         return list(set(extended_keywords))  # Убираем дубликаты
     
@@ -236,7 +247,7 @@ class RAGSystem:
     
     def get_context_for_query(self, query: str) -> str:
         """Получить контекст для запроса в формате для DeepSeek API"""
-        logger.info(f"Получение контекста для запроса: '{query}'")
+        logger.debug("Получение контекста для запроса: %r", query)
         
         results = self.search_knowledge(query)
         
@@ -246,7 +257,8 @@ class RAGSystem:
         
         context_parts = []
         for i, result in enumerate(results):
-            logger.info(f"Обработка результата {i+1}: {result['title']}")
+            if trace_enabled():
+                logger.info("Обработка результата %d: %s", i + 1, result['title'])
             content = result["content"]
             
             if result["section"] == "general_info":
@@ -263,7 +275,7 @@ class RAGSystem:
                 context_parts.append(self._format_facility_info(content))
         
         final_context = "\n\n".join(context_parts)
-        logger.info(f"Сформирован контекст длиной {len(final_context)} символов")
+        logger.debug("Сформирован контекст длиной %d символов", len(final_context))
         
         return final_context
     
@@ -0,0 +1,134 @@
+"""
+Фоновое обновление данных парсеров (stale-while-revalidate)
+
+Обработчики запросов всегда отвечают по последнему сохранённому снимку.
+Если снимок устарел, обновление источника запускается фоновой задачей -
+не больше одной на источник одновременно. После неудачи источник не
+перезапрашивается, пока не пройдёт пауза, чтобы недоступный сайт не
+дёргали на каждый вопрос пользователя.
+"""
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+from src.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Пауза перед повторной попыткой после неудачного обновления (сек)
+RETRY_AFTER_FAILURE = 300.0
+
+RefreshFunc = Callable[[], Awaitable[bool]]
+
+
+class BackgroundRefresher:
+    """Дедуплицированные фоновые обновления по источникам"""
+
+    def __init__(self, retry_after_failure: float = RETRY_AFTER_FAILURE):
+        self.retry_after_failure = retry_after_failure
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._stats: Dict[str, Dict] = {}
+
+    def is_running(self, source: str) -> bool:
+        task = self._tasks.get(source)
+        return task is not None and not task.done()
+
+    def _can_start(self, source: str) -> bool:
+        """Не идёт ли уже обновление и прошла ли пауза после неудачи"""
+        if self.is_running(source):
+            return False
+        failed_at = self._stats.get(source, {}).get('failed_at')
+        return failed_at is None or time.monotonic() - failed_at >= self.retry_after_failure
+
+    def trigger(self, source: str, refresh: RefreshFunc) -> bool:
+        """
+        Запустить обновление источника в фоне
+
+        Returns:
+            True, если задача запущена; False, если обновление уже идёт
+            или после недавней неудачи ещё не прошла пауза
+        """
+        if not self._can_start(source):
+            return False
+        self._tasks[source] = asyncio.create_task(self._run(source, refresh), name=f"refresh:{source}")
+        return True
+
+    def refresh_if_stale(self, source: str, is_stale: Callable[[], bool], refresh: RefreshFunc) -> bool:
+        """Запустить фоновое обновление, если данные источника устарели"""
+        if not self._can_start(source):
+            return False
+        try:
+            stale = is_stale()
+        except Exception as e:
+            logger.error(f"❌ Не удалось проверить актуальность {source}: {e}")
+            return False
+        return stale and self.trigger(source, refresh)
+
+    async def run(self, source: str, refresh: RefreshFunc) -> bool:
+        """
+        Обновить источник и дождаться результата (для плановых задач)
+
+        Если обновление уже идёт, ждёт его вместо второго запуска. Пауза
+        после неудачи не учитывается - плановый запуск выполняется всегда.
+        """
+        if not self.is_running(source):
+            self._tasks[source] = asyncio.create_task(self._run(source, refresh), name=f"refresh:{source}")
+        return await asyncio.shield(self._tasks[source])
+
+    async def _run(self, source: str, refresh: RefreshFunc) -> bool:
+        stats = self._stats.setdefault(source, {'runs': 0, 'failures': 0})
+        stats['runs'] += 1
+        started = time.perf_counter()
+        success = False
+        try:
+            logger.info(f"🔄 Фоновое обновление: {source}")
+            success = bool(await refresh())
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ Ошибка фонового обновления {source}: {e}")
+        finally:
+            elapsed = time.perf_counter() - started
+            stats['last_duration'] = round(elapsed, 3)
+            stats['last_finished'] = time.time()
+            metrics.observe("ndtp_refresh_seconds", source, elapsed, "Длительность фоновых обновлений источников")
+
+        if success:
+            stats['failed_at'] = None
+            logger.info(f"✅ Фоновое обновление {source} завершено за {elapsed:.1f} с")
+        else:
+            stats['failures'] += 1
+            stats['failed_at'] = time.monotonic()
+            metrics.inc("ndtp_refresh_failures_total", "Неудачные фоновые обновления источников")
+            logger.warning(
+                f"⚠️ Фоновое обновление {source} не удалось, "
+                f"повтор не раньше чем через {self.retry_after_failure:.0f} с"
+            )
+        return success
+
+    async def wait(self, source: str) -> Optional[bool]:
+        """Дождаться текущего обновления источника (None, если его нет)"""
+        task = self._tasks.get(source)
+        if task is None:
+            return None
+        return await asyncio.shield(task)
+
+    def get_stats(self) -> Dict[str, Dict]:
+        return {
+            source: {**stats, 'running': self.is_running(source)}
+            for source, stats in self._stats.items()
+        }
+
+    async def shutdown(self) -> None:
+        """Отменить идущие обновления"""
+        tasks = [task for task in self._tasks.values() if not task.done()]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+
+
+# Глобальный экземпляр
+background_refresher = BackgroundRefresher()
@@ -0,0 +1,228 @@
+"""
+Напоминания о сроках приема заявок
+
+ReminderPlanner строит по расписанию смен все будущие напоминания
+(открытие приема, день до окончания, последний день) и держит их в куче
+по времени срабатывания. Фоновая задача спит до ближайшего напоминания;
+при изменении данных о сменах (новая версия в shift_repository) план
+перестраивается.
+
+Каждое напоминание отправляется через broadcast_engine с ключом
+идемпотентности deadline:<тип>:<смена>:<дата> - после перезапуска или
+перестроения плана оно не уходит повторно.
+"""
+import asyncio
+import heapq
+import logging
+from dataclasses import dataclass, field
+from datetime import date, datetime, time as dt_time, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from src.core.config import config
+from src.services.broadcast import broadcast_engine
+from src.services.parsers.shift_repository import ShiftRecord, ShiftRepository, shift_repository
+from src.services.subscriptions import APPLICATION_REMINDERS, subscription_store
+
+logger = logging.getLogger(__name__)
+
+# Дольше не спим: смена даты и изменения файла расписания другим процессом
+MAX_SLEEP = 3600.0
+
+APPLICATION_START = "application_start"
+APPLICATION_END_TOMORROW = "application_end_tomorrow"
+APPLICATION_END_TODAY = "application_end_today"
+
+
+@dataclass(frozen=True, order=True)
+class Reminder:
+    """Напоминание о сроке приема заявок (сортируется по времени срабатывания)"""
+
+    fire_at: datetime
+    key: str
+    kind: str = field(compare=False)
+    shift: str = field(compare=False)
+    date: str = field(compare=False)
+    end_date: Optional[str] = field(default=None, compare=False)
+
+    @classmethod
+    def create(cls, fire_at: datetime, kind: str, shift: str, date_text: str,
+               end_date: Optional[str] = None) -> "Reminder":
+        return cls(
+            fire_at=fire_at,
+            key=f"deadline:{kind}:{shift}:{date_text}",
+            kind=kind,
+            shift=shift,
+            date=date_text,
+            end_date=end_date,
+        )
+
+    def message(self) -> str:
+        if self.kind == APPLICATION_START:
+            return (
+                f"🚀 Сегодня открывается прием заявок!\n\n"
+                f"📚 Смена: {self.shift}\n"
+                f"📅 Прием заявок: с {self.date} по {self.end_date}\n\n"
+                f"⏰ Не упустите возможность подать заявку!\n"
+                f"📱 Используйте /calendar для получения подробной информации"
+            )
+        if self.kind == APPLICATION_END_TOMORROW:
+            return (
+                f"⏰ Завтра заканчивается прием заявок!\n\n"
+                f"📚 Смена: {self.shift}\n"
+                f"📅 Последний день подачи: {self.date}\n\n"
+                f"🏃‍♂️ Поспешите подать заявку, если еще не сделали этого!\n"
+                f"📱 Используйте /calendar для получения подробной информации"
+            )
+        return (
+            f"🔥 Сегодня последний день приема заявок!\n\n"
+            f"📚 Смена: {self.shift}\n"
+            f"📅 Прием заканчивается: {self.date}\n\n"
+            f"⚡ Это последний шанс подать заявку!\n"
+            f"📱 Используйте /calendar для получения подробной информации"
+        )
+
+
+def shift_reminders(record: ShiftRecord, hour: int) -> List[Reminder]:
+    """
+    Напоминания одной смены
+
+    Если два напоминания приходятся на один день (короткий прием заявок),
+    остаётся первое по списку: открытие, день до окончания, последний день.
+    """
+    if record.application_start is None or record.application_end is None:
+        return []
+
+    candidates = [
+        (record.application_start, APPLICATION_START, record.application_start_date, record.application_end_date),
+        (record.application_end - timedelta(days=1), APPLICATION_END_TOMORROW, record.application_end_date, None),
+        (record.application_end, APPLICATION_END_TODAY, record.application_end_date, None),
+    ]
+    reminders: Dict[date, Reminder] = {}
+    for day, kind, date_text, end_date in candidates:
+        if day not in reminders:
+            fire_at = datetime.combine(day, dt_time(hour=hour))
+            reminders[day] = Reminder.create(fire_at, kind, record.name, date_text, end_date)
+    return list(reminders.values())
+
+
+class ReminderPlanner:
+    """Очередь напоминаний по времени срабатывания"""
+
+    def __init__(self, repository: ShiftRepository, hour: int):
+        self.repository = repository
+        self.hour = hour
+        self._heap: List[Reminder] = []
+        self._version: Optional[int] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._sent = 0
+
+    def plan(self, records: Iterable[ShiftRecord], now: datetime) -> List[Reminder]:
+        """
+        Напоминания, которые ещё предстоит отправить
+
+        Сегодняшние напоминания остаются, даже если час уже прошёл: после
+        перезапуска днём они уйдут сразу (повтор отсекается ключом рассылки).
+        """
+        today = now.date()
+        heap = [
+            reminder
+            for record in records
+            for reminder in shift_reminders(record, self.hour)
+            if reminder.fire_at.date() >= today
+        ]
+        heapq.heapify(heap)
+        return heap
+
+    def _ensure_current(self, now: datetime) -> None:
+        """Перестроить план, если данные о сменах изменились"""
+        version = self.repository.version
+        if version == self._version:
+            return
+        self._heap = self.plan(self.repository.get_records(), now)
+        self._version = version
+        next_reminder = self._heap[0] if self._heap else None
+        logger.info(
+            f"⏰ План напоминаний: {len(self._heap)}"
+            + (f", ближайшее {next_reminder.fire_at:%d.%m %H:%M} ({next_reminder.kind})" if next_reminder else "")
+        )
+
+    def next_reminder(self) -> Optional[Reminder]:
+        self._ensure_current(datetime.now())
+        return self._heap[0] if self._heap else None
+
+    async def fire_due(self, now: Optional[datetime] = None) -> int:
+        """Отправить наступившие напоминания; сколько рассылок запущено"""
+        now = now or datetime.now()
+        self._ensure_current(now)
+        started = 0
+        while self._heap and self._heap[0].fire_at <= now:
+            reminder = heapq.heappop(self._heap)
+            if self._send(reminder):
+                started += 1
+        return started
+
+    def _send(self, reminder: Reminder) -> bool:
+        if broadcast_engine.is_finished(reminder.key):
+            logger.debug(f"⏭️ Напоминание {reminder.key} уже отправлено")
+            return False
+        subscribers = subscription_store.get_subscribers(APPLICATION_REMINDERS)
+        if not subscribers:
+            logger.info(f"⏰ Напоминание {reminder.key}: подписчиков нет")
+            return False
+        if broadcast_engine.bot is None:
+            logger.warning(f"⚠️ Напоминание {reminder.key} не отправлено: бот не установлен")
+            return False
+        broadcast_engine.start(reminder.key, reminder.message(), sorted(subscribers))
+        self._sent += 1
+        return True
+
+    def reschedule(self) -> None:
+        """Данные о сменах изменились - перестроить план и пересчитать сон"""
+        self._version = None
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _loop(self) -> None:
+        while True:
+            self._wake.clear()
+            try:
+                await self.fire_due()
+            except Exception as e:
+                logger.error(f"❌ Ошибка отправки напоминаний: {e}")
+
+            next_reminder = self._heap[0] if self._heap else None
+            delay = MAX_SLEEP
+            if next_reminder is not None:
+                delay = min(MAX_SLEEP, max(0.0, (next_reminder.fire_at - datetime.now()).total_seconds()))
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self) -> None:
+        """Запустить фоновую задачу напоминаний"""
+        if self._task is not None and not self._task.done():
+            return
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._loop(), name="reminders")
+
+    def get_stats(self) -> Dict:
+        next_reminder = self._heap[0] if self._heap else None
+        return {
+            'running': self._task is not None and not self._task.done(),
+            'pending': len(self._heap),
+            'sent': self._sent,
+            'next_at': next_reminder.fire_at.isoformat() if next_reminder else None,
+            'next_key': next_reminder.key if next_reminder else None,
+        }
+
+    async def shutdown(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+
+# Глобальный экземпляр
+reminder_planner = ReminderPlanner(shift_repository, hour=config.reminder_hour)
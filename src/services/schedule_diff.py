@@ -0,0 +1,295 @@
+"""
+Изменения расписания смен по полям
+
+Вместо одного хеша по всему расписанию каждое обновление сравнивается с
+предыдущим посменно, и получаются типизированные события: смена добавлена,
+удалена, изменились даты смены, даты приема заявок или статус. Поля
+сравниваются после нормализации (пробелы, регистр статуса, запись дат вида
+1.02.2026 / 01.02.2026), поэтому косметические правки страницы событий не дают.
+
+Каждое обновление с изменениями получает следующий номер версии. На диске
+(config.notifications_dir):
+- schedule_state.json - последнее расписание и его версия (пишется атомарно);
+- schedule_events.jsonl - журнал событий, по строке JSON на событие.
+
+При первом запуске базой служит прежний schedule_hash.json, если он есть;
+иначе текущее расписание просто запоминается - без событий и рассылки.
+"""
+import json
+import logging
+import os
+import threading
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from src.core.config import config
+from src.services.parsers.shift_repository import parse_date
+
+logger = logging.getLogger(__name__)
+
+STATE_FILE = "schedule_state.json"
+EVENTS_FILE = "schedule_events.jsonl"
+LEGACY_HASH_FILE = "schedule_hash.json"
+
+# Типы событий
+SHIFT_ADDED = "shift_added"
+SHIFT_REMOVED = "shift_removed"
+DATES_CHANGED = "dates_changed"
+APPLICATION_WINDOW_CHANGED = "application_window_changed"
+STATUS_CHANGED = "status_changed"
+
+# Поля смены, которые сохраняются в состоянии
+SHIFT_FIELDS = (
+    'name', 'month_number', 'start_date', 'end_date',
+    'application_start_date', 'application_end_date', 'raw_status',
+)
+
+NOT_SPECIFIED = "не указан"
+
+
+def _normalize_text(value: Optional[str]) -> str:
+    return " ".join((value or "").split())
+
+
+def _normalize_date(value: Optional[str]):
+    """Дата для сравнения: разобранная, а если не разбирается - строка без пробелов"""
+    return parse_date(_normalize_text(value)) or _normalize_text(value)
+
+
+def _period(start: Optional[str], end: Optional[str]) -> Optional[str]:
+    start, end = _normalize_text(start), _normalize_text(end)
+    if not start and not end:
+        return None
+    return f"{start or '?'} – {end or '?'}"
+
+
+@dataclass(frozen=True)
+class ScheduleEvent:
+    """Изменение одной смены в версии расписания"""
+
+    version: int
+    kind: str
+    shift: str
+    month: int
+    old: Optional[str] = None
+    new: Optional[str] = None
+    at: str = ""
+    old_month: Optional[int] = None  # Месяц смены до изменения (если был другим)
+
+    @property
+    def months(self) -> Set[int]:
+        """Месяцы смены до и после изменения - подписки, которых касается событие"""
+        return {month for month in (self.month, self.old_month) if month}
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "ScheduleEvent":
+        return cls(**{key: data.get(key) for key in cls.__dataclass_fields__ if key in data})
+
+    def describe(self) -> str:
+        """Строка события для уведомления"""
+        if self.kind == SHIFT_ADDED:
+            return f"➕ Добавлена смена: {self.shift}" + (f" ({self.new})" if self.new else "")
+        if self.kind == SHIFT_REMOVED:
+            return f"➖ Удалена смена: {self.shift}"
+        if self.kind == DATES_CHANGED:
+            return f"🗓️ {self.shift}: даты смены {self.old or NOT_SPECIFIED} → {self.new or NOT_SPECIFIED}"
+        if self.kind == APPLICATION_WINDOW_CHANGED:
+            return f"📅 {self.shift}: прием заявок {self.old or NOT_SPECIFIED} → {self.new or NOT_SPECIFIED}"
+        if self.kind == STATUS_CHANGED:
+            return f"📊 {self.shift}: статус «{self.old or NOT_SPECIFIED}» → «{self.new or NOT_SPECIFIED}»"
+        return f"❓ {self.shift}: {self.kind}"
+
+
+def _shift_key(shift: Dict) -> str:
+    return _normalize_text(shift.get('name'))
+
+
+def diff_shifts(old_shifts: Dict[str, Dict], new_shifts: Iterable[Dict],
+                version: int = 0, at: str = "") -> List[ScheduleEvent]:
+    """
+    События перехода от old_shifts (по названию смены) к new_shifts
+
+    Порядок событий: по порядку смен в new_shifts, удаленные смены - в конце.
+    """
+    old_by_key = {_shift_key(shift): shift for shift in old_shifts.values()}
+    events: List[ScheduleEvent] = []
+    seen = set()
+
+    def event(kind, shift, old=None, new=None, previous=None):
+        month = int(shift.get('month_number') or 0)
+        old_month = int(previous.get('month_number') or 0) if previous is not None else 0
+        events.append(ScheduleEvent(
+            version=version,
+            kind=kind,
+            shift=_shift_key(shift),
+            month=month,
+            old=old,
+            new=new,
+            at=at,
+            old_month=old_month if old_month and old_month != month else None,
+        ))
+
+    for shift in new_shifts:
+        key = _shift_key(shift)
+        if not key or key in seen:
+            continue
+        seen.add(key)
+
+        old = old_by_key.get(key)
+        if old is None:
+            event(SHIFT_ADDED, shift, new=_period(shift.get('start_date'), shift.get('end_date')))
+            continue
+
+        if (_normalize_date(old.get('start_date')) != _normalize_date(shift.get('start_date'))
+                or _normalize_date(old.get('end_date')) != _normalize_date(shift.get('end_date'))):
+            event(DATES_CHANGED, shift,
+                  old=_period(old.get('start_date'), old.get('end_date')),
+                  new=_period(shift.get('start_date'), shift.get('end_date')),
+                  previous=old)
+
+        if (_normalize_date(old.get('application_start_date')) != _normalize_date(shift.get('application_start_date'))
+                or _normalize_date(old.get('application_end_date')) != _normalize_date(shift.get('application_end_date'))):
+            event(APPLICATION_WINDOW_CHANGED, shift,
+                  old=_period(old.get('application_start_date'), old.get('application_end_date')),
+                  new=_period(shift.get('application_start_date'), shift.get('application_end_date')),
+                  previous=old)
+
+        if _normalize_text(old.get('raw_status')).lower() != _normalize_text(shift.get('raw_status')).lower():
+            event(STATUS_CHANGED, shift,
+                  old=_normalize_text(old.get('raw_status')) or None,
+                  new=_normalize_text(shift.get('raw_status')) or None,
+                  previous=old)
+
+    for key, old in old_by_key.items():
+        if key and key not in seen:
+            event(SHIFT_REMOVED, old)
+
+    return events
+
+
+class ScheduleEventLog:
+    """Последнее расписание, его версия и журнал событий изменений"""
+
+    def __init__(self, directory: Path, legacy_path: Optional[Path] = None):
+        self.directory = Path(directory)
+        self.state_path = self.directory / STATE_FILE
+        self.events_path = self.directory / EVENTS_FILE
+        self.legacy_path = Path(legacy_path) if legacy_path else None
+        self._lock = threading.Lock()
+        self._state: Optional[Dict] = None
+
+    def _load_state(self) -> Dict:
+        if self._state is not None:
+            return self._state
+
+        state = None
+        if self.state_path.exists():
+            try:
+                state = json.loads(self.state_path.read_text(encoding='utf-8'))
+            except Exception as e:
+                logger.error(f"❌ Ошибка чтения состояния расписания: {e}")
+        if state is None and self.legacy_path is not None and self.legacy_path.exists():
+            try:
+                legacy = json.loads(self.legacy_path.read_text(encoding='utf-8'))
+                if legacy.get('shifts'):
+                    state = {'version': 0, 'updated_at': legacy.get('timestamp'), 'shifts': legacy['shifts']}
+                    logger.info(f"📦 Базовое расписание взято из {self.legacy_path}")
+            except Exception as e:
+                logger.error(f"❌ Ошибка чтения {self.legacy_path}: {e}")
+
+        self._state = state or {'version': 0, 'updated_at': None, 'shifts': None}
+        return self._state
+
+    @property
+    def version(self) -> int:
+        with self._lock:
+            return self._load_state()['version']
+
+    def _write_state(self, state: Dict) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.state_path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.state_path)
+
+    def _append_events(self, events: List[ScheduleEvent]) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self.events_path, 'a', encoding='utf-8') as f:
+            for event in events:
+                f.write(json.dumps(event.to_dict(), ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def record(self, shifts: List[Dict]) -> Tuple[int, List[ScheduleEvent]]:
+        """
+        Сравнить новое расписание с последним и сохранить события
+
+        Возвращает (версия, события). Если существенных изменений нет,
+        версия не меняется и список событий пуст.
+        """
+        with self._lock:
+            state = self._load_state()
+            snapshot = {
+                _shift_key(shift): {field: shift.get(field) for field in SHIFT_FIELDS}
+                for shift in shifts
+                if _shift_key(shift)
+            }
+            now = datetime.now().isoformat(timespec='seconds')
+
+            if state['shifts'] is None:
+                # Первый запуск: запоминаем базу без событий
+                new_state = {'version': state['version'], 'updated_at': now, 'shifts': snapshot}
+                self._write_state(new_state)
+                self._state = new_state
+                logger.info(f"📋 Базовое расписание сохранено: {len(snapshot)} смен")
+                return state['version'], []
+
+            version = state['version'] + 1
+            events = diff_shifts(state['shifts'], shifts, version=version, at=now)
+            if not events:
+                return state['version'], []
+
+            # Сначала события, потом состояние: при сбое между ними то же
+            # обновление будет записано повторно с той же версией
+            self._append_events(events)
+            new_state = {'version': version, 'updated_at': now, 'shifts': snapshot}
+            self._write_state(new_state)
+            self._state = new_state
+
+            logger.info(f"📋 Расписание: версия {version}, событий {len(events)}")
+            return version, events
+
+    def events_since(self, version: int = 0) -> List[ScheduleEvent]:
+        """События версий новее version (повторная запись версии заменяет прежнюю)"""
+        if not self.events_path.exists():
+            return []
+        batches: Dict[int, List[ScheduleEvent]] = {}
+        batch = None
+        with open(self.events_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    event = ScheduleEvent.from_dict(json.loads(line))
+                except (ValueError, TypeError) as e:
+                    logger.warning(f"⚠️ Пропущена строка журнала расписания: {e}")
+                    continue
+                if (event.version, event.at) != batch:
+                    batch = (event.version, event.at)
+                    batches[event.version] = []
+                batches[event.version].append(event)
+        return [
+            event
+            for batch_version in sorted(batches)
+            if batch_version > version
+            for event in batches[batch_version]
+        ]
+
+
+# Глобальный экземпляр
+schedule_event_log = ScheduleEventLog(config.notifications_dir, legacy_path=Path.cwd() / LEGACY_HASH_FILE)
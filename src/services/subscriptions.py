@@ -0,0 +1,234 @@
+"""
+Хранилище подписок на уведомления
+
+Подписчики каждого типа уведомлений держатся в памяти множествами:
+проверка подписки и выборка подписчиков не обращаются к диску.
+
+На диске (config.notifications_dir):
+- subscriptions.json - снимок (записывается атомарно через временный файл);
+- subscriptions.log - журнал изменений после снимка, по строке JSON на
+  изменение (дописывается с fsync).
+
+При запуске снимок читается и журнал доигрывается. Когда журнал становится
+длиннее COMPACT_AFTER записей, состояние переписывается в новый снимок, а
+журнал очищается. Запись на диск идёт под отдельной блокировкой: чтение
+подписок не ждёт fsync, а изменения из обработчиков бота выполняются в
+потоке (asyncio.to_thread). Подписки из прежнего notification_subscriptions.json
+(в рабочем каталоге или в notifications_dir) переносятся при первом запуске.
+"""
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set
+
+from src.core.config import config
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FILE = "subscriptions.json"
+LOG_FILE = "subscriptions.log"
+LEGACY_FILE = "notification_subscriptions.json"
+
+# Типы уведомлений
+SCHEDULE_UPDATES = "schedule_updates"
+APPLICATION_REMINDERS = "application_reminders"
+NOTIFICATION_TYPES = (SCHEDULE_UPDATES, APPLICATION_REMINDERS)
+
+# Изменения отдельной смены (по номеру месяца): shift_updates:<месяц>
+SHIFT_UPDATES_PREFIX = "shift_updates:"
+
+# После скольких записей журнала он сворачивается в снимок
+COMPACT_AFTER = 1000
+
+
+def shift_updates_type(month_number: int) -> str:
+    """Тип уведомлений об изменениях смены месяца month_number"""
+    return f"{SHIFT_UPDATES_PREFIX}{month_number}"
+
+
+class SubscriptionStore:
+    """Подписки по типам уведомлений: множества в памяти, журнал и снимок на диске"""
+
+    def __init__(self, directory: Path, legacy_paths: Iterable[Path] = (), compact_after: int = COMPACT_AFTER):
+        self.directory = Path(directory)
+        self.snapshot_path = self.directory / SNAPSHOT_FILE
+        self.log_path = self.directory / LOG_FILE
+        self.legacy_paths = [Path(path) for path in legacy_paths]
+        self.compact_after = compact_after
+        self._lock = threading.RLock()  # Множества в памяти
+        self._io_lock = threading.RLock()  # Журнал и снимок: записи в порядке изменений
+        self._sets: Optional[Dict[str, Set[int]]] = None
+        self._log_entries = 0
+
+    # === ЗАГРУЗКА ===
+
+    def _ensure_loaded(self) -> Dict[str, Set[int]]:
+        if self._sets is not None:
+            return self._sets
+        with self._lock:
+            if self._sets is None:
+                self._load()
+            return self._sets
+
+    def _load(self) -> None:
+        sets: Dict[str, Set[int]] = {notification_type: set() for notification_type in NOTIFICATION_TYPES}
+
+        if self.snapshot_path.exists():
+            try:
+                snapshot = json.loads(self.snapshot_path.read_text(encoding='utf-8'))
+                for notification_type, user_ids in snapshot.items():
+                    sets.setdefault(notification_type, set()).update(int(user_id) for user_id in user_ids)
+            except Exception as e:
+                logger.error(f"❌ Ошибка чтения снимка подписок: {e}")
+        self._sets = sets
+
+        if not self.snapshot_path.exists() and not self.log_path.exists():
+            self._migrate_legacy(sets)
+        else:
+            self._log_entries = self._replay_log(sets)
+
+        logger.info(
+            "🔔 Подписки загружены: "
+            + ", ".join(f"{notification_type} - {len(users)}" for notification_type, users in sets.items())
+        )
+
+    def _replay_log(self, sets: Dict[str, Set[int]]) -> int:
+        """Доиграть журнал изменений поверх снимка"""
+        if not self.log_path.exists():
+            return 0
+        entries = skipped = 0
+        with open(self.log_path, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                try:
+                    entry = json.loads(line)
+                    users = sets.setdefault(entry['type'], set())
+                    if entry['op'] == '+':
+                        users.add(int(entry['user']))
+                    else:
+                        users.discard(int(entry['user']))
+                    entries += 1
+                except (ValueError, KeyError) as e:
+                    # Оборванная последняя строка после сбоя - пропускаем
+                    logger.warning(f"⚠️ Пропущена строка {line_number} журнала подписок: {e}")
+                    skipped += 1
+        if skipped:
+            # Следующая запись не должна приклеиться к оборванной строке
+            self._compact()
+            return 0
+        return entries
+
+    def _migrate_legacy(self, sets: Dict[str, Set[int]]) -> None:
+        """Перенести подписки из прежнего JSON-файла"""
+        migrated = []
+        for path in self.legacy_paths:
+            if not path.exists():
+                continue
+            try:
+                legacy = json.loads(path.read_text(encoding='utf-8'))
+                for notification_type, user_ids in legacy.items():
+                    sets.setdefault(notification_type, set()).update(int(user_id) for user_id in user_ids)
+                migrated.append(str(path))
+            except Exception as e:
+                logger.error(f"❌ Ошибка чтения прежнего файла подписок {path}: {e}")
+        if migrated:
+            self._compact()
+            logger.info(f"📦 Подписки перенесены из {', '.join(migrated)} в {self.snapshot_path}")
+
+    # === ЗАПИСЬ ===
+
+    def _append(self, op: str, notification_type: str, user_id: int) -> None:
+        """Дописать изменение в журнал (и свернуть журнал, если он длинный)"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        line = json.dumps({'op': op, 'type': notification_type, 'user': user_id}) + "\n"
+        with open(self.log_path, 'a', encoding='utf-8') as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        self._log_entries += 1
+        if self._log_entries >= self.compact_after:
+            self._compact()
+
+    def _compact(self) -> None:
+        """Записать снимок текущего состояния и очистить журнал"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            snapshot = {notification_type: sorted(users) for notification_type, users in self._sets.items()}
+        tmp_path = self.snapshot_path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        # Журнал очищается после снимка: при сбое между ними повторное
+        # применение журнала к новому снимку даёт то же состояние
+        if self.log_path.exists():
+            self.log_path.unlink()
+        self._log_entries = 0
+        logger.debug(f"💾 Снимок подписок записан: {self.snapshot_path}")
+
+    def add(self, notification_type: str, user_id: int) -> bool:
+        """Подписать пользователя (False, если уже подписан)"""
+        with self._io_lock:
+            with self._lock:
+                users = self._ensure_loaded().setdefault(notification_type, set())
+                if user_id in users:
+                    return False
+                users.add(user_id)
+            self._append('+', notification_type, user_id)
+            return True
+
+    def remove(self, notification_type: str, user_id: int) -> bool:
+        """Отписать пользователя (False, если не был подписан)"""
+        with self._io_lock:
+            with self._lock:
+                users = self._ensure_loaded().get(notification_type)
+                if not users or user_id not in users:
+                    return False
+                users.discard(user_id)
+            self._append('-', notification_type, user_id)
+            return True
+
+    def remove_user(self, user_id: int) -> List[str]:
+        """Отписать пользователя от всех уведомлений; типы, от которых отписан"""
+        with self._io_lock:
+            return [
+                notification_type
+                for notification_type in list(self._ensure_loaded())
+                if self.remove(notification_type, user_id)
+            ]
+
+    # === ЧТЕНИЕ ===
+
+    def contains(self, notification_type: str, user_id: int) -> bool:
+        return user_id in self._ensure_loaded().get(notification_type, ())
+
+    def get_subscribers(self, notification_type: str) -> FrozenSet[int]:
+        """Подписчики типа уведомлений (неизменяемая копия)"""
+        with self._lock:
+            return frozenset(self._ensure_loaded().get(notification_type, ()))
+
+    def get_user_types(self, user_id: int) -> Dict[str, bool]:
+        """Подписки пользователя по всем типам"""
+        sets = self._ensure_loaded()
+        return {notification_type: user_id in users for notification_type, users in sets.items()}
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = {notification_type: len(users) for notification_type, users in self._ensure_loaded().items()}
+            stats['log_entries'] = self._log_entries
+            return stats
+
+    def close(self) -> None:
+        """Свернуть журнал в снимок (при остановке бота)"""
+        with self._io_lock:
+            if self._sets is not None and self._log_entries:
+                self._compact()
+
+
+# Глобальный экземпляр
+subscription_store = SubscriptionStore(
+    config.notifications_dir,
+    legacy_paths=[Path.cwd() / LEGACY_FILE, config.notifications_dir / LEGACY_FILE],
+)